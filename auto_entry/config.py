@@ -16,8 +16,8 @@ printc("[green][+] CSV data loaded successfully![/green]")
 def fuel_data_entry(fuel_data, cursor):
     for index, row in fuel_data.iterrows():
         insert_fuel_query = sql.SQL("""
-            INSERT INTO calculator_fuelprice (opis_truckstop_id, truckstop_name, address, city, state, rack_id, retail_price)
-            VALUES ({}, {}, {}, {}, {}, {}, {})
+            INSERT INTO calculator_fuelprice (opis_truckstop_id, truckstop_name, address, city, state, rack_id, retail_price, geohash)
+            VALUES ({}, {}, {}, {}, {}, {}, {}, '')
         """).format(
             sql.Literal(int(row['OPIS Truckstop ID'])),
             sql.Literal(row['Truckstop Name']),
@@ -30,6 +30,14 @@ def fuel_data_entry(fuel_data, cursor):
         cursor.execute(insert_fuel_query)
         printc(f"[cyan][+] Inserted row {index + 1}: {row['Truckstop Name']}[/cyan]")
 
+# Bump the dataset version so running API workers reload their station index
+def bump_dataset_version(cursor):
+    cursor.execute("""
+        INSERT INTO calculator_datasetversion (name, version, updated_at) VALUES ('fuel_prices', 1, now())
+        ON CONFLICT (name) DO UPDATE SET version = calculator_datasetversion.version + 1, updated_at = now()
+    """)
+    cursor.execute("SELECT pg_notify('calculator_dataset', 'fuel_prices')")
+
 def config():
     # Create a cursor object
     db = dbConfig()
@@ -41,6 +49,7 @@ def config():
         printc("[green][+] Fuel data insertion started. [/green]")
         fuel_data_entry(fuel_data, cursor)
         printc("[green][+] Fuel data insertion completed. [/green]")
+        bump_dataset_version(cursor)
 
     except Exception as e:
         printc("[red][!] An error occurred while trying to insert data into the database.[/red]")
@@ -2,3 +2,9 @@ from django.contrib import admin
 from .models import *
 
 admin.site.register(FuelPrice)
+admin.site.register(ImportCheckpoint)
+admin.site.register(PlanJob)
+admin.site.register(DatasetVersion)
+admin.site.register(PriceTile)
+admin.site.register(StationPrice)
+admin.site.register(Trip)
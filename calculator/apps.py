@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CalculatorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'calculator'
+
+    def ready(self):
+        # Register the snapshot invalidation, price tile and retail price
+        # signal handlers.
+        from . import prices, snapshot, tiles  # noqa: F401
@@ -0,0 +1,147 @@
+import csv
+import re
+
+from django.conf import settings
+
+# GeoNames "cities" dump column positions (tab separated, no header).
+GEONAMES_NAME = 1
+GEONAMES_ASCII_NAME = 2
+GEONAMES_LATITUDE = 4
+GEONAMES_LONGITUDE = 5
+GEONAMES_COUNTRY = 8
+GEONAMES_ADMIN1 = 10
+GEONAMES_POPULATION = 14
+
+ABBREVIATIONS = {"st": "saint", "ste": "sainte", "ft": "fort", "mt": "mount", "pt": "point"}
+
+re_highway = re.compile(r"\b(I|US|SR|ST|HWY)[- ]*(\d+)", re.IGNORECASE)
+re_exit = re.compile(r"\bEXIT\s*#?\s*(\d+)\s*-?\s*([A-Z]?)\b", re.IGNORECASE)
+
+_gazetteer = None
+
+
+def normalize_place(name):
+    """Lower-case, punctuation-free place name with common abbreviations expanded."""
+    words = re.sub(r"[^a-z0-9 ]+", " ", str(name).lower()).split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def parse_exit_reference(address):
+    """
+    Extract `(highway, exit)` from an OPIS address such as
+    "I-75, EXIT 144-B & US-41", or None when it has no exit reference.
+    """
+    highway = re_highway.search(address or "")
+    exit_match = re_exit.search(address or "")
+    if not highway or not exit_match:
+        return None
+    return f"{highway.group(1).upper()}-{highway.group(2)}", (exit_match.group(1) + exit_match.group(2)).upper()
+
+
+class Gazetteer:
+    """
+    Offline geocoder backed by in-memory indexes: a hash of interstate exits,
+    a hash of (place, state) centroids and a per-state trie of place names
+    for prefix matches on truncated names.
+    """
+
+    def __init__(self):
+        self.exits = {}
+        self.places = {}
+        self._populations = {}
+        self._tries = {}
+
+    def __len__(self):
+        return len(self.places) + len(self.exits)
+
+    def add_place(self, name, state, lat, lng, population=0):
+        key = (normalize_place(name), state.upper())
+        if population < self._populations.get(key, -1):
+            return
+        self.places[key] = (lat, lng)
+        self._populations[key] = population
+
+        node = self._tries.setdefault(key[1], {})
+        for char in key[0]:
+            node = node.setdefault(char, {})
+        node[""] = key
+
+    def add_exit(self, highway, exit_number, state, lat, lng):
+        self.exits[(highway.upper(), str(exit_number).upper(), state.upper())] = (lat, lng)
+
+    def load_geonames(self, path, country="US"):
+        """Load a GeoNames cities file (e.g. cities500.txt)."""
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) <= GEONAMES_POPULATION or columns[GEONAMES_COUNTRY] != country:
+                    continue
+                lat, lng = float(columns[GEONAMES_LATITUDE]), float(columns[GEONAMES_LONGITUDE])
+                population = int(columns[GEONAMES_POPULATION] or 0)
+                state = columns[GEONAMES_ADMIN1]
+                self.add_place(columns[GEONAMES_NAME], state, lat, lng, population)
+                if columns[GEONAMES_ASCII_NAME] != columns[GEONAMES_NAME]:
+                    self.add_place(columns[GEONAMES_ASCII_NAME], state, lat, lng, population)
+
+    def load_exits(self, path):
+        """Load a CSV of interstate exits with highway, exit, state, latitude, longitude columns."""
+        with open(path, newline="", encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                self.add_exit(row["highway"], row["exit"], row["state"], float(row["latitude"]), float(row["longitude"]))
+
+    def _prefix_match(self, name, state):
+        node = self._tries.get(state)
+        for char in name:
+            if node is None:
+                return None
+            node = node.get(char)
+        if node is None:
+            return None
+
+        # Accept the prefix only when it identifies a single place.
+        found = []
+        stack = [node]
+        while stack and len(found) < 2:
+            current = stack.pop()
+            for char, child in current.items():
+                if char == "":
+                    found.append(child)
+                else:
+                    stack.append(child)
+        return self.places[found[0]] if len(found) == 1 else None
+
+    def resolve(self, address, city, state):
+        """
+        Coordinates for a station: its interstate exit when known, otherwise
+        its city. Returns (None, None) when nothing matches.
+        """
+        state = str(state).strip().upper()
+        reference = parse_exit_reference(address)
+        if reference is not None:
+            location = self.exits.get((reference[0], reference[1], state))
+            if location is not None:
+                return location
+
+        name = normalize_place(city)
+        location = self.places.get((name, state)) or self._prefix_match(name, state)
+        return location if location is not None else (None, None)
+
+
+def get_gazetteer():
+    """
+    The process-wide gazetteer built from GAZETTEER_CITIES_PATH and
+    GAZETTEER_EXITS_PATH, or None when neither is configured.
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        cities_path = getattr(settings, "GAZETTEER_CITIES_PATH", None)
+        exits_path = getattr(settings, "GAZETTEER_EXITS_PATH", None)
+        if not cities_path and not exits_path:
+            return None
+        gazetteer = Gazetteer()
+        if cities_path:
+            gazetteer.load_geonames(cities_path)
+        if exits_path:
+            gazetteer.load_exits(exits_path)
+        _gazetteer = gazetteer
+    return _gazetteer
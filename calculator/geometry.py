@@ -0,0 +1,168 @@
+import math
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_MILE = 1609.34
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def decode_polyline(points):
+    """Decode a Google encoded polyline into a list of (lat, lng) tuples."""
+    coordinates = []
+    index = lat = lng = 0
+    length = len(points)
+    while index < length:
+        for axis in (0, 1):
+            shift = result = 0
+            while True:
+                byte = ord(points[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if axis == 0:
+                lat += delta
+            else:
+                lng += delta
+        coordinates.append((lat / 1e5, lng / 1e5))
+    return coordinates
+
+
+def _encode_value(value, chunks):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def encode_polyline(coordinates):
+    """Encode (lat, lng) pairs as a Google encoded polyline."""
+    chunks = []
+    prev_lat = prev_lng = 0
+    for lat, lng in coordinates:
+        lat, lng = int(round(lat * 1e5)), int(round(lng * 1e5))
+        _encode_value(lat - prev_lat, chunks)
+        _encode_value(lng - prev_lng, chunks)
+        prev_lat, prev_lng = lat, lng
+    return "".join(chunks)
+
+
+def project(coordinates):
+    """
+    Equirectangular projection of (lat, lng) pairs to planar meters, accurate
+    enough for corridor-scale distances.
+    """
+    if not coordinates:
+        return []
+    ref_lat = math.radians(sum(lat for lat, _ in coordinates) / len(coordinates))
+    x_scale = math.radians(1) * EARTH_RADIUS_M * math.cos(ref_lat)
+    y_scale = math.radians(1) * EARTH_RADIUS_M
+    return [(lng * x_scale, lat * y_scale) for lat, lng in coordinates]
+
+
+def simplify(coordinates, tolerance_m):
+    """
+    Douglas-Peucker simplification keeping every point that deviates more
+    than `tolerance_m` meters from the simplified line.
+    """
+    if tolerance_m <= 0 or len(coordinates) < 3:
+        return list(coordinates)
+
+    xy = project(coordinates)
+    keep = [False] * len(xy)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xy) - 1)]
+    tolerance_sq = tolerance_m * tolerance_m
+
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xy[first]
+        bx, by = xy[last]
+        dx, dy = bx - ax, by - ay
+        seg_sq = dx * dx + dy * dy
+        max_dist_sq, max_index = -1.0, None
+        for index in range(first + 1, last):
+            px, py = xy[index]
+            if seg_sq == 0:
+                dist_sq = (px - ax) ** 2 + (py - ay) ** 2
+            else:
+                t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / seg_sq))
+                dist_sq = (px - ax - t * dx) ** 2 + (py - ay - t * dy) ** 2
+            if dist_sq > max_dist_sq:
+                max_dist_sq, max_index = dist_sq, index
+        if max_index is not None and max_dist_sq > tolerance_sq:
+            keep[max_index] = True
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+
+    return [point for point, kept in zip(coordinates, keep) if kept]
+
+
+def route_coordinates(route, route_index=0):
+    """Decoded overview polyline of one of the routes in a Directions payload."""
+    return decode_polyline(route["routes"][route_index]["overview_polyline"]["points"])
+
+
+def route_geometry(route, route_index=0):
+    """
+    The full (lat, lng) path of one of the routes in a Directions payload.
+
+    Step polylines are decoded when the steps carry them, with the start and
+    end of any step that does not; otherwise the overview polyline is used,
+    and failing that the step end points.
+    """
+    legs = route["routes"][route_index]["legs"]
+    steps = [step for leg in legs for step in leg["steps"]]
+    coordinates = []
+
+    def extend(points):
+        for point in points:
+            if not coordinates or coordinates[-1] != point:
+                coordinates.append(point)
+
+    if any("polyline" in step for step in steps):
+        for step in steps:
+            if "polyline" in step:
+                extend(decode_polyline(step["polyline"]["points"]))
+            else:
+                extend((location["lat"], location["lng"]) for location in (step["start_location"], step["end_location"]))
+        return coordinates
+
+    overview = route["routes"][route_index].get("overview_polyline", {}).get("points")
+    if overview:
+        extend(decode_polyline(overview))
+        if len(coordinates) >= 2:
+            return coordinates
+        coordinates.clear()
+
+    for step in steps:
+        if not coordinates and "start_location" in step:
+            extend([(step["start_location"]["lat"], step["start_location"]["lng"])])
+        extend([(step["end_location"]["lat"], step["end_location"]["lng"])])
+    return coordinates
+
+
+def encode_geohash(lat, lng, precision):
+    """Geohash of (lat, lng) with `precision` characters."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return "".join(chars)
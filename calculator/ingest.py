@@ -0,0 +1,248 @@
+import csv
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+import requests
+from django.conf import settings
+from django.db import transaction
+
+from .gazetteer import get_gazetteer
+from .models import FuelPrice, ImportCheckpoint, StationPrice
+from .prices import MAX_STATION_PRICE, PRODUCTS, PROGRAM_MAX_LENGTH, upsert_station_prices
+from .ratelimit import acquire_upstream
+from .replay import upstream_get
+from .resilience import UpstreamUnavailable, get_breaker, upstream_timeout
+from .snapshot import bump_dataset_version
+from .tiles import refresh_price_tiles, station_geohash
+from .utils import GOOGLE_MAPS_API_KEY
+
+def get_lat_lng(city, state):
+    """
+    Fetch latitude and longitude from the Google Maps Geocoding API using city and state.
+    """
+    url = "https://maps.googleapis.com/maps/api/geocode/json"
+    params = {
+        "address": f"{city}, {state}",
+        "key": GOOGLE_MAPS_API_KEY,
+    }
+    acquire_upstream("geocoding", timeout=None)  # imports wait for budget
+    timeout = upstream_timeout()
+    with get_breaker("geocoding").guard(requests.exceptions.RequestException):
+        response = upstream_get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+    results = response.json().get("results", [])
+    if results:
+        location = results[0]["geometry"]["location"]
+        return location["lat"], location["lng"]
+    return None, None
+
+def _geocode_row(row, gazetteer):
+    if gazetteer is not None:
+        return gazetteer.resolve(row["Address"], row["City"], row["State"])
+    return get_lat_lng(row["City"], row["State"])
+
+def _file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _import_batch(batch, offset, existing, seen_ids, incremental, gazetteer, executor):
+    """
+    Build the new and updated FuelPrice rows for one CSV batch starting at
+    row `offset`. Returns them with the offset to resume from and whether a
+    critical geocoding error stopped the batch early.
+    """
+    new_entries = []
+    updated_entries = []
+    pending = []
+
+    for position, (_, row) in enumerate(batch.iterrows(), start=offset):
+        opis_truckstop_id = int(row["OPIS Truckstop ID"])
+        if opis_truckstop_id in seen_ids:
+            continue
+        seen_ids.add(opis_truckstop_id)
+
+        if opis_truckstop_id in existing:
+            if not incremental:
+                updated_entries.append(FuelPrice(
+                    id=existing[opis_truckstop_id],
+                    retail_price=row["Retail Price"],
+                    rack_id=row["Rack ID"],
+                ))
+            continue
+        pending.append((position, row))
+
+    # One future per row, so a failed lookup only affects its own row.
+    futures = [executor.submit(_geocode_row, row, gazetteer) for _, row in pending]
+    for (position, row), future in zip(pending, futures):
+        city = row["City"]
+        state = row["State"]
+
+        try:
+            # Attempt to fetch latitude and longitude
+            lat, lng = future.result()
+            if lat is None or lng is None:
+                print(f"Skipping entry for {city}, {state} due to missing coordinates.")
+                continue  # Skip entries with null lat/lng
+
+            # Add valid entry to the list
+            new_entries.append(FuelPrice(
+                opis_truckstop_id=int(row["OPIS Truckstop ID"]),
+                truckstop_name=row["Truckstop Name"],
+                address=row["Address"],
+                city=city,
+                state=state,
+                rack_id=row["Rack ID"],
+                retail_price=row["Retail Price"],
+                latitude=lat,
+                longitude=lng,
+                geohash=station_geohash(lat, lng),
+            ))
+
+        except (requests.exceptions.RequestException, UpstreamUnavailable) as e:
+            print(f"Error fetching lat/lng for {city}, {state}: {e}")
+            for later in futures:
+                later.cancel()
+            return new_entries, updated_entries, position, True  # Resume from this row
+
+        except Exception as generic_error:
+            print(f"Unexpected error for {city}, {state}: {generic_error}")
+            continue  # Skip problematic entries and continue processing
+
+    return new_entries, updated_entries, offset + len(batch), False
+
+def load_fuel_data(file_path=None, incremental=True, workers=1, progress=None, batch_size=500, resume=True):
+    """
+    Import the OPIS fuel price CSV.
+
+    Incremental imports only add stations that are not in the database yet;
+    otherwise prices of existing stations are updated as well. Coordinates
+    of new stations are resolved with `workers` parallel geocoding calls.
+
+    Rows are committed in batches of `batch_size` together with an
+    ImportCheckpoint (file hash + next row), so an interrupted import of the
+    same file resumes where it stopped unless `resume` is False.
+    `progress(done, total)` is called after every batch.
+    """
+    import pandas as pd  # only needed offline; keep it out of web workers
+
+    file_path = file_path or settings.FUEL_PRICES_CSV
+    file_hash = _file_sha256(file_path)
+    checkpoint = ImportCheckpoint.objects.filter(file_hash=file_hash).first() if resume else None
+    offset = checkpoint.offset if checkpoint else 0
+    if offset:
+        print(f"Resuming import of {file_path} from row {offset}.")
+
+    fuel_data = pd.read_csv(file_path)
+    total = len(fuel_data)
+
+    # Fetch existing IDs to minimize database queries
+    existing = dict(FuelPrice.objects.values_list("opis_truckstop_id", "id"))
+
+    # Resolve coordinates offline when a gazetteer is configured.
+    gazetteer = get_gazetteer()
+    seen_ids = set()
+    created = updated = 0
+    stopped = False
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while offset < total and not stopped:
+            batch = fuel_data.iloc[offset:offset + batch_size]
+            new_entries, updated_entries, next_offset, stopped = _import_batch(
+                batch, offset, existing, seen_ids, incremental, gazetteer, executor,
+            )
+
+            # Save the batch and its checkpoint atomically
+            try:
+                with transaction.atomic():
+                    FuelPrice.objects.bulk_create(new_entries, ignore_conflicts=True)
+                    FuelPrice.objects.bulk_update(updated_entries, ["retail_price", "rack_id"], batch_size=1000)
+                    # Re-aggregate the price tiles of the cells this batch touched
+                    touched = [entry.geohash for entry in new_entries]
+                    touched += FuelPrice.objects.filter(
+                        id__in=[entry.id for entry in updated_entries],
+                    ).values_list("geohash", flat=True)
+                    refresh_price_tiles(touched)
+                    # Mirror the posted prices into the per-product price table
+                    retail = [(entry.id, entry.retail_price) for entry in updated_entries]
+                    retail += FuelPrice.objects.filter(
+                        opis_truckstop_id__in=[entry.opis_truckstop_id for entry in new_entries],
+                    ).values_list("id", "retail_price")
+                    upsert_station_prices(
+                        (station_id, StationPrice.DIESEL, StationPrice.RETAIL, price) for station_id, price in retail
+                    )
+                    ImportCheckpoint.objects.update_or_create(
+                        file_hash=file_hash, defaults={"file_path": str(file_path), "offset": next_offset},
+                    )
+            except Exception as save_error:
+                print(f"Error saving entries from row {offset}: {save_error}")
+                stopped = True
+                break
+
+            created += len(new_entries)
+            updated += len(updated_entries)
+            offset = next_offset
+            if progress is not None:
+                progress(offset, total)
+
+    if created or updated:
+        bump_dataset_version()
+        print(f"{created} new and {updated} updated fuel entries successfully saved.")
+
+    if stopped:
+        print(f"Fuel data import stopped at row {offset}; run it again to resume.")
+    else:
+        ImportCheckpoint.objects.filter(file_hash=file_hash).delete()
+        print("Fuel data processing completed!")
+    return created, updated
+
+def load_station_prices(file_path):
+    """
+    Import per-product and fleet-card prices from a CSV with "OPIS Truckstop
+    ID", "Product", "Program" (blank for retail) and "Price" columns.
+
+    Rows of stations that are not imported yet, of unknown products or with
+    a malformed station ID, program or price are skipped. Returns (created,
+    updated, skipped).
+    """
+    stations = dict(FuelPrice.objects.values_list("opis_truckstop_id", "id"))
+    rows = []
+    skipped = 0
+    with open(file_path, newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            try:
+                station_id = stations.get(int(row["OPIS Truckstop ID"]))
+                price = Decimal(row["Price"].strip())
+            except (ValueError, InvalidOperation):
+                skipped += 1
+                continue
+            product = row["Product"].strip().lower()
+            program = (row.get("Program") or "").strip().lower()
+            if (
+                station_id is None or product not in PRODUCTS or len(program) > PROGRAM_MAX_LENGTH
+                or not price.is_finite() or not 0 <= price < MAX_STATION_PRICE
+            ):
+                skipped += 1
+                continue
+            rows.append((station_id, product, program, price))
+
+    with transaction.atomic():
+        created, updated = upsert_station_prices(rows)
+        # Keep FuelPrice.retail_price, the posted diesel price, in step
+        retail = [
+            FuelPrice(id=station_id, retail_price=price)
+            for station_id, product, program, price in rows
+            if product == StationPrice.DIESEL and program == StationPrice.RETAIL
+        ]
+        FuelPrice.objects.bulk_update(retail, ["retail_price"], batch_size=1000)
+        # bulk_update sends no signals, so refresh the tiles of the repriced stations here.
+        refresh_price_tiles(
+            FuelPrice.objects.filter(id__in=[station.id for station in retail]).values_list("geohash", flat=True)
+        )
+        if created or updated:
+            bump_dataset_version()
+    print(f"{created} new and {updated} updated station prices saved, {skipped} rows skipped.")
+    return created, updated, skipped
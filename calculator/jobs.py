@@ -0,0 +1,140 @@
+import contextvars
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PlanJob, PlanJobResult
+from .parallel import planning_processes
+from .responses import parse_route_request, route_response_body
+from .snapshot import get_station_snapshot
+
+# A running job whose worker has not reported progress for this long is
+# considered abandoned and handed to another worker.
+STALE_JOB_TIMEOUT = timedelta(minutes=5)
+# How often a worker reports that it is still running its job, however
+# long its lanes take.
+HEARTBEAT_INTERVAL = STALE_JOB_TIMEOUT / 5
+
+DEFAULT_MAX_PLAN_JOB_LANES = 1000
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def submit_plan_job(lanes):
+    """
+    Queue a batch of route-fuel-stops request bodies. Every lane is
+    validated up front; ValueError names the first invalid one. A job holds
+    at most MAX_PLAN_JOB_LANES lanes.
+    """
+    max_lanes = getattr(settings, "MAX_PLAN_JOB_LANES", DEFAULT_MAX_PLAN_JOB_LANES)
+    if len(lanes) > max_lanes:
+        raise ValueError(f"A job may contain at most {max_lanes} lanes.")
+    for position, lane in enumerate(lanes):
+        try:
+            parse_route_request(lane)
+        except ValueError as e:
+            raise ValueError(f"Lane {position}: {e}")
+    return PlanJob.objects.create(lanes=lanes, total=len(lanes))
+
+
+def claim_next_job(worker=None):
+    """
+    Atomically claim the oldest running job abandoned by a crashed worker,
+    or else the oldest pending job. Returns None when the queue is empty.
+    """
+    stale_before = timezone.now() - STALE_JOB_TIMEOUT
+    jobs = PlanJob.objects.select_for_update(skip_locked=True).order_by("created_at")
+    with transaction.atomic():
+        # One (status, created_at) index lookup per state: OR-ing the states
+        # makes the planner scan the mostly finished queue instead.
+        job = (
+            jobs.filter(status=PlanJob.RUNNING, heartbeat_at__lt=stale_before).first()
+            or jobs.filter(status=PlanJob.PENDING).first()
+        )
+        if job is None:
+            return None
+        job.status = PlanJob.RUNNING
+        job.worker = worker or worker_name()
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=["status", "worker", "heartbeat_at"])
+    return job
+
+
+def _plan_lane(lane):
+    return json.loads(bytes(route_response_body(parse_route_request(lane))))
+
+
+def _beat(job):
+    PlanJob.objects.filter(pk=job.pk, status=PlanJob.RUNNING).update(heartbeat_at=timezone.now())
+
+
+def _heartbeat(job, stopped):
+    """Report progress on `job` every HEARTBEAT_INTERVAL until `stopped` is set."""
+    try:
+        while not stopped.wait(HEARTBEAT_INTERVAL.total_seconds()):
+            _beat(job)
+    finally:
+        connection.close()
+
+
+def run_plan_job(job, workers=4, processes=None):
+    """
+    Plan every lane of `job` that has no stored result yet, `workers` lanes
+    at a time. Results are committed one by one so a restarted job resumes
+    with the lanes that are still missing; a lane stored meanwhile by
+    another worker that took the job over is left as it is.
+
+    With `processes` (default PLANNING_PROCESSES) the worker threads only
+    fetch routes and the planning itself runs in that many processes.
+    """
+    done = set(job.results.values_list("position", flat=True))
+    pending = [(position, lane) for position, lane in enumerate(job.lanes) if position not in done]
+
+    # Build the station snapshot once here rather than in whichever lane
+    # asks for it first while the others wait.
+    get_station_snapshot()
+
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job, stopped), name="plan-job-heartbeat", daemon=True)
+    heartbeat.start()
+    try:
+        with planning_processes(processes) as processes, \
+                ThreadPoolExecutor(max_workers=max(1, workers, processes)) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, _plan_lane, lane): position
+                for position, lane in pending
+            }
+            for future in as_completed(futures):
+                position = futures[future]
+                try:
+                    result, error = future.result(), ""
+                except Exception as e:
+                    result, error = None, str(e)
+                try:
+                    with transaction.atomic():
+                        PlanJobResult.objects.create(job=job, position=position, result=result, error=error)
+                        PlanJob.objects.filter(pk=job.pk).update(
+                            completed=F("completed") + 1, heartbeat_at=timezone.now(),
+                        )
+                except IntegrityError:
+                    pass  # stored by the other worker
+    except Exception as e:
+        PlanJob.objects.filter(pk=job.pk).update(status=PlanJob.FAILED, error=str(e), finished_at=timezone.now())
+        raise
+    finally:
+        stopped.set()
+        heartbeat.join()
+
+    PlanJob.objects.filter(pk=job.pk).update(status=PlanJob.DONE, finished_at=timezone.now())
+    job.refresh_from_db()
+    return job
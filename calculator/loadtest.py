@@ -0,0 +1,241 @@
+import hashlib
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .geometry import METERS_PER_MILE, encode_polyline
+from .snapshot import MILES_PER_DEGREE_LAT
+
+# Synthetic lanes are placed inside the continental US.
+LATITUDE_RANGE = (30.0, 47.0)
+LONGITUDE_RANGE = (-120.0, -75.0)
+STEP_MILES = 50
+
+
+def address_location(address):
+    """Deterministic pseudo-location of an address."""
+    digest = hashlib.sha1(address.lower().encode("utf-8")).digest()
+    lat_fraction = int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
+    lng_fraction = int.from_bytes(digest[4:8], "big") / 0xFFFFFFFF
+    return (
+        LATITUDE_RANGE[0] + lat_fraction * (LATITUDE_RANGE[1] - LATITUDE_RANGE[0]),
+        LONGITUDE_RANGE[0] + lng_fraction * (LONGITUDE_RANGE[1] - LONGITUDE_RANGE[0]),
+    )
+
+
+def _miles(a, b):
+    d_lat = (b[0] - a[0]) * MILES_PER_DEGREE_LAT
+    d_lng = (b[1] - a[1]) * MILES_PER_DEGREE_LAT * math.cos(math.radians((a[0] + b[0]) / 2))
+    return math.hypot(d_lat, d_lng)
+
+
+def _fake_route(origin, destination, points, summary):
+    steps = []
+    for start, end in zip(points, points[1:]):
+        steps.append({
+            "distance": {"value": int(_miles(start, end) * METERS_PER_MILE)},
+            "start_location": {"lat": start[0], "lng": start[1]},
+            "end_location": {"lat": end[0], "lng": end[1]},
+        })
+    return {
+        "summary": summary,
+        "legs": [{"start_address": origin, "end_address": destination, "steps": steps}],
+        "overview_polyline": {"points": encode_polyline(points)},
+    }
+
+
+def fake_directions(origin, destination, alternatives=False):
+    """
+    Directions API payload for a straight drive between the pseudo-locations
+    of two addresses, in STEP_MILES steps. With `alternatives` a second,
+    longer route through an offset midpoint is included.
+    """
+    start, finish = address_location(origin), address_location(destination)
+
+    def line(a, b):
+        count = max(1, int(_miles(a, b) // STEP_MILES))
+        return [
+            (a[0] + (b[0] - a[0]) * i / count, a[1] + (b[1] - a[1]) * i / count)
+            for i in range(count + 1)
+        ]
+
+    routes = [_fake_route(origin, destination, line(start, finish), "Direct")]
+    if alternatives:
+        middle = ((start[0] + finish[0]) / 2 + 1.0, (start[1] + finish[1]) / 2 + 1.0)
+        routes.append(_fake_route(origin, destination, line(start, middle) + line(middle, finish)[1:], "Scenic"))
+    return {"status": "OK", "routes": routes}
+
+
+class FakeDirectionsServer:
+    """
+    Local stand-in for the Directions API that answers every request with
+    `fake_directions` after `latency` seconds.
+    """
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlsplit(self.path).query)
+                with server._lock:
+                    server.calls += 1
+                time.sleep(server.latency)
+                body = json.dumps(fake_directions(
+                    query.get("origin", [""])[0],
+                    query.get("destination", [""])[0],
+                    query.get("alternatives", ["false"])[0] == "true",
+                )).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/maps/api/directions/json"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-directions", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def lane_mix(lanes, hot_lanes, hot_fraction, seed=None):
+    """
+    Endless stream of lane indexes: `hot_fraction` of them drawn from the
+    first `hot_lanes` lanes, the rest from the whole range.
+    """
+    rng = random.Random(seed)
+    hot_lanes = max(1, min(hot_lanes, lanes))
+    while True:
+        if rng.random() < hot_fraction:
+            yield rng.randrange(hot_lanes)
+        else:
+            yield rng.randrange(lanes)
+
+
+def lane_request(index):
+    return {"start_address": f"Load Origin {index}", "finish_address": f"Load Destination {index}"}
+
+
+def parse_metrics(header):
+    counters = Counter()
+    for item in filter(None, (part.strip() for part in (header or "").split(","))):
+        name, _, value = item.partition("=")
+        counters[name] += int(value)
+    return counters
+
+
+def run_load(base_url, lanes, concurrency=8, requests=1000, path="/api/v1/route-fuel-stops/"):
+    """
+    POST `requests` route-fuel-stops requests for the lanes yielded by
+    `lanes` from `concurrency` threads, each on its own keep-alive
+    connection. Returns `(results, elapsed)`, each result being
+    `(latency_seconds, status, metrics Counter)`.
+    """
+    target = urlsplit(base_url)
+    lanes_lock = threading.Lock()
+    remaining = [requests]
+    results = []
+
+    def next_lane():
+        with lanes_lock:
+            if remaining[0] <= 0:
+                return None
+            remaining[0] -= 1
+            return next(lanes)
+
+    def worker():
+        connection = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+        local = []
+        while True:
+            lane = next_lane()
+            if lane is None:
+                break
+            body = json.dumps(lane_request(lane))
+            started = time.perf_counter()
+            try:
+                connection.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                status, metrics = response.status, parse_metrics(response.getheader("X-Request-Metrics"))
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+                status, metrics = 0, Counter()
+            local.append((time.perf_counter() - started, status, metrics))
+        connection.close()
+        with lanes_lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker, name=f"load-{i}") for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(math.ceil(fraction * len(sorted_values))) - 1)]
+
+
+def _ratio(hits, misses):
+    total = hits + misses
+    return hits / total if total else None
+
+
+def summarize(results, elapsed):
+    """Throughput, latency percentiles and server-side counters of a run."""
+    latencies = sorted(latency for latency, _, _ in results)
+    statuses = Counter(status for _, status, _ in results)
+    counters = Counter()
+    for _, _, metrics in results:
+        counters.update(metrics)
+    requests = len(results)
+    return {
+        "requests": requests,
+        "errors": requests - statuses.get(200, 0),
+        "statuses": dict(statuses),
+        "elapsed": elapsed,
+        "throughput": requests / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p90": percentile(latencies, 0.90),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": latencies[-1] if latencies else 0.0,
+        "db_queries_per_request": counters["db_queries"] / requests if requests else 0.0,
+        "response_cache_hit_ratio": _ratio(counters["response_cache_hits"], counters["response_cache_misses"]),
+        "route_cache_hit_ratio": _ratio(counters["route_cache_hits"], counters["route_cache_misses"]),
+    }
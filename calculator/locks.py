@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+from .resilience import deadline_remaining
+
+logger = logging.getLogger(__name__)
+
+# Longest wait for a cross-process lock outside a request deadline, and how
+# often a held lock is retried.
+DEFAULT_LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.05
+
+
+class LockTimeout(Exception):
+    """A lock was still held by another process when the wait ran out."""
+
+
+def _acquire(try_lock, name, timeout):
+    """Call `try_lock` until it returns True, for at most `timeout` seconds (None: no limit)."""
+    give_up = None if timeout is None else time.monotonic() + timeout
+    while not try_lock():
+        wait = LOCK_POLL_INTERVAL
+        if give_up is not None:
+            left = give_up - time.monotonic()
+            if left <= 0:
+                raise LockTimeout(f"Timed out waiting for lock {name!r}.")
+            wait = min(wait, left)
+        time.sleep(wait)
+
+
+@contextmanager
+def file_lock(name, directory=None, timeout=None):
+    """
+    Exclusive lock shared by every process on this host. Raises LockTimeout
+    if it is still held after `timeout` seconds.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise ImproperlyConfigured("File locks require a POSIX platform.")
+
+    directory = directory or getattr(settings, "LOCK_DIR", None) or tempfile.gettempdir()
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+    with open(os.path.join(directory, f"fuel-{digest}.lock"), "a+") as handle:
+        def try_lock():
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            return True
+
+        _acquire(try_lock, name, timeout)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+@contextmanager
+def advisory_lock(name, using="default", timeout=None):
+    """
+    Session-level PostgreSQL advisory lock shared by every process using the
+    database. A no-op on other backends. Raises LockTimeout if it is still
+    held after `timeout` seconds.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        yield
+        return
+
+    lock_id = int.from_bytes(hashlib.sha1(name.encode("utf-8")).digest()[:8], "big", signed=True)
+
+    def try_lock():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_id])
+            return cursor.fetchone()[0]
+
+    _acquire(try_lock, name, timeout)
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+
+
+@contextmanager
+def cross_process_lock(name):
+    """
+    Lock selected by settings.ROUTE_COALESCE_LOCK ("file", "advisory" or
+    None). It only saves other processes duplicate work, so when it is not
+    free within what is left of the request deadline (LOCK_TIMEOUT outside
+    one) the block runs without it.
+    """
+    kind = getattr(settings, "ROUTE_COALESCE_LOCK", None)
+    if kind == "file":
+        lock = file_lock
+    elif kind == "advisory":
+        lock = advisory_lock
+    elif not kind:
+        yield
+        return
+    else:
+        raise ImproperlyConfigured(f"Unknown ROUTE_COALESCE_LOCK: {kind!r}")
+
+    timeout = getattr(settings, "LOCK_TIMEOUT", DEFAULT_LOCK_TIMEOUT)
+    remaining = deadline_remaining()
+    if remaining is not None:
+        timeout = max(0, min(timeout, remaining))
+    acquired = False
+    try:
+        with lock(name, timeout=timeout):
+            acquired = True
+            yield
+    except LockTimeout as e:
+        if acquired:
+            raise
+        logger.warning("%s Proceeding without it.", e)
+        yield
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from calculator.snapshot import bump_dataset_version, export_station_snapshot, get_station_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the station snapshot, signal running workers to reload theirs "
+        "and export it for planning processes."
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        # Bumping the dataset version makes every worker polling or listening
+        # for changes rebuild its snapshot; this process has none yet and
+        # builds it from the current data.
+        bump_dataset_version()
+        snapshot = get_station_snapshot()
+        path = export_station_snapshot(snapshot)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(snapshot)} stations (version {snapshot.version}) in {elapsed:.2f}s; exported to {path}."
+        ))
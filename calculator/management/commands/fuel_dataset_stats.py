@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Min
+
+from calculator.models import FuelPrice
+from calculator.snapshot import get_station_snapshot
+
+
+class Command(BaseCommand):
+    help = "Report statistics about the imported fuel price dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        prices = FuelPrice.objects.aggregate(
+            stations=Count("id"),
+            min_price=Min("retail_price"),
+            avg_price=Avg("retail_price"),
+            max_price=Max("retail_price"),
+        )
+        geocoded = FuelPrice.objects.filter(latitude__isnull=False, longitude__isnull=False).count()
+        states = (
+            FuelPrice.objects.values("state").annotate(stations=Count("id")).order_by("-stations", "state")
+        )
+        snapshot = get_station_snapshot()
+
+        report = {
+            "stations": prices["stations"],
+            "geocoded": geocoded,
+            "min_price": float(prices["min_price"] or 0),
+            "avg_price": round(float(prices["avg_price"] or 0), 6),
+            "max_price": float(prices["max_price"] or 0),
+            "states": {row["state"]: row["stations"] for row in states},
+            "snapshot_version": snapshot.version,
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"Stations:      {report['stations']} ({report['geocoded']} geocoded)")
+        self.stdout.write(
+            f"Retail price:  min {report['min_price']:.3f} / avg {report['avg_price']:.3f} / max {report['max_price']:.3f}"
+        )
+        self.stdout.write(f"States:        {len(report['states'])}")
+        self.stdout.write(f"Snapshot:      {len(snapshot)} stations, version {snapshot.version}")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from calculator.ingest import load_fuel_data
+
+
+class Command(BaseCommand):
+    help = "Import the OPIS fuel price CSV into FuelPrice."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", dest="file_path", help="CSV to import (defaults to settings.FUEL_PRICES_CSV).")
+        parser.add_argument(
+            "--bulk", action="store_true",
+            help="Also update prices of stations that are already imported (default: only add new stations).",
+        )
+        parser.add_argument("--workers", type=int, default=1, help="Parallel geocoding requests.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows committed per checkpoint.")
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Ignore the checkpoint of an interrupted import of the same file and start over.",
+        )
+
+    def handle(self, *args, **options):
+        created, updated = load_fuel_data(
+            file_path=options["file_path"],
+            incremental=not options["bulk"],
+            workers=options["workers"],
+            progress=self.progress,
+            batch_size=options["batch_size"],
+            resume=not options["restart"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} new and updated {updated} stations."))
+
+    def progress(self, done, total):
+        self.stdout.write(f"Processed {done}/{total} rows")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.ingest import load_station_prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Import per-product and fleet-card prices from a CSV with OPIS Truckstop ID, "
+        "Product, Program and Price columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file_path", help="CSV of station prices.")
+
+    def handle(self, *args, **options):
+        try:
+            created, updated, skipped = load_station_prices(options["file_path"])
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Could not import station prices: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} new and updated {updated} station prices ({skipped} rows skipped)."
+        ))
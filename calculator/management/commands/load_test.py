@@ -0,0 +1,160 @@
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.loadtest import FakeDirectionsServer, lane_mix, run_load, summarize
+
+# Application servers tried for each deployment, best first. runserver is
+# the WSGI fallback when gunicorn is not installed (single process only).
+SERVERS = {
+    "wsgi": ("gunicorn", "runserver"),
+    "asgi": ("uvicorn", "daphne"),
+}
+
+
+def _server_command(server, host, port, workers, threads):
+    if server == "gunicorn":
+        return [
+            sys.executable, "-m", "gunicorn", "core.wsgi:application", "--bind", f"{host}:{port}",
+            "--workers", str(workers), "--threads", str(threads),
+        ]
+    if server == "runserver":
+        return [sys.executable, "-m", "django", "runserver", f"{host}:{port}", "--noreload"]
+    if server == "uvicorn":
+        return [
+            sys.executable, "-m", "uvicorn", "core.asgi:application", "--host", host, "--port", str(port),
+            "--workers", str(workers), "--no-access-log",
+        ]
+    return [sys.executable, "-m", "daphne", "-b", host, "-p", str(port), "core.asgi:application"]
+
+
+def _installed(server):
+    return server == "runserver" or importlib.util.find_spec(server) is not None
+
+
+def _wait_for_port(host, port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"The application server exited with status {process.returncode}.")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"The application server did not listen on {host}:{port} within {timeout}s.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the route-fuel-stops endpoint against a local fake Directions API, "
+        "under WSGI and/or ASGI, and report throughput, latency percentiles, DB queries "
+        "and cache hit ratios."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--deployment", choices=["wsgi", "asgi", "both"], default="both")
+        parser.add_argument(
+            "--url",
+            help="Load-test an already running server instead of starting one. It must use "
+                 "the printed DIRECTIONS_API_URL and REQUEST_METRICS=1 for the full report.",
+        )
+        parser.add_argument("--workers", type=int, default=1, help="Application server processes.")
+        parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker.")
+        parser.add_argument("--port", type=int, default=8765, help="Port of the started application server.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client connections.")
+        parser.add_argument("--requests", type=int, default=1000, help="Requests per run.")
+        parser.add_argument("--lanes", type=int, default=200, help="Distinct lanes requested.")
+        parser.add_argument("--hot-lanes", type=int, default=10, help="Lanes receiving the hot traffic.")
+        parser.add_argument("--hot-fraction", type=float, default=0.8, help="Share of requests for hot lanes.")
+        parser.add_argument(
+            "--upstream-latency", type=float, default=0.1, help="Seconds the fake Directions API takes to answer.",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the lane mix.")
+        parser.add_argument("--json", action="store_true", help="Print the reports as JSON.")
+
+    def handle(self, *args, **options):
+        reports = {}
+        with FakeDirectionsServer(latency=options["upstream_latency"]) as upstream:
+            self.stdout.write(f"Fake Directions API: DIRECTIONS_API_URL={upstream.url}")
+
+            if options["url"]:
+                reports["external"] = self.run(options["url"], upstream, options)
+            else:
+                deployments = ["wsgi", "asgi"] if options["deployment"] == "both" else [options["deployment"]]
+                for deployment in deployments:
+                    server = next((name for name in SERVERS[deployment] if _installed(name)), None)
+                    if server is None:
+                        self.stderr.write(f"Skipping {deployment}: install one of {', '.join(SERVERS[deployment])}.")
+                        continue
+                    reports[f"{deployment} ({server})"] = self.run_server(server, upstream, options)
+
+        if not reports:
+            raise CommandError("No deployment could be load-tested.")
+        if options["json"]:
+            self.stdout.write(json.dumps(reports, indent=2))
+        else:
+            for name, report in reports.items():
+                self.write_report(name, report)
+
+    def run_server(self, server, upstream, options):
+        host, port = "127.0.0.1", options["port"]
+        if server == "runserver" and options["workers"] > 1:
+            self.stderr.write("runserver is a single process; --workers is ignored.")
+        env = dict(
+            os.environ,
+            DIRECTIONS_API_URL=upstream.url,
+            REQUEST_METRICS="1",
+            UPSTREAM_REPLAY_MODE="off",
+            ROUTE_FUEL_STOPS_RATE="1000000/s",
+            DIRECTIONS_RATE="1000000",
+            DIRECTIONS_BURST="1000000",
+        )
+        process = subprocess.Popen(
+            _server_command(server, host, port, options["workers"], options["threads"]),
+            cwd=settings.BASE_DIR.parent, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_for_port(host, port, process)
+            return self.run(f"http://{host}:{port}", upstream, options)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def run(self, base_url, upstream, options):
+        calls = upstream.calls
+        lanes = lane_mix(options["lanes"], options["hot_lanes"], options["hot_fraction"], seed=options["seed"])
+        results, elapsed = run_load(
+            base_url, lanes, concurrency=options["concurrency"], requests=options["requests"],
+        )
+        report = summarize(results, elapsed)
+        report["upstream_calls"] = upstream.calls - calls
+        return report
+
+    def write_report(self, name, report):
+        def ratio(value):
+            return "n/a" if value is None else f"{value:.1%}"
+
+        self.stdout.write(self.style.SUCCESS(name))
+        self.stdout.write(
+            f"  {report['requests']} requests in {report['elapsed']:.2f}s: "
+            f"{report['throughput']:.1f} req/s, {report['errors']} errors {report['statuses']}"
+        )
+        self.stdout.write(
+            "  latency p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+                *(report[key] * 1000 for key in ("latency_p50", "latency_p90", "latency_p99", "latency_max"))
+            )
+        )
+        self.stdout.write(
+            f"  {report['db_queries_per_request']:.2f} DB queries/request, "
+            f"response cache hits {ratio(report['response_cache_hit_ratio'])}, "
+            f"route cache hits {ratio(report['route_cache_hit_ratio'])}, "
+            f"{report['upstream_calls']} upstream calls"
+        )
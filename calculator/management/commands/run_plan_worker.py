@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from calculator.jobs import claim_next_job, run_plan_job, worker_name
+
+
+class Command(BaseCommand):
+    help = "Process queued plan jobs from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Lanes planned in parallel per job.")
+        parser.add_argument(
+            "--processes", type=int, default=None,
+            help="Planning processes sharing the mapped station snapshot (default PLANNING_PROCESSES, 0 for none).",
+        )
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between queue polls.")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        name = worker_name()
+        self.stdout.write(f"Plan worker {name} started.")
+        while True:
+            job = claim_next_job(name)
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(f"Running plan job {job.pk} ({job.total} lanes)")
+            try:
+                job = run_plan_job(job, workers=options["workers"], processes=options["processes"])
+            except Exception as e:
+                self.stderr.write(f"Plan job {job.pk} failed: {e}")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Finished plan job {job.pk}"))
@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Child script: boot Django like a web worker would, then import each extra
+# module, printing the resident set size after every step.
+RSS_SCRIPT = """
+import json, os, sys
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+steps = [("interpreter", rss_kb())]
+import django
+django.setup()
+steps.append(("django.setup()", rss_kb()))
+from django.conf import settings
+__import__(settings.ROOT_URLCONF)
+steps.append((settings.ROOT_URLCONF, rss_kb()))
+for module in sys.argv[1:]:
+    __import__(module)
+    steps.append((module, rss_kb()))
+print(json.dumps(steps))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile worker startup: import time per module (python -X importtime) "
+        "and resident memory after booting Django and loading the URLconf."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20, help="Number of slowest imports to list.")
+        parser.add_argument(
+            "--module", action="append", default=[],
+            help="Extra module to import and measure after startup (repeatable), e.g. pandas.",
+        )
+
+    def run_child(self, *arguments):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE))
+        result = subprocess.run(
+            [sys.executable, *arguments], capture_output=True, text=True, env=env, cwd=os.getcwd(),
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr else "Child process failed.")
+        return result
+
+    def handle(self, *args, **options):
+        boot = "import django; django.setup(); from django.conf import settings; __import__(settings.ROOT_URLCONF)"
+        importtime = self.run_child("-X", "importtime", "-c", boot)
+
+        imports = []
+        for line in importtime.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            imports.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+
+        top_level = sum(cumulative for cumulative, _, name in imports if not name.startswith(" "))
+        self.stdout.write(f"Import time: {top_level / 1000:.1f} ms across {len(imports)} modules")
+        self.stdout.write(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for cumulative, self_us, name in sorted(imports, reverse=True)[:options["top"]]:
+            self.stdout.write(f"{cumulative / 1000:>14.1f} {self_us / 1000:>9.1f}  {name.strip()}")
+
+        steps = json.loads(self.run_child("-c", RSS_SCRIPT, *options["module"]).stdout.strip().splitlines()[-1])
+        self.stdout.write("")
+        self.stdout.write(f"{'RSS MB':>9} {'delta MB':>9}  step")
+        previous = steps[0][1]
+        for name, rss in steps:
+            self.stdout.write(f"{rss / 1024:>9.1f} {(rss - previous) / 1024:>+9.1f}  {name}")
+            previous = rss
@@ -0,0 +1,75 @@
+import csv
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.routing import normalize_address
+from calculator.responses import lane_response_body
+
+
+class Command(BaseCommand):
+    help = (
+        "Warm the route, plan and response caches from a CSV of lanes with "
+        "start_address and finish_address columns. The checkpoint is removed "
+        "once every lane has been warmed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("lanes", help="CSV file of lanes to warm.")
+        parser.add_argument("--workers", type=int, default=4, help="Lanes warmed in parallel.")
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording warmed lanes so an interrupted run resumes (default: <lanes>.checkpoint).",
+        )
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        if isinstance(caches["default"], (LocMemCache, DummyCache)):
+            # Entries would die with this command instead of reaching the API workers.
+            raise CommandError("The default cache is not shared between processes; configure CACHES first.")
+        try:
+            with open(options["lanes"], newline="", encoding="utf-8") as handle:
+                lanes = [(row["start_address"], row["finish_address"]) for row in csv.DictReader(handle)]
+        except (OSError, KeyError) as e:
+            raise CommandError(f"Could not read lanes: {e}")
+
+        checkpoint_path = options["checkpoint"] or options["lanes"] + ".checkpoint"
+        done = set()
+        if os.path.exists(checkpoint_path) and not options["restart"]:
+            with open(checkpoint_path, encoding="utf-8") as handle:
+                done = set(handle.read().splitlines())
+
+        pending = [lane for lane in lanes if self.lane_key(lane) not in done]
+        self.stdout.write(f"Warming {len(pending)} lanes ({len(lanes) - len(pending)} already warm).")
+
+        failures = 0
+        lock = threading.Lock()
+        with open(checkpoint_path, "w" if options["restart"] else "a", encoding="utf-8") as checkpoint, \
+                ThreadPoolExecutor(max_workers=max(1, options["workers"])) as executor:
+            futures = {executor.submit(lane_response_body, *lane): lane for lane in pending}
+            for count, future in enumerate(as_completed(futures), start=1):
+                lane = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failures += 1
+                    self.stderr.write(f"Failed to warm {lane[0]} -> {lane[1]}: {e}")
+                else:
+                    with lock:
+                        checkpoint.write(self.lane_key(lane) + "\n")
+                        checkpoint.flush()
+                if count == len(pending) or count % 50 == 0:
+                    self.stdout.write(f"Warmed {count}/{len(pending)} lanes")
+
+        if not failures:
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(f"Done: {len(pending) - failures} warmed, {failures} failed."))
+
+    @staticmethod
+    def lane_key(lane):
+        return f"{normalize_address(lane[0])}|{normalize_address(lane[1])}"
@@ -0,0 +1,23 @@
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+_metrics = contextvars.ContextVar("request_metrics", default=None)
+
+
+@contextmanager
+def collect_metrics():
+    """Collect the counters incremented by `count` inside the block."""
+    counters = Counter()
+    token = _metrics.set(counters)
+    try:
+        yield counters
+    finally:
+        _metrics.reset(token)
+
+
+def count(name, amount=1):
+    """Increment a counter of the current request, if one is being collected."""
+    counters = _metrics.get()
+    if counters is not None:
+        counters[name] += amount
@@ -0,0 +1,72 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from .metrics import collect_metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Negotiate response compression: brotli when the client accepts it and the
+    `brotli` package is installed, gzip otherwise.
+    """
+
+    def process_response(self, request, response):
+        if (
+            brotli is None
+            or response.streaming
+            or len(response.content) < 200
+            or response.has_header('Content-Encoding')
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return super().process_response(request, response)
+
+        compressed_content = brotli.compress(response.content, quality=5)
+        if len(compressed_content) >= len(response.content):
+            return response
+
+        response.content = compressed_content
+        response['Content-Length'] = str(len(response.content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'br'
+        return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Report per-request counters (database queries, cache hits and misses)
+    in an X-Request-Metrics header. Only active when REQUEST_METRICS is set,
+    e.g. for load tests.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect_metrics() as counters:
+            def count_query(execute, sql, params, many, context):
+                counters['db_queries'] += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_query):
+                response = self.get_response(request)
+        response['X-Request-Metrics'] = ', '.join(f'{name}={value}' for name, value in sorted(counters.items()))
+        return response
@@ -0,0 +1,96 @@
+# Generated by Django 3.2.23 on 2026-10-19 11:14
+
+from decimal import ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+# Frozen copies of the geohash encoding and tile levels of calculator.tiles at
+# the time of this migration, so later changes there cannot alter it.
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+STATION_GEOHASH_PRECISION = 7
+TILE_PRECISIONS = (2, 3, 4, 5)
+
+
+def encode_geohash(lat, lng, precision):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def to_micros(price):
+    return int((price * 1000000).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def build_price_tiles(apps, schema_editor):
+    FuelPrice = apps.get_model('calculator', 'FuelPrice')
+    PriceTile = apps.get_model('calculator', 'PriceTile')
+    stations = list(FuelPrice.objects.filter(latitude__isnull=False, longitude__isnull=False))
+    cells = {}
+    for station in stations:
+        station.geohash = encode_geohash(station.latitude, station.longitude, STATION_GEOHASH_PRECISION)
+        for precision in TILE_PRECISIONS:
+            count, min_price, total_price = cells.get(station.geohash[:precision], (0, None, 0))
+            price = station.retail_price
+            cells[station.geohash[:precision]] = (
+                count + 1, price if min_price is None else min(min_price, price), total_price + price,
+            )
+    FuelPrice.objects.bulk_update(stations, ['geohash'], batch_size=1000)
+
+    PriceTile.objects.all().delete()
+    PriceTile.objects.bulk_create([
+        PriceTile(
+            geohash=cell, precision=len(cell), count=count,
+            min_price_micros=to_micros(min_price), total_price_micros=to_micros(total_price),
+        )
+        for cell, (count, min_price, total_price) in cells.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0004_datasetversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geohash', models.CharField(max_length=12, unique=True)),
+                ('precision', models.SmallIntegerField()),
+                ('count', models.IntegerField()),
+                ('min_price_micros', models.BigIntegerField()),
+                ('total_price_micros', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fuelprice',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='pricetile',
+            index=models.Index(fields=['precision', 'geohash'], name='calculator__precisi_478f21_idx'),
+        ),
+        migrations.RunPython(build_price_tiles, migrations.RunPython.noop),
+    ]
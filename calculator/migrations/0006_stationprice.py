@@ -0,0 +1,42 @@
+# Generated by Django 3.2.23 on 2026-10-19 11:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_retail_prices(apps, schema_editor):
+    FuelPrice = apps.get_model('calculator', 'FuelPrice')
+    StationPrice = apps.get_model('calculator', 'StationPrice')
+    StationPrice.objects.bulk_create(
+        (
+            StationPrice(station_id=station_id, product='diesel', program='', price=price)
+            for station_id, price in FuelPrice.objects.values_list('id', 'retail_price').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0005_pricetile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product', models.CharField(choices=[('diesel', 'Diesel'), ('def', 'Diesel exhaust fluid'), ('gasoline', 'Gasoline')], default='diesel', max_length=10)),
+                ('program', models.CharField(blank=True, default='', max_length=20)),
+                ('price', models.DecimalField(decimal_places=6, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('station', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='calculator.fuelprice')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stationprice',
+            constraint=models.UniqueConstraint(fields=('station', 'product', 'program'), name='unique_station_product_program'),
+        ),
+        migrations.RunPython(copy_retail_prices, migrations.RunPython.noop),
+    ]
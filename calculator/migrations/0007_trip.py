@@ -0,0 +1,30 @@
+# Generated by Django 3.2.23 on 2026-10-19 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0006_stationprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('addresses', models.JSONField()),
+                ('options', models.JSONField(default=dict)),
+                ('polyline', models.TextField()),
+                ('average_mph', models.FloatField(blank=True, null=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('offset_miles', models.FloatField(default=0)),
+                ('fuel_gallons', models.FloatField(blank=True, null=True)),
+                ('fuel_stops', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -10,6 +10,7 @@ class FuelPrice(models.Model):
     retail_price = models.DecimalField(max_digits=10, decimal_places=6)  # Retail Price
     latitude = models.FloatField(null=True, blank=True)  # Latitude
     longitude = models.FloatField(null=True, blank=True)  # Longitude
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)  # Geohash of the coordinates
 
     class Meta:
         indexes = [
@@ -20,3 +21,121 @@ class FuelPrice(models.Model):
 
     def __str__(self):
         return f"{self.truckstop_name} - {self.city}, {self.state}"
+
+class ImportCheckpoint(models.Model):
+    file_hash = models.CharField(max_length=64, unique=True)  # SHA-256 of the imported file
+    file_path = models.TextField()  # Path the file was imported from
+    offset = models.IntegerField(default=0)  # Next CSV row to process
+    updated_at = models.DateTimeField(auto_now=True)  # Last committed batch
+
+    def __str__(self):
+        return f"{self.file_path} @ row {self.offset}"
+
+class PlanJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)  # Job state
+    lanes = models.JSONField()  # Submitted route-fuel-stops request bodies
+    total = models.IntegerField(default=0)  # Number of lanes
+    completed = models.IntegerField(default=0)  # Lanes with a stored result
+    error = models.TextField(blank=True)  # Why the job failed
+    worker = models.CharField(max_length=100, blank=True)  # Worker that claimed the job
+    created_at = models.DateTimeField(auto_now_add=True)  # Submission time
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Last progress from the worker
+    finished_at = models.DateTimeField(null=True, blank=True)  # Completion time
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Plan job {self.pk} ({self.status}, {self.completed}/{self.total})"
+
+class PlanJobResult(models.Model):
+    job = models.ForeignKey(PlanJob, related_name="results", on_delete=models.CASCADE)  # Owning job
+    position = models.IntegerField()  # Index of the lane in PlanJob.lanes
+    result = models.JSONField(null=True)  # Response body for the lane
+    error = models.TextField(blank=True)  # Why the lane failed
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["job", "position"], name="unique_plan_job_position"),
+        ]
+        ordering = ["position"]
+
+class DatasetVersion(models.Model):
+    name = models.CharField(max_length=50, unique=True)  # Dataset identifier, e.g. "fuel_prices"
+    version = models.IntegerField(default=0)  # Incremented on every change
+    updated_at = models.DateTimeField(auto_now=True)  # Time of the last change
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+class PriceTile(models.Model):
+    geohash = models.CharField(max_length=12, unique=True)  # Geohash cell
+    precision = models.SmallIntegerField()  # Length of the geohash
+    count = models.IntegerField()  # Geocoded stations in the cell
+    min_price_micros = models.BigIntegerField()  # Cheapest retail price in micro-dollars
+    total_price_micros = models.BigIntegerField()  # Sum of retail prices in micro-dollars
+    updated_at = models.DateTimeField(auto_now=True)  # Last refresh
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["precision", "geohash"]),
+        ]
+
+    def __str__(self):
+        return f"{self.geohash}: {self.count} stations"
+
+class StationPrice(models.Model):
+    DIESEL = "diesel"
+    DEF = "def"
+    GASOLINE = "gasoline"
+    PRODUCT_CHOICES = [
+        (DIESEL, "Diesel"),
+        (DEF, "Diesel exhaust fluid"),
+        (GASOLINE, "Gasoline"),
+    ]
+    RETAIL = ""  # Posted price, available to everyone
+
+    station = models.ForeignKey(FuelPrice, related_name="prices", on_delete=models.CASCADE, db_index=False)  # Truck stop
+    product = models.CharField(max_length=10, choices=PRODUCT_CHOICES, default=DIESEL)  # Fuel product
+    program = models.CharField(max_length=20, blank=True, default=RETAIL)  # Fleet-card vendor, blank for retail
+    price = models.DecimalField(max_digits=10, decimal_places=6)  # Price per gallon
+    updated_at = models.DateTimeField(auto_now=True)  # Last price change
+
+    class Meta:
+        # The unique constraint's index also serves station lookups.
+        constraints = [
+            models.UniqueConstraint(fields=["station", "product", "program"], name="unique_station_product_program"),
+        ]
+
+    def __str__(self):
+        program = f" ({self.program})" if self.program else ""
+        return f"{self.station_id} {self.product}{program}: {self.price}"
+
+class Trip(models.Model):
+    addresses = models.JSONField()  # Start, waypoint and finish addresses
+    options = models.JSONField(default=dict)  # calculate_fuel_stops keyword arguments
+    polyline = models.TextField()  # Encoded route points positions are projected onto
+    average_mph = models.FloatField(null=True, blank=True)  # Route distance over its duration, if known
+    latitude = models.FloatField(null=True, blank=True)  # Last reported position
+    longitude = models.FloatField(null=True, blank=True)
+    offset_miles = models.FloatField(default=0)  # Miles along the route of the last position
+    fuel_gallons = models.FloatField(null=True, blank=True)  # Last reported fuel level
+    fuel_stops = models.JSONField(default=list)  # Remaining plan from the last position
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Time of the last position
+
+    def __str__(self):
+        return f"Trip {self.pk}: {' -> '.join(self.addresses)}"
@@ -0,0 +1,140 @@
+import contextvars
+import multiprocessing
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+
+from .geometry import encode_polyline, route_geometry
+from .snapshot import StationSnapshot, export_station_snapshot, get_station_snapshot
+from .utils import calculate_leg_fuel_stops
+
+_processes = contextvars.ContextVar("planning_processes", default=0)
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+# Snapshot mapped by a planning process, and the file it came from.
+_worker_snapshot = None
+_worker_snapshot_path = None
+
+
+def pack_route(route, route_index=0):
+    """
+    The steps of a Directions route as one buffer of doubles: the number of
+    points of the route's geometry and their (lat, lng) pairs, the first
+    step's start, then (meters, end lat, end lng) per step. Legs are joined
+    end to end, as the planner walks them.
+    """
+    geometry = route_geometry(route, route_index)
+    values = array("d", [len(geometry)])
+    for point in geometry:
+        values.extend(point)
+    header = len(values)
+    for leg in route["routes"][route_index]["legs"]:
+        for step in leg["steps"]:
+            if len(values) == header:
+                start = step.get("start_location", step["end_location"])
+                values.extend((start["lat"], start["lng"]))
+            end = step["end_location"]
+            values.extend((step["distance"]["value"], end["lat"], end["lng"]))
+    return values.tobytes()
+
+
+def unpack_route(packed):
+    """Directions-shaped route of a `pack_route` buffer, with what the planner reads."""
+    values = array("d")
+    values.frombytes(packed)
+    header = 1 + 2 * int(values[0])
+    geometry = zip(values[1:header:2], values[2:header:2])
+    steps = []
+    for index in range(header + 2, len(values), 3):
+        start = steps[-1]["end_location"] if steps else {"lat": values[header], "lng": values[header + 1]}
+        steps.append({
+            "distance": {"value": values[index]},
+            "start_location": start,
+            "end_location": {"lat": values[index + 1], "lng": values[index + 2]},
+        })
+    return {"routes": [{"legs": [{"steps": steps}], "overview_polyline": {"points": encode_polyline(geometry)}}]}
+
+
+def _plan_packed(snapshot_path, packed, options):
+    global _worker_snapshot, _worker_snapshot_path
+    if snapshot_path != _worker_snapshot_path:
+        _worker_snapshot, _worker_snapshot_path = StationSnapshot.from_file(snapshot_path), snapshot_path
+    return calculate_leg_fuel_stops(unpack_route(packed), snapshot=_worker_snapshot, **options)
+
+
+def get_planning_pool(processes):
+    """The process-wide pool of `processes` planning processes."""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Spawned rather than forked: the workers never inherit this
+            # process's database connections or threads. Django is set up
+            # before the first task unpickles a reference to this module.
+            _pool = ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup,
+            )
+            _pool_size = processes
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+@contextmanager
+def planning_processes(processes=None):
+    """
+    Plan inside the block in a pool of `processes` processes (default
+    PLANNING_PROCESSES; 0 plans in the calling thread). Threads started in
+    the block must run in a copy of its context to inherit this.
+    """
+    if processes is None:
+        processes = getattr(settings, "PLANNING_PROCESSES", 0)
+    token = _processes.set(processes)
+    try:
+        yield processes
+    finally:
+        _processes.reset(token)
+
+
+def planning_in_processes():
+    """Whether `plan_in_processes` has a pool to use here."""
+    return _processes.get() > 0
+
+
+def plan_in_processes(route, **options):
+    """
+    `calculate_fuel_stops(route, **options)` run in the planning process
+    pool of the enclosing `planning_processes` block.
+
+    The workers map the station snapshot from the file written by
+    `export_station_snapshot`, shared through the page cache, so a task
+    carries only the snapshot's path, the packed route and the options.
+    """
+    stops, total_cost_micros, _ = plan_leg_in_processes(route, **options)
+    return stops, total_cost_micros
+
+
+def plan_leg_in_processes(route, distance_covered=0, **options):
+    """`calculate_leg_fuel_stops` run in the planning process pool, like `plan_in_processes`."""
+    processes = _processes.get()
+    path = export_station_snapshot(get_station_snapshot())
+    packed = pack_route(route, options.pop("route_index", 0))
+    pool = get_planning_pool(processes)
+    try:
+        return pool.submit(_plan_packed, path, packed, dict(options, distance_covered=distance_covered)).result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
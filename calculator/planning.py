@@ -0,0 +1,153 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .locks import cross_process_lock
+from .parallel import pack_route, plan_in_processes, plan_leg_in_processes, planning_in_processes
+from .pricing import to_micros
+from .routing import get_cached_leg_routes, get_cached_route, get_cached_trip_route, normalize_address
+from .singleflight import SingleFlight
+from .snapshot import get_station_snapshot
+from .utils import calculate_fuel_stops, calculate_leg_fuel_stops
+
+# Finished plans are shared with identical requests for this many seconds so
+# processes that waited on the cross-process lock can reuse the result.
+DEFAULT_PLAN_SHARE_TTL = 30
+# Plans of the legs of multi-stop trips are kept for this many seconds.
+DEFAULT_LEG_PLAN_TTL = 6 * 60 * 60
+
+_plan_flight = SingleFlight()
+
+
+def plan_cache_key(start_address, finish_address, waypoints=(), **options):
+    """Key of a plan request; `options` are `calculate_fuel_stops` keyword arguments."""
+    request = "|".join(
+        [normalize_address(address) for address in (start_address, *waypoints, finish_address)]
+        + [f"{name}={options[name]!r}" for name in sorted(options) if options[name] is not None]
+    )
+    return "plan:" + hashlib.sha1(request.encode("utf-8")).hexdigest()
+
+
+def leg_plan_key(route, distance_covered, snapshot, options):
+    """
+    Key of the plan of a leg's route started `distance_covered` miles after
+    the last stop, against `snapshot`. It covers everything the planner reads
+    from the route, so a refreshed route that changed gets a plan of its own.
+    """
+    digest = hashlib.sha1(pack_route(route))
+    digest.update(f"|{distance_covered!r}|{snapshot.version}".encode("utf-8"))
+    for name in sorted(options):
+        if options[name] is not None:
+            digest.update(f"|{name}={options[name]!r}".encode("utf-8"))
+    return "leg-plan:" + digest.hexdigest()
+
+
+def _plan_legs(addresses, options):
+    """
+    Plan a multi-stop trip leg by leg, carrying the miles driven since the
+    last stop into the next leg. Each leg's plan is cached on the leg and
+    that incoming fuel state, so changing one waypoint replans only the legs
+    from the first one it touches.
+    """
+    snapshot = get_station_snapshot()
+    stops, total_cost_micros, distance_covered = [], 0, 0
+    for route in get_cached_leg_routes(addresses):
+        key = leg_plan_key(route, distance_covered, snapshot, options)
+        leg = cache.get(key)
+        if leg is None:
+            if planning_in_processes():
+                leg = plan_leg_in_processes(route, distance_covered, **options)
+            else:
+                leg = calculate_leg_fuel_stops(route, distance_covered, snapshot=snapshot, **options)
+            cache.set(key, leg, timeout=getattr(settings, "LEG_PLAN_TTL", DEFAULT_LEG_PLAN_TTL))
+        leg_stops, leg_cost_micros, distance_covered = leg
+        stops.extend(leg_stops)
+        total_cost_micros += leg_cost_micros
+    return stops, total_cost_micros
+
+
+def _compute_plan(key, addresses, options):
+    with cross_process_lock(key):
+        plan = cache.get(key)
+        if plan is None:
+            if len(addresses) > 2:
+                plan = _plan_legs(addresses, options)
+            else:
+                route = get_cached_trip_route(addresses)
+                if planning_in_processes():
+                    plan = plan_in_processes(route, **options)
+                else:
+                    plan = calculate_fuel_stops(route, **options)
+            cache.set(key, plan, timeout=getattr(settings, "PLAN_SHARE_TTL", DEFAULT_PLAN_SHARE_TTL))
+        return plan
+
+
+def plan_fuel_stops(start_address, finish_address, waypoints=(), **options):
+    """
+    Route and fuel-stop plan for a lane, as `(stops, total_cost_micros)`.
+
+    The trip visits `waypoints` in order between start and finish; fuel state
+    carries over from one leg to the next, and each leg is planned and cached
+    on its own (detours near a waypoint are measured from the leg the stop
+    is planned on). `options` are passed on to `calculate_fuel_stops`.
+
+    Concurrent identical requests wait on a single computation and share
+    its result; with ROUTE_COALESCE_LOCK set this extends across processes.
+    """
+    addresses = (start_address, *waypoints, finish_address)
+    key = plan_cache_key(start_address, finish_address, waypoints, **options)
+    return _plan_flight.do(key, _compute_plan, key, addresses, options)
+
+
+def compare_routes(route, per_mile_cost=None, **options):
+    """
+    Evaluate every route of a Directions payload against the same station
+    snapshot and return them cheapest first.
+
+    A route's total cost is its fuel cost plus `per_mile_cost` dollars for
+    each mile driven. Refuelling points shared by overlapping routes are
+    ranked once. Costs are integer micro-dollars.
+
+    The routes are evaluated one after the other: planning is CPU-bound
+    Python, so threads would not run it in parallel, and each route can
+    then reuse every ranking the previous ones stored.
+    """
+    snapshot = get_station_snapshot()
+    candidate_cache = {}
+    per_mile_micros = to_micros(per_mile_cost) if per_mile_cost else 0
+
+    def evaluate(route_index):
+        stops, fuel_cost_micros = calculate_fuel_stops(
+            route, route_index=route_index, candidate_cache=candidate_cache, snapshot=snapshot, **options,
+        )
+        legs = route["routes"][route_index]["legs"]
+        distance_miles = sum(step["distance"]["value"] for leg in legs for step in leg["steps"]) / 1609.34
+        distance_cost_micros = int(round(distance_miles * per_mile_micros))
+        return {
+            "route_index": route_index,
+            "summary": route["routes"][route_index].get("summary", ""),
+            "distance_miles": round(distance_miles, 1),
+            "stops": stops,
+            "fuel_cost_micros": fuel_cost_micros,
+            "distance_cost_micros": distance_cost_micros,
+            "total_cost_micros": fuel_cost_micros + distance_cost_micros,
+        }
+
+    results = [evaluate(route_index) for route_index in range(len(route["routes"]))]
+    results.sort(key=lambda result: (result["total_cost_micros"], result["route_index"]))
+    return results
+
+
+def plan_route_alternatives(start_address, finish_address, per_mile_cost=None, **options):
+    """
+    `compare_routes` over the alternatives Directions offers for a lane,
+    coalesced like `plan_fuel_stops`.
+    """
+    key = "alternatives:" + plan_cache_key(start_address, finish_address, per_mile_cost=per_mile_cost, **options)
+
+    def compute():
+        route = get_cached_route(start_address, finish_address, alternatives=True)
+        return compare_routes(route, per_mile_cost, **options)
+
+    return _plan_flight.do(key, compute)
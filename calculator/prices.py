@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import FuelPrice, StationPrice
+from .snapshot import get_station_snapshot
+
+PRODUCTS = tuple(product for product, _ in StationPrice.PRODUCT_CHOICES)
+PROGRAM_MAX_LENGTH = StationPrice._meta.get_field("program").max_length
+_price_field = StationPrice._meta.get_field("price")
+# Prices must fit the price column.
+MAX_STATION_PRICE = Decimal(10) ** (_price_field.max_digits - _price_field.decimal_places)
+
+
+def parse_price_options(data):
+    """
+    Product and fleet-card program of a plan request as `calculate_fuel_stops`
+    keyword arguments, omitted when they are the retail diesel defaults.
+    Raises ValueError with a client message, also when no station currently
+    has a price for the product.
+    """
+    options = {}
+    product = data.get("product") or StationPrice.DIESEL
+    if product not in PRODUCTS:
+        raise ValueError(f"product must be one of: {', '.join(PRODUCTS)}.")
+    if product != StationPrice.DIESEL:
+        options["product"] = product
+
+    program = data.get("program") or StationPrice.RETAIL
+    if not isinstance(program, str) or len(program) > PROGRAM_MAX_LENGTH:
+        raise ValueError(f"program must be a fleet-card program name of at most {PROGRAM_MAX_LENGTH} characters.")
+    program = program.strip().lower()
+    if program:
+        options["program"] = program
+
+    try:
+        get_station_snapshot().prices_for(product, program)
+    except ValueError:
+        raise ValueError(f"No station has a price for {product}.")
+    return options
+
+
+def upsert_station_prices(rows):
+    """
+    Insert or update `(station_id, product, program, price)` rows. Returns
+    the number of created and updated prices.
+    """
+    rows = {(station_id, product, program): price for station_id, product, program, price in rows}
+    if not rows:
+        return 0, 0
+    existing = {
+        (station_id, product, program): pk
+        for pk, station_id, product, program in StationPrice.objects.filter(
+            station_id__in={station_id for station_id, _, _ in rows},
+        ).values_list("id", "station_id", "product", "program")
+    }
+
+    created, updated = [], []
+    now = timezone.now()
+    for key, price in rows.items():
+        station_id, product, program = key
+        if key in existing:
+            updated.append(StationPrice(id=existing[key], price=price, updated_at=now))
+        else:
+            created.append(StationPrice(station_id=station_id, product=product, program=program, price=price))
+    StationPrice.objects.bulk_create(created, batch_size=1000)
+    StationPrice.objects.bulk_update(updated, ["price", "updated_at"], batch_size=1000)
+    return len(created), len(updated)
+
+
+@receiver(post_save, sender=FuelPrice)
+def _sync_retail_price(sender, instance, **kwargs):
+    # FuelPrice.retail_price is the posted diesel price; mirror it.
+    upsert_station_prices([(instance.pk, StationPrice.DIESEL, StationPrice.RETAIL, instance.retail_price)])
@@ -0,0 +1,27 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Prices are carried as integer micro-dollars (1e-6 USD), matching the six
+# decimal places of FuelPrice.retail_price, so cost arithmetic stays exact.
+MICROS_PER_DOLLAR = 1000000
+MICRO = Decimal("0.000001")
+
+
+def to_micros(value):
+    """
+    Convert a price (Decimal, str, int or float) to integer micro-dollars.
+    """
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int((value * MICROS_PER_DOLLAR).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def micros_to_decimal(micros):
+    """Convert integer micro-dollars back to a Decimal with six places."""
+    return Decimal(micros).scaleb(-6).quantize(MICRO)
+
+
+def fuel_cost_micros(price_micros, gallons):
+    """Cost in micro-dollars of buying `gallons` at `price_micros` per gallon."""
+    if isinstance(gallons, int):
+        return price_micros * gallons
+    return int(round(price_micros * gallons))
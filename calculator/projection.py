@@ -0,0 +1,180 @@
+import bisect
+import functools
+import hashlib
+import math
+from array import array
+
+from .geometry import route_geometry
+from .snapshot import MILES_PER_DEGREE_LAT
+
+# Points x segments computed at once by the vectorized projection.
+PROJECTION_CHUNK_CELLS = 1 << 20
+
+
+@functools.lru_cache(maxsize=None)
+def load_numpy():
+    """
+    The numpy module, or None when it is not installed. Imported on the first
+    projection rather than with this module, so web workers start without it.
+    """
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover - pure Python fallback
+        return None
+    return numpy
+
+
+def _miles_per_degree_lng(lat):
+    return MILES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01)
+
+
+class RouteProjection:
+    """
+    A route polyline prepared for projecting stations onto it.
+
+    For each point `project` finds the nearest point on the route and
+    returns its along-route offset and the off-route distance, in miles.
+    Distances are measured in an equirectangular frame centred on each
+    projected point, so they stay accurate on cross-country routes. All
+    points are projected against all nearby segments at once, with numpy
+    when it is installed.
+    """
+
+    def __init__(self, coordinates):
+        self.latitudes = array("d", (lat for lat, _ in coordinates))
+        self.longitudes = array("d", (lng for _, lng in coordinates))
+
+        # Along-route offset of every vertex.
+        self.offsets = array("d", [0.0])
+        for index in range(1, len(coordinates)):
+            (lat_a, lng_a), (lat_b, lng_b) = coordinates[index - 1], coordinates[index]
+            d_lat = (lat_b - lat_a) * MILES_PER_DEGREE_LAT
+            d_lng = (lng_b - lng_a) * _miles_per_degree_lng((lat_a + lat_b) / 2)
+            self.offsets.append(self.offsets[-1] + math.hypot(d_lat, d_lng))
+
+    @classmethod
+    def from_route(cls, route, route_index=0):
+        """
+        Projection of a Directions route along its full geometry (see
+        `geometry.route_geometry`), so detours are measured from the road
+        rather than from the chords between step end points. Returns None
+        when the route has fewer than two points.
+        """
+        coordinates = route_geometry(route, route_index)
+        if len(coordinates) < 2:
+            return None
+        return cls(coordinates)
+
+    @property
+    def length(self):
+        return self.offsets[-1]
+
+    def segments_near(self, lat, lng, radius_miles):
+        """Indexes of the segments passing within a box of `radius_miles` around (lat, lng)."""
+        d_lat = radius_miles / MILES_PER_DEGREE_LAT
+        d_lng = radius_miles / _miles_per_degree_lng(lat)
+        min_lat, max_lat, min_lng, max_lng = lat - d_lat, lat + d_lat, lng - d_lng, lng + d_lng
+        latitudes, longitudes = self.latitudes, self.longitudes
+        return [
+            index for index in range(len(latitudes) - 1)
+            if max(latitudes[index], latitudes[index + 1]) >= min_lat
+            and min(latitudes[index], latitudes[index + 1]) <= max_lat
+            and max(longitudes[index], longitudes[index + 1]) >= min_lng
+            and min(longitudes[index], longitudes[index + 1]) <= max_lng
+        ]
+
+    def signature(self, segments):
+        """
+        Hashable identity of the stretch of route made of `segments`. Routes
+        with the same signature project every point near it alike, so a
+        result computed on one holds on the other. None unless the segments
+        are one contiguous stretch.
+        """
+        if not segments:
+            return ()
+        first, last = segments[0], segments[-1]
+        if last - first + 1 != len(segments):
+            return None
+        digest = hashlib.sha1(self.latitudes[first:last + 2].tobytes())
+        digest.update(self.longitudes[first:last + 2].tobytes())
+        return digest.digest()
+
+    def segments_between(self, start_offset, end_offset):
+        """Indexes of the segments overlapping the stretch between two offsets."""
+        count = len(self.offsets) - 1
+        first = min(max(0, bisect.bisect_left(self.offsets, start_offset) - 1), count - 1)
+        return range(first, max(first + 1, min(count, bisect.bisect_right(self.offsets, end_offset))))
+
+    def project(self, latitudes, longitudes, segments=None):
+        """
+        `(offsets, distances)` of the points onto the route, considering only
+        `segments` (all of them by default).
+        """
+        if segments is None:
+            segments = range(len(self.latitudes) - 1)
+        if not latitudes:
+            return [], []
+        if not segments:
+            return [0.0] * len(latitudes), [math.inf] * len(latitudes)
+        if load_numpy() is not None:
+            return self._project_vectorized(latitudes, longitudes, segments)
+        return self._project_python(latitudes, longitudes, segments)
+
+    def _project_vectorized(self, latitudes, longitudes, segments):
+        # Bound the points x segments temporaries on long, detailed routes.
+        rows = max(1, PROJECTION_CHUNK_CELLS // len(segments))
+        if len(latitudes) > rows:
+            offsets, distances = [], []
+            for start in range(0, len(latitudes), rows):
+                chunk = self._project_vectorized(
+                    latitudes[start:start + rows], longitudes[start:start + rows], segments,
+                )
+                offsets.extend(chunk[0])
+                distances.extend(chunk[1])
+            return offsets, distances
+
+        numpy = load_numpy()
+        lat = numpy.frombuffer(self.latitudes, dtype=numpy.float64)
+        lng = numpy.frombuffer(self.longitudes, dtype=numpy.float64)
+        route_offsets = numpy.frombuffer(self.offsets, dtype=numpy.float64)
+        segments = numpy.asarray(segments, dtype=numpy.intp)
+        p_lat = numpy.asarray(latitudes, dtype=numpy.float64)[:, None]
+        p_lng = numpy.asarray(longitudes, dtype=numpy.float64)[:, None]
+        x_scale = MILES_PER_DEGREE_LAT * numpy.maximum(numpy.cos(numpy.radians(p_lat)), 0.01)
+
+        ax = (lng[segments][None, :] - p_lng) * x_scale
+        ay = (lat[segments][None, :] - p_lat) * MILES_PER_DEGREE_LAT
+        dx = (lng[segments + 1][None, :] - p_lng) * x_scale - ax
+        dy = (lat[segments + 1][None, :] - p_lat) * MILES_PER_DEGREE_LAT - ay
+        length_sq = dx * dx + dy * dy
+        t = numpy.clip(-(ax * dx + ay * dy) / numpy.where(length_sq > 0, length_sq, 1.0), 0.0, 1.0)
+        cx, cy = ax + t * dx, ay + t * dy
+        distance_sq = cx * cx + cy * cy
+
+        rows = numpy.arange(len(latitudes))
+        best = numpy.argmin(distance_sq, axis=1)
+        segment = segments[best]
+        offsets = route_offsets[segment] + t[rows, best] * (route_offsets[segment + 1] - route_offsets[segment])
+        return offsets.tolist(), numpy.sqrt(distance_sq[rows, best]).tolist()
+
+    def _project_python(self, latitudes, longitudes, segments):
+        route_lat, route_lng, route_offsets = self.latitudes, self.longitudes, self.offsets
+        offsets, distances = [], []
+        for lat, lng in zip(latitudes, longitudes):
+            x_scale = _miles_per_degree_lng(lat)
+            best_sq, best_offset = math.inf, 0.0
+            for index in segments:
+                ax = (route_lng[index] - lng) * x_scale
+                ay = (route_lat[index] - lat) * MILES_PER_DEGREE_LAT
+                dx = (route_lng[index + 1] - lng) * x_scale - ax
+                dy = (route_lat[index + 1] - lat) * MILES_PER_DEGREE_LAT - ay
+                length_sq = dx * dx + dy * dy
+                t = 0.0 if length_sq == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length_sq))
+                cx, cy = ax + t * dx, ay + t * dy
+                distance_sq = cx * cx + cy * cy
+                if distance_sq < best_sq:
+                    best_sq = distance_sq
+                    best_offset = route_offsets[index] + t * (route_offsets[index + 1] - route_offsets[index])
+            offsets.append(best_offset)
+            distances.append(math.sqrt(best_sq))
+        return offsets, distances
@@ -0,0 +1,91 @@
+import re
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Statements worth explaining; inserts, savepoints and DDL are not.
+EXPLAINED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+_SEQUENTIAL_SCAN = {
+    "sqlite": re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$"),
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+}
+_INDEX_SCAN = {
+    "sqlite": re.compile(r"USING (?:COVERING )?INDEX (\w+)|USING (INTEGER PRIMARY KEY)"),
+    "postgresql": re.compile(r"Index (?:Only )?Scan (?:Backward )?using (\w+)|Bitmap Index Scan on (\w+)"),
+}
+
+
+class CapturedQuery:
+    """A statement issued inside `capture_queries` and its query plan."""
+
+    def __init__(self, vendor, sql, params, many=False):
+        self.vendor = vendor
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.plan = []
+
+    @property
+    def explained(self):
+        return not self.many and self.sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS)
+
+    @property
+    def sequential_scans(self):
+        """Tables the plan reads in full."""
+        pattern = _SEQUENTIAL_SCAN[self.vendor]
+        return [match.group(1) for match in map(pattern.search, self.plan) if match]
+
+    @property
+    def indexes(self):
+        """Indexes the plan looks rows up with."""
+        pattern = _INDEX_SCAN[self.vendor]
+        return [next(filter(None, match.groups())) for match in map(pattern.search, self.plan) if match]
+
+    def __repr__(self):
+        return "%s\n  %s" % (self.sql, "\n  ".join(self.plan))
+
+
+def explain(sql, params=None, using=DEFAULT_DB_ALIAS):
+    """Plan lines of a statement, as the database would run it now."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == "postgresql":
+            cursor.execute("EXPLAIN " + sql, params)
+            return [row[0].strip() for row in cursor.fetchall()]
+    raise NotImplementedError(f"Query plans are not supported on {connection.vendor}.")
+
+
+def analyze(using=DEFAULT_DB_ALIAS):
+    """Refresh the planner statistics, e.g. after loading synthetic data."""
+    with connections[using].cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+@contextmanager
+def capture_queries(using=DEFAULT_DB_ALIAS):
+    """
+    Record every statement issued on the connection inside the block. On
+    exit the plan of each SELECT, UPDATE and DELETE is looked up with
+    EXPLAIN, so a test can assert index usage and a query budget:
+
+        with capture_queries() as queries:
+            ...
+        assert len(queries) <= 2
+        assert not any(query.sequential_scans for query in queries)
+    """
+    connection = connections[using]
+    queries = []
+
+    def record(execute, sql, params, many, context):
+        queries.append(CapturedQuery(connection.vendor, sql, params, many))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        yield queries
+    for query in queries:
+        if query.explained:
+            query.plan = explain(query.sql, query.params, using)
@@ -0,0 +1,74 @@
+import heapq
+
+from .pricing import fuel_cost_micros
+from .snapshot import NO_PRICE
+
+# Cost of each mile driven off the route to reach a station, in micro-dollars.
+DEFAULT_DETOUR_COST_PER_MILE_MICROS = 2000000
+DEFAULT_SEARCH_RADIUS_MILES = 50
+
+
+def rank_candidates(
+    snapshot, lat, lng, gallons, k=1,
+    detour_cost_per_mile_micros=DEFAULT_DETOUR_COST_PER_MILE_MICROS,
+    radius_miles=DEFAULT_SEARCH_RADIUS_MILES, projection=None, prices=None,
+):
+    """
+    Top-`k` stations around (lat, lng) by the cost of refuelling there.
+
+    A station's score, in micro-dollars, is the price of `gallons` at that
+    station plus the round-trip detour to reach it at
+    `detour_cost_per_mile_micros`. Only stations within `radius_miles` are
+    scored, through a bounded heap rather than a full sort. Returns a list of
+    dicts with `index`, `detour_miles`, `backtrack_miles`, `score_micros`
+    and `extra_cost_micros` (the score difference to the best candidate).
+
+    Without a `projection` the detour is the round trip from (lat, lng).
+    With a `projection.RouteProjection` of the route through (lat, lng) it
+    is the round trip from the nearest point on the route, stations past
+    (lat, lng) along the route are skipped and `backtrack_miles` is how far
+    before (lat, lng) the station's exit lies.
+
+    `prices` is the snapshot price column to score with (retail diesel by
+    default, see `StationSnapshot.prices_for`); stations without a price
+    in it are skipped.
+    """
+    prices = snapshot.price_micros if prices is None else prices
+    candidates = [
+        (index, distance) for index, distance in snapshot.within(lat, lng, radius_miles)
+        if prices[index] != NO_PRICE
+    ]
+
+    def scored():
+        if projection is None:
+            for index, distance in candidates:
+                yield score(index, 2 * distance), index, 2 * distance, 0.0
+            return
+
+        # The refuelling point and every candidate, projected in one pass.
+        indexes = [index for index, _ in candidates]
+        segments = projection.segments_near(lat, lng, 2 * radius_miles)
+        offsets, distances = projection.project(
+            [lat] + [snapshot.latitudes[index] for index in indexes],
+            [lng] + [snapshot.longitudes[index] for index in indexes],
+            segments,
+        )
+        position = offsets[0]
+        for index, offset, distance in zip(indexes, offsets[1:], distances[1:]):
+            if offset <= position:
+                yield score(index, 2 * distance), index, 2 * distance, position - offset
+
+    def score(index, detour_miles):
+        return fuel_cost_micros(prices[index], gallons) + int(detour_miles * detour_cost_per_mile_micros)
+
+    best = heapq.nsmallest(k, scored())
+    return [
+        {
+            "index": index,
+            "detour_miles": detour_miles,
+            "backtrack_miles": backtrack_miles,
+            "score_micros": score_micros,
+            "extra_cost_micros": score_micros - best[0][0],
+        }
+        for score_micros, index, detour_miles, backtrack_miles in best
+    ]
@@ -0,0 +1,90 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+
+
+class UpstreamQuotaExceeded(Exception):
+    """The outbound request budget for an upstream API is exhausted."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"The {upstream} request budget is exhausted; retry in {retry_after}s.")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return the seconds until one is."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """
+        Take a token, waiting up to `timeout` seconds (forever if None).
+        Returns False if none became available in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining < wait:
+                    return False
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(upstream):
+    """
+    The process-wide bucket for an upstream configured in
+    settings.UPSTREAM_RATE_LIMITS as `{name: (requests_per_second, burst)}`,
+    or None when the upstream is not limited.
+
+    Buckets are not shared between processes: each gets an equal share of
+    the limit, settings.UPSTREAM_RATE_PROCESSES being the number of them.
+    """
+    with _buckets_lock:
+        if upstream not in _buckets:
+            limit = getattr(settings, "UPSTREAM_RATE_LIMITS", {}).get(upstream)
+            if limit:
+                rate, burst = limit
+                processes = max(1, getattr(settings, "UPSTREAM_RATE_PROCESSES", 1))
+                _buckets[upstream] = TokenBucket(rate / processes, max(1, burst // processes))
+            else:
+                _buckets[upstream] = None
+        return _buckets[upstream]
+
+
+def acquire_upstream(upstream, timeout=0):
+    """
+    Admit one outbound call to `upstream`, queueing for up to `timeout`
+    seconds (None waits indefinitely) before raising UpstreamQuotaExceeded.
+    """
+    bucket = get_bucket(upstream)
+    if bucket is None or bucket.acquire(timeout):
+        return
+    raise UpstreamQuotaExceeded(upstream, max(1, math.ceil(bucket.try_acquire() or 1)))
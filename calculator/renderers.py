@@ -0,0 +1,63 @@
+import json
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+
+class PrerenderedJSON(bytes):
+    """A response body that has already been encoded to JSON."""
+
+
+def _orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def render_json(data):
+    """Encode `data` as compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_orjson_default)
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONRenderer(BaseRenderer):
+    """
+    JSON renderer backed by orjson (with a stdlib fallback) that passes
+    PrerenderedJSON bodies through untouched.
+    """
+
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, PrerenderedJSON):
+            return bytes(data)
+        return render_json(data)
+
+
+class BinaryRenderer(BaseRenderer):
+    """
+    Passes pre-encoded binary bodies through; anything else (errors) is
+    rendered as JSON.
+    """
+
+    media_type = "application/octet-stream"
+    format = "bin"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, bytes):
+            return data
+        return render_json(data)
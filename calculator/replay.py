@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .resilience import request_exception
+
+# Request parameters that never reach a fixture or its hash.
+REDACTED_PARAMS = ("key",)
+REPLAY_MODES = ("off", "record", "replay")
+
+_random = None
+_random_seed = None
+_random_lock = threading.Lock()
+
+
+def request_hash(url, params=None):
+    """Stable hash of a GET request, ignoring the API key."""
+    params = {name: str(value) for name, value in (params or {}).items() if name not in REDACTED_PARAMS}
+    return hashlib.sha256(json.dumps([url, params], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def fixture_path(url, params=None):
+    return os.path.join(settings.UPSTREAM_REPLAY_DIR, request_hash(url, params) + ".json")
+
+
+def _should_fail():
+    global _random, _random_seed
+    rate = float(getattr(settings, "UPSTREAM_REPLAY_FAILURE_RATE", 0) or 0)
+    if rate <= 0:
+        return False
+    seed = getattr(settings, "UPSTREAM_REPLAY_SEED", None)
+    with _random_lock:
+        if _random is None or seed != _random_seed:
+            _random, _random_seed = random.Random(seed), seed
+        return _random.random() < rate
+
+
+def _latency(fixture):
+    latency = getattr(settings, "UPSTREAM_REPLAY_LATENCY", None)
+    if latency in (None, ""):
+        return 0
+    if latency == "recorded":
+        return fixture.get("elapsed", 0)
+    return float(latency)
+
+
+def record_response(url, params, response):
+    """Write `response` to the fixture of the request."""
+    fixture = {
+        "request": {
+            "url": url,
+            "params": {name: value for name, value in (params or {}).items() if name not in REDACTED_PARAMS},
+        },
+        "status": response.status_code,
+        "content_type": response.headers.get("Content-Type", "application/json"),
+        "elapsed": response.elapsed.total_seconds(),
+        "body": response.text,
+    }
+    path = fixture_path(url, params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(fixture, handle, indent=2, sort_keys=True)
+
+
+def replay_response(url, params=None, timeout=None):
+    """
+    The recorded response of the request, after the configured artificial
+    latency. Injected failures and latencies beyond `timeout` raise the
+    same requests exceptions a live call would.
+    """
+    from requests.models import Response
+    from requests.structures import CaseInsensitiveDict
+
+    try:
+        with open(fixture_path(url, params), encoding="utf-8") as handle:
+            fixture = json.load(handle)
+    except FileNotFoundError:
+        raise request_exception("ConnectionError")(f"No recorded response for {url} {request_hash(url, params)}.")
+
+    delay = _latency(fixture)
+    if timeout is not None and delay >= timeout:
+        time.sleep(timeout)
+        raise request_exception("ReadTimeout")(f"Replayed {url} exceeded the {timeout}s timeout.")
+    time.sleep(delay)
+    if _should_fail():
+        raise request_exception("ConnectionError")(f"Injected failure for {url}.")
+
+    response = Response()
+    response.status_code = fixture["status"]
+    response.headers = CaseInsensitiveDict({"Content-Type": fixture["content_type"]})
+    response.encoding = "utf-8"
+    response._content = fixture["body"].encode("utf-8")
+    response.url = url
+    response.elapsed = timedelta(seconds=delay)
+    return response
+
+
+def upstream_get(url, params=None, timeout=None):
+    """
+    GET an upstream Google API, or record/replay it as UPSTREAM_REPLAY_MODE
+    says: "off" calls it live, "record" calls it live and stores the
+    response, "replay" answers from the stored fixtures only. Any other mode
+    raises ImproperlyConfigured rather than silently calling live.
+    """
+    mode = getattr(settings, "UPSTREAM_REPLAY_MODE", "off")
+    if mode not in REPLAY_MODES:
+        raise ImproperlyConfigured(f"UPSTREAM_REPLAY_MODE must be one of: {', '.join(REPLAY_MODES)}.")
+    if mode == "replay":
+        return replay_response(url, params, timeout)
+
+    import requests
+
+    response = requests.get(url, params=params, timeout=timeout)
+    if mode == "record":
+        record_response(url, params, response)
+    return response
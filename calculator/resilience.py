@@ -0,0 +1,150 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_UPSTREAM_TIMEOUT = 5
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_RESET = 30
+
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream API call was not attempted or did not finish in time."""
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    def __init__(self):
+        super().__init__("The request deadline was exceeded while waiting on an upstream API.")
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    def __init__(self, name, retry_after):
+        super().__init__(f"The {name} API is failing; requests are suspended for {retry_after}s.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def request_exception(name="RequestException"):
+    """
+    An exception class from `requests.exceptions`, imported on first use so
+    except clauses can name it without loading requests at startup.
+    """
+    from requests import exceptions
+
+    return getattr(exceptions, name)
+
+
+@contextmanager
+def request_deadline(seconds):
+    """Bound every outbound call made inside the block by one overall deadline."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_remaining():
+    """Seconds left of the current request deadline, or None outside one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def upstream_timeout(cap=None):
+    """
+    Timeout for the next outbound call: `cap` (UPSTREAM_TIMEOUT by default)
+    shortened to what is left of the current request deadline.
+    """
+    timeout = getattr(settings, "UPSTREAM_TIMEOUT", DEFAULT_UPSTREAM_TIMEOUT) if cap is None else cap
+    remaining = deadline_remaining()
+    if remaining is not None:
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        timeout = min(timeout, remaining)
+    return timeout
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive failures, then lets a
+    single trial call through every `reset_timeout` seconds until one
+    succeeds.
+    """
+
+    def __init__(self, name, failure_threshold=DEFAULT_BREAKER_FAILURES, reset_timeout=DEFAULT_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if waited >= self.reset_timeout and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError(self.name, max(1, int(self.reset_timeout - waited)))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release_trial(self):
+        """End a trial call that neither succeeded nor counts as a failure."""
+        with self._lock:
+            self._trial_running = False
+
+    @contextmanager
+    def guard(self, failures=(Exception,)):
+        """Run the block through the breaker, counting `failures` exceptions."""
+        self.before_call()
+        try:
+            yield
+        except failures:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Not counted against the upstream, but a half-open breaker
+            # must still let the next trial through.
+            self.release_trial()
+            raise
+        else:
+            self.record_success()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Process-wide circuit breaker for an upstream API."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=getattr(settings, "CIRCUIT_BREAKER_FAILURES", DEFAULT_BREAKER_FAILURES),
+                reset_timeout=getattr(settings, "CIRCUIT_BREAKER_RESET", DEFAULT_BREAKER_RESET),
+            )
+        return _breakers[name]
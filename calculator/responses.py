@@ -0,0 +1,166 @@
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .geometry import encode_polyline, route_coordinates, simplify
+from .metrics import count
+from .planning import plan_cache_key, plan_fuel_stops, plan_route_alternatives
+from .prices import parse_price_options
+from .renderers import PrerenderedJSON, render_json
+from .routing import get_cached_trip_route
+from .serializers import serialize_fuel_plan, serialize_route_alternatives
+from .snapshot import get_station_snapshot
+
+# How the route geometry is included in the response.
+ROUTE_OPTIONS = ("omit", "polyline", "full")
+DEFAULT_RESPONSE_CACHE_TTL = 300
+
+# Numeric planning options accepted in the request body.
+PLAN_OPTIONS = ("max_range", "mpg", "detour_cost_per_mile")
+COST_OPTIONS = ("detour_cost_per_mile", "per_mile_cost")
+
+
+def parse_plan_options(data, names=PLAN_OPTIONS):
+    """
+    `calculate_fuel_stops` keyword arguments from a request body. Raises
+    ValueError naming the offending option.
+    """
+    options = {}
+    for name in names:
+        value = data.get(name)
+        if value in (None, ""):
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = -1
+        if not math.isfinite(value) or value < 0 or (value == 0 and name not in COST_OPTIONS):
+            raise ValueError(f"{name} must be a positive number.")
+        options[name] = value
+    return options
+
+
+def route_representation(route, route_option, tolerance=0):
+    """
+    Route geometry for the response: the raw Directions payload ("full") or
+    its overview as an encoded polyline, Douglas-Peucker simplified to
+    `tolerance` meters when one is given ("polyline").
+    """
+    if route_option == "polyline":
+        if not tolerance:
+            return {"polyline": route["routes"][0]["overview_polyline"]["points"]}
+        coordinates = simplify(route_coordinates(route), tolerance)
+        return {"polyline": encode_polyline(coordinates), "tolerance": tolerance}
+    return route
+
+
+def stop_markers(fuel_stops):
+    return [
+        {"lat": stop["latitude"], "lng": stop["longitude"], "truckstop_name": stop["truckstop_name"]}
+        for stop in fuel_stops
+    ]
+
+
+def parse_waypoints(data):
+    """Ordered intermediate addresses from a request body. Raises ValueError."""
+    waypoints = data.get("waypoints") or []
+    if not isinstance(waypoints, list) or not all(isinstance(point, str) and point.strip() for point in waypoints):
+        raise ValueError("waypoints must be a list of addresses.")
+    return tuple(waypoints)
+
+
+def response_cache_key(key):
+    return f"response:{key}:{get_station_snapshot().version}"
+
+
+def cached_response_body(key, build):
+    """
+    Encoded JSON of `build()`, reused from the cache under `key` while the
+    station dataset is unchanged.
+    """
+    key = response_cache_key(key)
+    body = cache.get(key)
+    count("response_cache_hits" if body is not None else "response_cache_misses")
+    if body is None:
+        body = render_json(build())
+        cache.set(key, body, timeout=getattr(settings, "RESPONSE_CACHE_TTL", DEFAULT_RESPONSE_CACHE_TTL))
+    return PrerenderedJSON(body)
+
+
+def lane_response_key(start_address, finish_address, route_option="omit", tolerance=0, waypoints=(), **options):
+    return "%s:%s:%s" % (plan_cache_key(start_address, finish_address, waypoints, **options), route_option, tolerance)
+
+
+def alternatives_response_key(start_address, finish_address, per_mile_cost=None, **options):
+    return "alternatives:" + plan_cache_key(start_address, finish_address, per_mile_cost=per_mile_cost, **options)
+
+
+def lane_response_body(start_address, finish_address, route_option="omit", tolerance=0, waypoints=(), **options):
+    """Encoded fuel plan response for a lane."""
+    def build():
+        fuel_stops, total_cost_micros = plan_fuel_stops(start_address, finish_address, waypoints, **options)
+        data = serialize_fuel_plan(fuel_stops, total_cost_micros)
+        if route_option != "omit":
+            route = get_cached_trip_route((start_address, *waypoints, finish_address))
+            data["route"] = route_representation(route, route_option, tolerance)
+            data["markers"] = stop_markers(fuel_stops)
+        return data
+
+    key = lane_response_key(start_address, finish_address, route_option, tolerance, waypoints, **options)
+    return cached_response_body(key, build)
+
+
+def alternatives_response_body(start_address, finish_address, per_mile_cost=None, **options):
+    """Encoded comparison of the alternative routes for a lane."""
+    def build():
+        results = plan_route_alternatives(start_address, finish_address, per_mile_cost, **options)
+        return serialize_route_alternatives(results)
+
+    key = alternatives_response_key(start_address, finish_address, per_mile_cost, **options)
+    return cached_response_body(key, build)
+
+
+def parse_route_request(data):
+    """
+    Validated arguments of a route-fuel-stops request, as keyword arguments
+    for `lane_response_body` or (when "alternatives" is set)
+    `alternatives_response_body`. Raises ValueError with a client message.
+    """
+    start_address = data.get("start_address")
+    finish_address = data.get("finish_address")
+    route_option = data.get("route", "omit")
+
+    if not start_address or not finish_address:
+        raise ValueError("Start and finish addresses are required.")
+
+    if route_option not in ROUTE_OPTIONS:
+        raise ValueError(f"route must be one of: {', '.join(ROUTE_OPTIONS)}.")
+
+    try:
+        tolerance = float(data.get("tolerance", 0))
+        if not math.isfinite(tolerance) or tolerance < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError("tolerance must be a non-negative number of meters.")
+
+    options = {**parse_plan_options(data), **parse_price_options(data)}
+    waypoints = parse_waypoints(data)
+    arguments = {"start_address": start_address, "finish_address": finish_address, **options}
+
+    if data.get("alternatives") in (True, "true", "1", 1):
+        if waypoints:
+            raise ValueError("alternatives cannot be combined with waypoints.")
+        arguments["per_mile_cost"] = parse_plan_options(data, ("per_mile_cost",)).get("per_mile_cost")
+        arguments["alternatives"] = True
+    else:
+        arguments.update(route_option=route_option, tolerance=tolerance, waypoints=waypoints)
+    return arguments
+
+
+def route_response_body(arguments):
+    """Encoded response for arguments returned by `parse_route_request`."""
+    arguments = dict(arguments)
+    if arguments.pop("alternatives", False):
+        return alternatives_response_body(**arguments)
+    return lane_response_body(**arguments)
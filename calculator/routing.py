@@ -0,0 +1,158 @@
+import contextvars
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .geometry import encode_polyline, route_coordinates
+from .metrics import count
+from .ratelimit import UpstreamQuotaExceeded
+from .resilience import UpstreamUnavailable, request_exception
+from .singleflight import SingleFlight
+from .utils import get_route
+
+logger = logging.getLogger(__name__)
+
+# Serve cached routes for ROUTE_CACHE_TTL seconds; after that keep serving
+# them for up to ROUTE_CACHE_STALE_TTL more seconds while refreshing. Older
+# routes are kept for ROUTE_FALLBACK_TTL seconds as a last resort when the
+# Directions API cannot be reached.
+DEFAULT_ROUTE_CACHE_TTL = 6 * 60 * 60
+DEFAULT_ROUTE_CACHE_STALE_TTL = 7 * 24 * 60 * 60
+DEFAULT_ROUTE_FALLBACK_TTL = 30 * 24 * 60 * 60
+DEFAULT_ROUTE_REFRESH_WORKERS = 4
+
+_route_flight = SingleFlight()
+_refresh_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "ROUTE_REFRESH_WORKERS", DEFAULT_ROUTE_REFRESH_WORKERS),
+    thread_name_prefix="route-refresh",
+)
+
+
+def normalize_address(address):
+    """Case- and whitespace-insensitive form of an address used for cache keys."""
+    return " ".join(str(address).lower().split())
+
+
+def route_cache_key(start_address, finish_address, alternatives=False):
+    lane = f"{normalize_address(start_address)}|{normalize_address(finish_address)}"
+    if alternatives:
+        lane += "|alternatives"
+    return "route:" + hashlib.sha1(lane.encode("utf-8")).hexdigest()
+
+
+def _route_ttls():
+    ttl = getattr(settings, "ROUTE_CACHE_TTL", DEFAULT_ROUTE_CACHE_TTL)
+    stale_ttl = getattr(settings, "ROUTE_CACHE_STALE_TTL", DEFAULT_ROUTE_CACHE_STALE_TTL)
+    fallback_ttl = getattr(settings, "ROUTE_FALLBACK_TTL", DEFAULT_ROUTE_FALLBACK_TTL)
+    return ttl, stale_ttl, fallback_ttl
+
+
+def _fetch_route(key, start_address, finish_address, alternatives=False):
+    route = get_route(start_address, finish_address, alternatives=alternatives)
+    cache.set(key, {"route": route, "fetched_at": time.time()}, timeout=sum(_route_ttls()))
+    return route
+
+
+def upstream_errors():
+    """Failures that make a cached route preferable to an error."""
+    return (request_exception(), UpstreamUnavailable, UpstreamQuotaExceeded)
+
+
+def _fallback_route(key, error):
+    """The last route fetched for a lane, whatever its age, or re-raise `error`."""
+    entry = cache.get(key)
+    if entry is None:
+        raise error
+    logger.warning("Serving last known route after upstream failure: %s", error)
+    return entry["route"]
+
+
+def _schedule_refresh(key, start_address, finish_address, alternatives=False):
+    future = _route_flight.submit(
+        _refresh_executor, key, _fetch_route, key, start_address, finish_address, alternatives,
+    )
+    future.add_done_callback(_report_refresh_error)
+    return future
+
+
+def _report_refresh_error(future):
+    error = future.exception()
+    if error is not None:
+        logger.error("Background route refresh failed", exc_info=error)
+
+
+def _lookup(key, start_address, finish_address, alternatives=False):
+    """Return a cached route, scheduling a refresh if it is stale."""
+    entry = cache.get(key)
+    if entry is None:
+        count("route_cache_misses")
+        return None
+    ttl, stale_ttl, _ = _route_ttls()
+    age = time.time() - entry["fetched_at"]
+    if age >= ttl + stale_ttl:
+        count("route_cache_misses")
+        return None  # kept only as a fallback
+    if age >= ttl:
+        count("route_cache_stale")
+        _schedule_refresh(key, start_address, finish_address, alternatives)
+    count("route_cache_hits")
+    return entry["route"]
+
+
+def get_cached_route(start_address, finish_address, alternatives=False):
+    """
+    `get_route` with stale-while-revalidate caching.
+
+    Fresh entries are returned as-is, stale ones are returned immediately
+    while a background worker refreshes them, and misses are fetched once
+    no matter how many threads ask for the same lane concurrently. If the
+    Directions API fails the last route fetched for the lane is served.
+    """
+    key = route_cache_key(start_address, finish_address, alternatives)
+    route = _lookup(key, start_address, finish_address, alternatives)
+    if route is not None:
+        return route
+    try:
+        return _route_flight.do(key, _fetch_route, key, start_address, finish_address, alternatives)
+    except upstream_errors() as e:
+        return _fallback_route(key, e)
+
+
+def get_cached_leg_routes(addresses):
+    """
+    Route of every leg between consecutive `addresses`, fetched in parallel
+    and cached on its own through `get_cached_route`, so changing one
+    waypoint only refetches the two legs that touch it.
+    """
+    # Run the legs in copies of this context so they share its request deadline.
+    futures = [
+        _refresh_executor.submit(contextvars.copy_context().run, get_cached_route, start, finish)
+        for start, finish in zip(addresses, addresses[1:])
+    ]
+    return [future.result() for future in futures]
+
+
+def get_cached_trip_route(addresses):
+    """
+    Route through `addresses` in order as a single Directions-shaped payload,
+    joined from the legs of `get_cached_leg_routes`.
+    """
+    addresses = list(addresses)
+    if len(addresses) == 2:
+        return get_cached_route(*addresses)
+
+    legs = []
+    coordinates = []
+    for route in get_cached_leg_routes(addresses):
+        legs.extend(route["routes"][0]["legs"])
+        if "overview_polyline" in route["routes"][0]:
+            coordinates.extend(route_coordinates(route))
+
+    return {
+        "routes": [{"legs": legs, "overview_polyline": {"points": encode_polyline(coordinates)}}],
+        "status": "OK",
+    }
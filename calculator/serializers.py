@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import FuelPrice
+from .models import FuelPrice, PlanJob
+from .pricing import micros_to_decimal
 
 class FuelPriceSerializer(serializers.ModelSerializer):
     """Serializer for FuelPrice model."""
@@ -33,3 +34,115 @@ class OptimalFuelStopsResponseSerializer(serializers.Serializer):
     route = serializers.JSONField()
     stops = OptimalFuelStopSerializer(many=True)
     total_fuel_cost = serializers.FloatField()
+
+
+def serialize_fuel_plan(stops, total_cost_micros):
+    """
+    Convert a micro-dollar fuel plan into its response representation.
+
+    This is the only place planner prices leave integer micro-dollars.
+    """
+    fuel_stops = []
+    for stop in stops:
+        stop = dict(stop)
+        stop["retail_price"] = micros_to_decimal(stop.pop("retail_price_micros"))
+        stop["cost"] = micros_to_decimal(stop.pop("cost_micros"))
+        fuel_stops.append(stop)
+    return {"fuel_stops": fuel_stops, "total_cost": micros_to_decimal(total_cost_micros)}
+
+
+def serialize_route_alternatives(results):
+    """Response representation of `planning.compare_routes` results."""
+    alternatives = []
+    for result in results:
+        plan = serialize_fuel_plan(result["stops"], result["fuel_cost_micros"])
+        alternatives.append({
+            "route_index": result["route_index"],
+            "summary": result["summary"],
+            "distance_miles": result["distance_miles"],
+            "fuel_stops": plan["fuel_stops"],
+            "fuel_cost": plan["total_cost"],
+            "distance_cost": micros_to_decimal(result["distance_cost_micros"]),
+            "total_cost": micros_to_decimal(result["total_cost_micros"]),
+        })
+    return {"alternatives": alternatives}
+
+
+def serialize_stations(snapshot, indexes):
+    """
+    Station list entries for snapshot `indexes`, with the field names of
+    FuelPriceSerializer plus coordinates.
+    """
+    stations = []
+    for index in indexes:
+        station = snapshot.station(index)
+        station["id"] = snapshot.ids[index]
+        station["retail_price"] = micros_to_decimal(snapshot.price_micros[index])
+        stations.append(station)
+    return stations
+
+
+def serialize_price_tile(precision, prefix, cells):
+    """JSON representation of `tiles.price_tile` cells."""
+    return {
+        "precision": precision,
+        "tile": prefix,
+        "cells": [
+            {
+                "geohash": geohash,
+                "count": count,
+                "min_price": micros_to_decimal(min_price),
+                "avg_price": micros_to_decimal(avg_price),
+            }
+            for geohash, count, min_price, avg_price in cells
+        ],
+    }
+
+
+class PlanJobSerializer(serializers.ModelSerializer):
+    """Serializer for the status of a plan job."""
+
+    class Meta:
+        model = PlanJob
+        fields = [
+            'id',
+            'status',
+            'total',
+            'completed',
+            'error',
+            'created_at',
+            'finished_at',
+        ]
+
+
+def serialize_trip_update(trip_id, update):
+    """Response representation of a `tracking.TripTracker.update` result."""
+    stops = update["stops"]
+    plan = serialize_fuel_plan(stops, sum(stop["cost_micros"] for stop in stops))
+    return {
+        "trip": trip_id,
+        "offset_miles": update["offset_miles"],
+        "off_route_miles": update["off_route_miles"],
+        "remaining_miles": update["remaining_miles"],
+        "miles_to_empty": update["miles_to_empty"],
+        "minutes_to_empty": update["minutes_to_empty"],
+        "reachable": update["reachable"],
+        "next_stop": plan["fuel_stops"][0] if plan["fuel_stops"] else None,
+        **plan,
+    }
+
+
+def serialize_trip(trip):
+    """Stored state of a trip, as of its last position report."""
+    plan = serialize_fuel_plan(trip.fuel_stops, sum(stop["cost_micros"] for stop in trip.fuel_stops))
+    return {
+        "id": trip.pk,
+        "addresses": trip.addresses,
+        "options": trip.options,
+        "latitude": trip.latitude,
+        "longitude": trip.longitude,
+        "offset_miles": trip.offset_miles,
+        "fuel_gallons": trip.fuel_gallons,
+        "updated_at": trip.updated_at,
+        **plan,
+    }
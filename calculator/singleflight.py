@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls that share a key into one execution.
+
+    Callers arriving while a call for the same key is in flight wait for it
+    and receive its result (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _run(self, key, future, fn, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run `fn` in the calling thread unless an identical call is in flight."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        return self._run(key, future, fn, args, kwargs)
+
+    def submit(self, executor, key, fn, *args, **kwargs):
+        """
+        Schedule `fn` on `executor` unless an identical call is in flight.
+
+        Returns a future for the (possibly shared) call.
+        """
+        future, leader = self._join(key)
+        if leader:
+            def task():
+                try:
+                    self._run(key, future, fn, args, kwargs)
+                except BaseException:
+                    pass  # delivered through the future
+
+            executor.submit(task)
+        return future
@@ -0,0 +1,498 @@
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import select
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import DatasetVersion, FuelPrice, StationPrice
+from .pricing import to_micros
+
+logger = logging.getLogger(__name__)
+
+# Size of the spatial grid cells in degrees.
+GRID_CELL_DEGREES = 0.5
+MILES_PER_DEGREE_LAT = 69.05
+FUEL_PRICES_DATASET = "fuel_prices"
+
+# Price column entry of a station that does not sell a product.
+NO_PRICE = -1
+
+# Running workers look for a new dataset version this often (seconds) and
+# rebuild their snapshot in the background when it changed.
+DEFAULT_SNAPSHOT_POLL_INTERVAL = 5
+DATASET_CHANNEL = "calculator_dataset"
+
+# Snapshot files written for planning processes; the magic includes the
+# byte order their columns are stored in.
+SNAPSHOT_FILE_MAGIC = b"FUELSNP" + (b"<" if sys.byteorder == "little" else b">")
+SNAPSHOT_FILES_KEPT = 3
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_next_poll = 0.0
+_reload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-reload")
+_reload_pending = threading.Event()
+_listener = None
+
+
+def _cell(lat, lng):
+    return int(math.floor(lat / GRID_CELL_DEGREES)), int(math.floor(lng / GRID_CELL_DEGREES))
+
+
+class StationSnapshot:
+    """
+    Columnar, read-only copy of the geocoded FuelPrice rows.
+
+    Coordinates are stored as doubles and prices as integer micro-dollars so
+    the planner never touches Decimal or model instances in its hot loop.
+    `price_micros` is the retail diesel price (FuelPrice.retail_price);
+    other products and fleet-card programs get one price column each in
+    `product_prices`, keyed by `(product, program)`, with NO_PRICE where a
+    station has no such price.
+    """
+
+    def __init__(self, rows, prices=()):
+        self.ids = array("q")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.price_micros = array("q")
+        self.details = []
+
+        for pk, name, address, city, state, price, lat, lng in rows:
+            self.ids.append(pk)
+            self.latitudes.append(lat)
+            self.longitudes.append(lng)
+            self.price_micros.append(to_micros(price))
+            self.details.append((name, address, city, state))
+
+        positions = {pk: index for index, pk in enumerate(self.ids)}
+        self.product_prices = {}
+        for station_id, product, program, price in prices:
+            index = positions.get(station_id)
+            if index is None:
+                continue
+            column = self.product_prices.get((product, program))
+            if column is None:
+                column = self.product_prices[product, program] = array("q", [NO_PRICE]) * len(self.ids)
+            column[index] = to_micros(price)
+        self._merged_prices = {}
+
+        # Content hash, identical across processes holding the same data.
+        digest = hashlib.sha1()
+        for column in (self.ids, self.latitudes, self.longitudes, self.price_micros):
+            digest.update(column.tobytes())
+        for key in sorted(self.product_prices):
+            digest.update("|".join(key).encode("utf-8"))
+            digest.update(self.product_prices[key].tobytes())
+        self.version = digest.hexdigest()[:16]
+
+        # DatasetVersion counter and change time the rows were read at.
+        self.dataset_version = None
+        self.last_modified = None
+
+        self._build_grid()
+
+    def _build_grid(self):
+        # Spatial grid: cell -> indexes of the stations inside it.
+        self.grid = {}
+        for index in range(len(self.ids)):
+            self.grid.setdefault(_cell(self.latitudes[index], self.longitudes[index]), []).append(index)
+
+    @classmethod
+    def from_queryset(cls, queryset=None):
+        if queryset is None:
+            queryset = FuelPrice.objects.all()
+        dataset = get_dataset_version()
+        rows = (
+            queryset.filter(latitude__isnull=False, longitude__isnull=False)
+            .order_by("id")
+            .values_list(
+                "id", "truckstop_name", "address", "city", "state",
+                "retail_price", "latitude", "longitude",
+            )
+        )
+        prices = (
+            StationPrice.objects.filter(station__in=queryset)
+            .exclude(product=StationPrice.DIESEL, program=StationPrice.RETAIL)
+            .values_list("station_id", "product", "program", "price")
+        )
+        snapshot = cls(rows.iterator(), prices.iterator())
+        if dataset is not None:
+            snapshot.dataset_version, snapshot.last_modified = dataset
+        return snapshot
+
+    def export(self, path):
+        """
+        Write the snapshot to `path` in the layout `from_file` maps: a JSON
+        header, then every column as raw 8-byte aligned machine values, then
+        the station details as JSON.
+        """
+        columns = [("ids", self.ids), ("latitudes", self.latitudes), ("longitudes", self.longitudes),
+                   ("price_micros", self.price_micros)]
+        columns += [(list(key), column) for key, column in sorted(self.product_prices.items())]
+        details = json.dumps(self.details).encode("utf-8")
+
+        header = {
+            "count": len(self.ids),
+            "version": self.version,
+            "dataset_version": self.dataset_version,
+            "last_modified": self.last_modified.isoformat() if self.last_modified else None,
+            "columns": [[name, column.typecode] for name, column in columns],
+            "details_length": len(details),
+        }
+        header = json.dumps(header).encode("utf-8")
+        header += b" " * (-(len(SNAPSHOT_FILE_MAGIC) + 8 + len(header)) % 8)
+
+        with open(path, "wb") as handle:
+            handle.write(SNAPSHOT_FILE_MAGIC)
+            handle.write(struct.pack("<q", len(header)))
+            handle.write(header)
+            for _, column in columns:
+                column.tofile(handle)
+            handle.write(details)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Snapshot mapped read-only from a file written by `export`. The
+        columns are memoryviews of the mapping, so every process mapping the
+        same file shares one copy of them through the page cache.
+        """
+        with open(path, "rb") as handle:
+            mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        if view[:len(SNAPSHOT_FILE_MAGIC)] != SNAPSHOT_FILE_MAGIC:
+            raise ValueError(f"{path} is not a station snapshot of this platform.")
+        offset = len(SNAPSHOT_FILE_MAGIC) + 8
+        header_length, = struct.unpack_from("<q", view, len(SNAPSHOT_FILE_MAGIC))
+        header = json.loads(bytes(view[offset:offset + header_length]))
+        offset += header_length
+
+        count = header["count"]
+        columns = {}
+        product_prices = {}
+        for name, typecode in header["columns"]:
+            column = view[offset:offset + 8 * count].cast(typecode)
+            offset += 8 * count
+            if isinstance(name, list):
+                product_prices[tuple(name)] = column
+            else:
+                columns[name] = column
+
+        snapshot = cls.__new__(cls)
+        snapshot.ids = columns["ids"]
+        snapshot.latitudes = columns["latitudes"]
+        snapshot.longitudes = columns["longitudes"]
+        snapshot.price_micros = columns["price_micros"]
+        snapshot.product_prices = product_prices
+        snapshot.details = [
+            tuple(details) for details in json.loads(bytes(view[offset:offset + header["details_length"]]))
+        ]
+        snapshot._merged_prices = {}
+        snapshot._mapping = mapping
+        snapshot.version = header["version"]
+        snapshot.dataset_version = header["dataset_version"]
+        snapshot.last_modified = header["last_modified"] and datetime.fromisoformat(header["last_modified"])
+        snapshot._build_grid()
+        return snapshot
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prices_for(self, product=StationPrice.DIESEL, program=StationPrice.RETAIL):
+        """
+        Price column of `product` under the fleet-card `program`, falling back
+        to the retail price where a station has no program price. Raises
+        ValueError if no station sells the product.
+        """
+        key = (product, program)
+        column = self._merged_prices.get(key)
+        if column is not None:
+            return column
+
+        if product == StationPrice.DIESEL:
+            retail = self.price_micros
+        else:
+            retail = self.product_prices.get((product, StationPrice.RETAIL))
+        discounted = self.product_prices.get(key) if program else None
+
+        if discounted is None:
+            column = retail
+        elif retail is None:
+            column = discounted
+        else:
+            column = array("q", (
+                price if price != NO_PRICE else retail[index] for index, price in enumerate(discounted)
+            ))
+        if column is None:
+            raise ValueError(f"No station prices for {product}.")
+        self._merged_prices[key] = column
+        return column
+
+    def nearest(self, lat, lng, prices=None):
+        """
+        Index of the station closest to (lat, lng) with a price in `prices`
+        (retail diesel by default), cheapest first on ties.
+        """
+        best = None
+        best_key = None
+        latitudes, longitudes = self.latitudes, self.longitudes
+        prices = self.price_micros if prices is None else prices
+        for index in range(len(latitudes)):
+            if prices[index] == NO_PRICE:
+                continue
+            d_lat = latitudes[index] - lat
+            d_lng = longitudes[index] - lng
+            key = (d_lat * d_lat + d_lng * d_lng, prices[index])
+            if best_key is None or key < best_key:
+                best, best_key = index, key
+        return best
+
+    def within(self, lat, lng, radius_miles):
+        """
+        Yield `(index, distance_miles)` for stations within `radius_miles`
+        of (lat, lng), visiting only the grid cells that can contain them.
+        """
+        lat_scale = MILES_PER_DEGREE_LAT
+        lng_scale = MILES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01)
+        min_row, min_col = _cell(lat - radius_miles / lat_scale, lng - radius_miles / lng_scale)
+        max_row, max_col = _cell(lat + radius_miles / lat_scale, lng + radius_miles / lng_scale)
+        radius_sq = radius_miles * radius_miles
+        latitudes, longitudes = self.latitudes, self.longitudes
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for index in self.grid.get((row, col), ()):
+                    d_lat = (latitudes[index] - lat) * lat_scale
+                    d_lng = (longitudes[index] - lng) * lng_scale
+                    distance_sq = d_lat * d_lat + d_lng * d_lng
+                    if distance_sq <= radius_sq:
+                        yield index, math.sqrt(distance_sq)
+
+    def in_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        """Yield the indexes of the stations inside the bounding box."""
+        min_row, min_col = _cell(min_lat, min_lng)
+        max_row, max_col = _cell(max_lat, max_lng)
+        latitudes, longitudes = self.latitudes, self.longitudes
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for index in self.grid.get((row, col), ()):
+                    if min_lat <= latitudes[index] <= max_lat and min_lng <= longitudes[index] <= max_lng:
+                        yield index
+
+    def price_key(self, index):
+        return self.price_micros[index], self.ids[index]
+
+    @cached_property
+    def price_order(self):
+        """Station indexes sorted by (price, id), cheapest first."""
+        return sorted(range(len(self.ids)), key=self.price_key)
+
+    def station(self, index):
+        """Descriptive fields of the station at `index`."""
+        name, address, city, state = self.details[index]
+        return {
+            "truckstop_name": name,
+            "address": address,
+            "city": city,
+            "state": state,
+            "latitude": self.latitudes[index],
+            "longitude": self.longitudes[index],
+        }
+
+
+def get_station_snapshot():
+    """
+    Return the process-wide station snapshot, building it on first use.
+
+    Afterwards the dataset version is checked in the background every
+    SNAPSHOT_POLL_INTERVAL seconds (or on a Postgres notification with
+    SNAPSHOT_NOTIFY); a changed dataset is rebuilt off the request path and
+    swapped in, requests meanwhile keep using the current snapshot.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = StationSnapshot.from_queryset()
+            snapshot = _snapshot
+        _start_listener()
+    else:
+        _poll_dataset_version()
+    return snapshot
+
+
+def export_station_snapshot(snapshot=None):
+    """
+    Path of the snapshot file (`snapshot` defaults to the process-wide one)
+    under SNAPSHOT_EXPORT_DIR, writing it unless it exists. Files are named
+    by snapshot version and replaced atomically; only the few most recent
+    are kept, so processes still mapping an older one can finish.
+    """
+    if snapshot is None:
+        snapshot = get_station_snapshot()
+    directory = getattr(settings, "SNAPSHOT_EXPORT_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "fuel-route-snapshots",
+    )
+    path = os.path.join(directory, f"stations-{snapshot.version}.snap")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(handle)
+    try:
+        snapshot.export(temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+    files = []
+    for entry in os.scandir(directory):
+        if entry.name.startswith("stations-") and entry.name.endswith(".snap"):
+            try:
+                files.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass  # removed by another process
+    for _, old_path in sorted(files, reverse=True)[SNAPSHOT_FILES_KEPT:]:
+        try:
+            os.remove(old_path)
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def invalidate_station_snapshot():
+    """Drop the cached snapshot so the next request rebuilds it."""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+def reload_station_snapshot():
+    """
+    Rebuild the snapshot if the dataset version moved on since it was built
+    and swap it in. Returns whether it was replaced.
+    """
+    global _snapshot
+    current = _snapshot
+    dataset = get_dataset_version()
+    if current is None or dataset is None or dataset[0] == current.dataset_version:
+        return False
+    replacement = StationSnapshot.from_queryset()
+    with _snapshot_lock:
+        # Keep an explicit invalidation (rebuilt on next use) as it is.
+        if _snapshot is not current:
+            return False
+        _snapshot = replacement
+    return True
+
+
+def schedule_snapshot_reload():
+    """Run `reload_station_snapshot` in the background unless it is already queued."""
+    if not _reload_pending.is_set():
+        _reload_pending.set()
+        return _reload_executor.submit(_reload_in_background)
+
+
+def _reload_in_background():
+    _reload_pending.clear()
+    try:
+        reload_station_snapshot()
+    except Exception:
+        logger.exception("Station snapshot reload failed")
+    finally:
+        connection.close()
+
+
+def _poll_dataset_version():
+    global _next_poll
+    interval = getattr(settings, "SNAPSHOT_POLL_INTERVAL", DEFAULT_SNAPSHOT_POLL_INTERVAL)
+    now = time.monotonic()
+    if interval and now >= _next_poll:
+        _next_poll = now + interval
+        schedule_snapshot_reload()
+
+
+def _start_listener():
+    """Start the Postgres LISTEN thread once per process when SNAPSHOT_NOTIFY is set."""
+    global _listener
+    if _listener is not None or not getattr(settings, "SNAPSHOT_NOTIFY", False) or connection.vendor != "postgresql":
+        return
+    with _snapshot_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, name="snapshot-listener", daemon=True)
+            _listener.start()
+
+
+def _listen():
+    while True:
+        listener = None
+        try:
+            listener = connection.get_new_connection(connection.get_connection_params())
+            listener.autocommit = True
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {DATASET_CHANNEL}")
+            while True:
+                if select.select([listener], [], [], 60) != ([], [], []):
+                    listener.poll()
+                    if listener.notifies:
+                        listener.notifies.clear()
+                        schedule_snapshot_reload()
+        except Exception:
+            logger.exception("Dataset listener failed, reconnecting")
+            if listener is not None:
+                with suppress(Exception):
+                    listener.close()
+            time.sleep(5)
+
+
+def get_dataset_version(name=FUEL_PRICES_DATASET):
+    """`(version, updated_at)` of the dataset `name`, or None before its first change."""
+    return DatasetVersion.objects.filter(name=name).values_list("version", "updated_at").first()
+
+
+def bump_dataset_version(name=FUEL_PRICES_DATASET):
+    """
+    Record a change to the dataset `name`. Once the change commits, this
+    process rebuilds its snapshot in the background, like every other worker,
+    and keeps serving the current one until the rebuild is swapped in.
+    """
+    with transaction.atomic():
+        DatasetVersion.objects.get_or_create(name=name)
+        DatasetVersion.objects.filter(name=name).update(version=F("version") + 1, updated_at=timezone.now())
+        if connection.vendor == "postgresql":
+            # Delivered to listening workers when the transaction commits.
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [DATASET_CHANNEL, name])
+    transaction.on_commit(schedule_snapshot_reload)
+
+
+@receiver(post_save, sender=FuelPrice)
+@receiver(post_delete, sender=FuelPrice)
+@receiver(post_save, sender=StationPrice)
+@receiver(post_delete, sender=StationPrice)
+def _fuel_price_changed(sender, **kwargs):
+    bump_dataset_version()
@@ -0,0 +1,130 @@
+import base64
+import math
+
+from .pricing import to_micros
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(price_micros, pk):
+    return base64.urlsafe_b64encode(f"{price_micros}:{pk}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """`(price_micros, id)` of the last station of the previous page. Raises ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        price_micros, pk = raw.split(":")
+        return int(price_micros), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("cursor is invalid.")
+
+
+def _price(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        micros = to_micros(value)
+    except (ArithmeticError, ValueError):
+        micros = -1
+    if micros < 0:
+        raise ValueError(f"{name} must be a non-negative price.")
+    return micros
+
+
+def parse_station_query(params):
+    """
+    Filters and page position of a stations request, as keyword arguments
+    for `station_page`. Raises ValueError with a client message.
+
+    `bbox` is "min_lng,min_lat,max_lng,max_lat" (GeoJSON order), `state` a
+    comma-separated list of state codes and `min_price`/`max_price` dollars.
+    """
+    query = {"bbox": None, "states": None, "after": None}
+
+    bbox = params.get("bbox")
+    if bbox:
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(value) for value in bbox.split(","))
+        except ValueError:
+            raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat.")
+        if not all(map(math.isfinite, (min_lng, min_lat, max_lng, max_lat))):
+            raise ValueError("bbox values must be finite numbers.")
+        if min_lat > max_lat or min_lng > max_lng:
+            raise ValueError("bbox minimums must not exceed its maximums.")
+        # Clamped to the globe, so the grid walk in `in_bbox` stays bounded.
+        query["bbox"] = (
+            max(min_lat, -90.0), max(min_lng, -180.0), min(max_lat, 90.0), min(max_lng, 180.0),
+        )
+
+    states = params.get("state")
+    if states:
+        query["states"] = {state.strip().upper() for state in states.split(",") if state.strip()}
+
+    query["min_price_micros"] = _price(params, "min_price")
+    query["max_price_micros"] = _price(params, "max_price")
+
+    try:
+        limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    query["limit"] = limit
+
+    cursor = params.get("cursor")
+    if cursor:
+        query["after"] = decode_cursor(cursor)
+    return query
+
+
+def _first_after(snapshot, order, after):
+    """Position in `order` of the first station whose key is above `after`."""
+    low, high = 0, len(order)
+    while low < high:
+        middle = (low + high) // 2
+        if snapshot.price_key(order[middle]) <= after:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def station_page(snapshot, bbox=None, states=None, min_price_micros=None, max_price_micros=None,
+                 after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of snapshot indexes ordered by (price, id), starting after the
+    `after` key. Returns the indexes and the cursor of the next page, or None
+    on the last one.
+
+    Keyset pagination keeps every page a binary search plus `limit` steps,
+    however deep the client pages.
+    """
+    if bbox is not None:
+        order = sorted(snapshot.in_bbox(*bbox), key=snapshot.price_key)
+    else:
+        order = snapshot.price_order
+
+    position = 0
+    if after is not None:
+        position = _first_after(snapshot, order, after)
+    elif min_price_micros is not None:
+        position = _first_after(snapshot, order, (min_price_micros, float("-inf")))
+
+    page = []
+    for position in range(position, len(order)):
+        index = order[position]
+        price = snapshot.price_micros[index]
+        if max_price_micros is not None and price > max_price_micros:
+            break
+        if min_price_micros is not None and price < min_price_micros:
+            continue
+        if states is not None and snapshot.details[index][3] not in states:
+            continue
+        if len(page) == limit:
+            last = page[-1]
+            return page, encode_cursor(*snapshot.price_key(last))
+        page.append(index)
+    return page, None
@@ -1,19 +1,111 @@
-from django.test import TestCase, Client
-from unittest.mock import patch
-from calculator.models import FuelPrice
-from calculator.utils import load_fuel_data, calculate_fuel_stops
+import json
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+import requests
+from io import StringIO
+from types import SimpleNamespace
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from unittest.mock import MagicMock, patch
+from calculator.gazetteer import Gazetteer, parse_exit_reference
+from calculator.geometry import decode_polyline, encode_geohash, encode_polyline, simplify
+from calculator.jobs import claim_next_job, run_plan_job, submit_plan_job
+from calculator.locks import LockTimeout, file_lock
+from calculator.loadtest import FakeDirectionsServer, fake_directions, lane_request, parse_metrics, summarize
+from calculator.parallel import pack_route, unpack_route
+from calculator.models import (
+    DatasetVersion, FuelPrice, ImportCheckpoint, PlanJob, PlanJobResult, PriceTile, StationPrice, Trip,
+)
+from calculator import middleware as middleware_module, projection, snapshot as snapshot_module
+from calculator.planning import compare_routes, plan_cache_key, plan_fuel_stops
+from calculator.prices import parse_price_options
+from calculator.projection import RouteProjection
+from calculator.queryplan import analyze, capture_queries
+from calculator.ranking import rank_candidates
+from calculator.ratelimit import TokenBucket, get_bucket
+from calculator.renderers import PrerenderedJSON, render_json
+from calculator.replay import upstream_get
+from calculator.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, request_deadline, upstream_timeout,
+)
+from calculator.responses import parse_route_request, route_response_body
+from calculator.routing import get_cached_route, get_cached_trip_route, route_cache_key
+from calculator.serializers import serialize_fuel_plan
+from calculator.singleflight import SingleFlight
+from calculator.snapshot import (
+    FUEL_PRICES_DATASET, StationSnapshot, export_station_snapshot, get_dataset_version, get_station_snapshot,
+    invalidate_station_snapshot, reload_station_snapshot,
+)
+from calculator.throttling import APIKeyRateThrottle, PlanJobRateThrottle
+from calculator.tiles import price_tile, refresh_price_tiles, station_geohash
+from calculator.tracking import get_tracker
+from calculator.utils import (
+    GOOGLE_MAPS_API_KEY, get_route, load_fuel_data, calculate_fuel_stops, calculate_leg_fuel_stops,
+)
 
-class LoadFuelDataTests(TestCase):
-    @patch("calculator.utils.load_fuel_data")
-    def test_load_fuel_data(self, mock_load_fuel_data):
-        # Mock external API call for loading fuel data
-        mock_load_fuel_data.return_value = None
+# A process-local cache, which `warm_route_cache` refuses to fill.
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+_cache_settings = None
+
+
+def setUpModule():
+    # The configured cache backend, in a directory of its own so test runs
+    # never see each other's (or a development server's) entries.
+    global _cache_settings
+    # Snapshots are only reloaded by the tests exercising it.
+    default = dict(settings.CACHES["default"], LOCATION=tempfile.mkdtemp(prefix="calculator-cache-"))
+    _cache_settings = override_settings(CACHES={**settings.CACHES, "default": default}, SNAPSHOT_POLL_INTERVAL=0)
+    _cache_settings.enable()
+
+
+def tearDownModule():
+    location = settings.CACHES["default"]["LOCATION"]
+    _cache_settings.disable()
+    shutil.rmtree(location, ignore_errors=True)
+
+
+class CalculatorTestCase(TestCase):
+    """
+    A price change reaches the station snapshot through a reload scheduled
+    when it commits, which never happens inside a test's transaction, so
+    every test starts from a snapshot of its own stations.
+    """
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        invalidate_station_snapshot()
+
+class LoadFuelDataTests(CalculatorTestCase):
+    @patch("calculator.ingest.get_lat_lng")
+    def test_load_fuel_data(self, mock_get_lat_lng):
+        # Mock the external geocoding API; the bundled CSV is imported for real
+        mock_get_lat_lng.return_value = (36.531, -95.206)
 
         # Ensure that fuel data is loaded without errors
         load_fuel_data()
-        self.assertTrue(mock_load_fuel_data.called)
+        self.assertTrue(mock_get_lat_lng.called)
+        station = FuelPrice.objects.get(opis_truckstop_id=7)
+        self.assertEqual(station.truckstop_name, "WOODSHED OF BIG CABIN")
+        self.assertEqual((station.latitude, station.longitude), (36.531, -95.206))
 
-class CalculateFuelStopsTests(TestCase):
+class CalculateFuelStopsTests(CalculatorTestCase):
     def setUp(self):
         # Create FuelPrice objects with real data
         FuelPrice.objects.create(
@@ -607,7 +699,7 @@ class CalculateFuelStopsTests(TestCase):
         self.assertIsNotNone(fuel_stops)
         self.assertGreater(len(fuel_stops), 0)
 
-class RouteFuelStopsAPITestCase(TestCase):
+class RouteFuelStopsAPITestCase(CalculatorTestCase):
     def setUp(self):
         self.client = Client()
         FuelPrice.objects.create(
@@ -655,3 +747,1458 @@ class RouteFuelStopsAPITestCase(TestCase):
 
         self.assertEqual(response.status_code, 400)
         self.assertIn("error", response.json())
+
+class FixedPointPricingTests(CalculatorTestCase):
+    def setUp(self):
+        FuelPrice.objects.create(
+            opis_truckstop_id=10,
+            truckstop_name="Pilot Travel Center",
+            address="I-40, EXIT 7",
+            city="Amarillo",
+            state="TX",
+            rack_id=110,
+            retail_price="3.007333",
+            latitude=35.2,
+            longitude=-101.8,
+        )
+        FuelPrice.objects.create(
+            opis_truckstop_id=11,
+            truckstop_name="Love's Travel Stop",
+            address="I-40, EXIT 9",
+            city="Amarillo",
+            state="TX",
+            rack_id=111,
+            retail_price="2.999999",
+            latitude=35.2,
+            longitude=-101.8,
+        )
+
+    def test_costs_are_exact_micro_dollars(self):
+        route = {"routes": [{"legs": [{"steps": [
+            {"distance": {"value": 900000}, "end_location": {"lat": 35.21, "lng": -101.79}},
+        ]}]}]}
+        stops, total_cost_micros = calculate_fuel_stops(route)
+
+        self.assertEqual(len(stops), 1)
+        self.assertEqual(stops[0]["truckstop_name"], "Love's Travel Stop")
+        self.assertEqual(stops[0]["retail_price_micros"], 2999999)
+        self.assertEqual(total_cost_micros, 2999999 * 50)
+
+        plan = serialize_fuel_plan(stops, total_cost_micros)
+        self.assertEqual(plan["total_cost"], Decimal("149.999950"))
+        self.assertEqual(plan["fuel_stops"][0]["retail_price"], Decimal("2.999999"))
+
+class StaleWhileRevalidateRouteTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch("calculator.routing.get_route")
+    def test_miss_fetches_once_and_caches(self, mock_get_route):
+        mock_get_route.return_value = {"routes": [{"legs": []}]}
+
+        first = get_cached_route("Dallas, TX", "Austin, TX")
+        second = get_cached_route("  dallas, tx", "AUSTIN, TX ")
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_get_route.call_count, 1)
+
+    @patch("calculator.routing.get_route")
+    def test_stale_entry_is_served_while_refreshing(self, mock_get_route):
+        key = route_cache_key("Dallas, TX", "Austin, TX")
+        cache.set(key, {"route": {"version": "old"}, "fetched_at": time.time() - 7 * 60 * 60})
+        refreshed = threading.Event()
+
+        def slow_get_route(*args, **kwargs):
+            refreshed.wait(5)
+            return {"version": "new"}
+
+        mock_get_route.side_effect = slow_get_route
+
+        # A burst of requests for the stale lane triggers a single refresh.
+        for _ in range(5):
+            self.assertEqual(get_cached_route("Dallas, TX", "Austin, TX"), {"version": "old"})
+        refreshed.set()
+        for _ in range(50):
+            if cache.get(key)["route"] == {"version": "new"}:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(get_cached_route("Dallas, TX", "Austin, TX"), {"version": "new"})
+        self.assertEqual(mock_get_route.call_count, 1)
+
+
+class SingleFlightTests(CalculatorTestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 42
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("lane", compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        while not flight.in_flight("lane"):
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(len(calls), 1)
+
+
+class PlanCoalescingTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch("calculator.planning.calculate_fuel_stops")
+    @patch("calculator.planning.get_cached_trip_route")
+    def test_identical_requests_share_one_computation(self, mock_route, mock_calculate):
+        mock_route.return_value = {"routes": [{"legs": []}]}
+        mock_calculate.return_value = ([], 0)
+
+        plan_fuel_stops("Dallas, TX", "Austin, TX")
+        plan_fuel_stops("DALLAS,  TX", "austin, tx")
+
+        self.assertEqual(mock_route.call_count, 1)
+        self.assertEqual(mock_calculate.call_count, 1)
+
+    @override_settings(ROUTE_COALESCE_LOCK="file")
+    @patch("calculator.planning.calculate_fuel_stops")
+    @patch("calculator.planning.get_cached_trip_route")
+    def test_file_lock_variant(self, mock_route, mock_calculate):
+        mock_route.return_value = {"routes": [{"legs": []}]}
+        mock_calculate.return_value = ([], 0)
+
+        self.assertEqual(plan_fuel_stops("Dallas, TX", "Austin, TX"), ([], 0))
+
+    def test_held_file_lock_times_out(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with file_lock("lane", directory):
+            started = time.monotonic()
+            with self.assertRaises(LockTimeout), file_lock("lane", directory, timeout=0.05):
+                pass
+        self.assertLess(time.monotonic() - started, 1)
+
+    @patch("calculator.planning.calculate_fuel_stops")
+    @patch("calculator.planning.get_cached_trip_route")
+    def test_plan_proceeds_without_a_lock_held_past_the_deadline(self, mock_route, mock_calculate):
+        mock_route.return_value = {"routes": [{"legs": []}]}
+        mock_calculate.return_value = ([], 0)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with override_settings(ROUTE_COALESCE_LOCK="file", LOCK_DIR=directory), \
+                file_lock(plan_cache_key("Dallas, TX", "Austin, TX"), directory), \
+                request_deadline(0.1), self.assertLogs("calculator.locks", "WARNING"):
+            self.assertEqual(plan_fuel_stops("Dallas, TX", "Austin, TX"), ([], 0))
+
+
+class FastJSONResponseTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+        self.route = {"routes": [{"legs": [], "overview_polyline": {"points": "_p~iF~ps|U"}}]}
+
+    def test_render_json_handles_decimals(self):
+        self.assertEqual(render_json({"price": Decimal("3.5")}), b'{"price":3.5}')
+
+    @patch("calculator.planning.get_cached_trip_route")
+    @patch("calculator.responses.get_cached_trip_route")
+    def test_lane_response_is_rendered_once(self, mock_view_route, mock_plan_route):
+        mock_view_route.return_value = mock_plan_route.return_value = self.route
+        url = reverse("route_fuel_stops")
+        payload = {"start_address": "Dallas, TX", "finish_address": "Austin, TX", "route": "polyline"}
+
+        with patch("calculator.responses.render_json", wraps=render_json) as mock_render:
+            first = self.client.post(url, data=payload, content_type="application/json")
+            second = self.client.post(url, data=payload, content_type="application/json")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["route"], {"polyline": "_p~iF~ps|U"})
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(mock_render.call_count, 1)
+
+    def test_unknown_route_option_is_rejected(self):
+        response = self.client.post(
+            reverse("route_fuel_stops"),
+            data={"start_address": "Dallas, TX", "finish_address": "Austin, TX", "route": "steps"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_finite_numbers_are_rejected(self):
+        lane = {"start_address": "Dallas, TX", "finish_address": "Austin, TX"}
+        for name in ("mpg", "max_range", "detour_cost_per_mile", "tolerance"):
+            for value in ("nan", "inf"):
+                response = self.client.post(
+                    reverse("route_fuel_stops"), data={**lane, name: value}, content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 400, (name, value))
+
+
+class GeometryTests(CalculatorTestCase):
+    def test_polyline_round_trip(self):
+        points = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+        coordinates = decode_polyline(points)
+
+        self.assertEqual(coordinates, [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)])
+        self.assertEqual(encode_polyline(coordinates), points)
+
+    def test_simplify_drops_collinear_points(self):
+        line = [(35.0, -100.0 + i * 0.01) for i in range(100)]
+        line.append((35.5, -99.0))
+
+        simplified = simplify(line, tolerance_m=50)
+
+        self.assertEqual(simplified, [line[0], line[99], line[100]])
+
+    def test_brotli_or_gzip_compression_is_negotiated(self):
+        FuelPrice.objects.create(
+            opis_truckstop_id=20, truckstop_name="Stop", address="I-35, EXIT 1",
+            city="Waco", state="TX", rack_id=1, retail_price="3.1", latitude=31.5, longitude=-97.1,
+        )
+        route = {"routes": [{"legs": [], "overview_polyline": {"points": "_p~iF~ps|U" * 50}}]}
+        with patch("calculator.routing.get_route", return_value=route):
+            response = self.client.post(
+                reverse("route_fuel_stops"),
+                data={"start_address": "Dallas, TX", "finish_address": "Austin, TX", "route": "full"},
+                content_type="application/json",
+                HTTP_ACCEPT_ENCODING="gzip",
+            )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_brotli_is_preferred_when_accepted_and_installed(self):
+        # zlib standing in for the optional brotli package.
+        brotli = SimpleNamespace(compress=lambda data, quality: zlib.compress(data), decompress=zlib.decompress)
+        route = {"routes": [{"legs": [], "overview_polyline": {"points": "_p~iF~ps|U" * 50}}]}
+        data = {"start_address": "Dallas, TX", "finish_address": "Austin, TX", "route": "full"}
+        with patch("calculator.routing.get_route", return_value=route), \
+                patch.object(middleware_module, "brotli", brotli):
+            plain = self.client.post(reverse("route_fuel_stops"), data=data, content_type="application/json")
+            response = self.client.post(
+                reverse("route_fuel_stops"), data=data, content_type="application/json",
+                HTTP_ACCEPT_ENCODING="gzip, br",
+            )
+
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+
+class GazetteerTests(CalculatorTestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer()
+        self.gazetteer.add_place("Saint Louis", "MO", 38.627, -90.199, population=300000)
+        self.gazetteer.add_place("Big Cabin", "OK", 36.539, -95.219)
+        self.gazetteer.add_exit("I-44", "283", "OK", 36.531, -95.206)
+
+    def test_parse_exit_reference(self):
+        self.assertEqual(parse_exit_reference("I-75, EXIT 144-B & US-41"), ("I-75", "144B"))
+        self.assertEqual(parse_exit_reference("I-85,  Exit 71"), ("I-85", "71"))
+        self.assertIsNone(parse_exit_reference("123 Main St"))
+
+    def test_exit_reference_wins_over_city_centroid(self):
+        self.assertEqual(
+            self.gazetteer.resolve("I-44, EXIT 283 & US-69", "Big Cabin", "OK"), (36.531, -95.206)
+        )
+        self.assertEqual(self.gazetteer.resolve("I-44, EXIT 9", "Big Cabin ", "ok"), (36.539, -95.219))
+
+    def test_abbreviated_and_truncated_city_names(self):
+        self.assertEqual(self.gazetteer.resolve("", "ST. LOUIS", "MO"), (38.627, -90.199))
+        self.assertEqual(self.gazetteer.resolve("", "Big Ca", "OK"), (36.539, -95.219))
+        self.assertEqual(self.gazetteer.resolve("", "Nowhere", "OK"), (None, None))
+
+
+class ManagementCommandTests(CalculatorTestCase):
+    def test_import_uses_gazetteer_and_bulk_updates_prices(self):
+        gazetteer = Gazetteer()
+        gazetteer.add_exit("I-44", "283", "OK", 36.531, -95.206)
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as handle:
+            handle.write("OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n")
+            handle.write('7,WOODSHED OF BIG CABIN,"I-44, EXIT 283 & US-69",Big Cabin,OK,307,3.00733333\n')
+        self.addCleanup(os.remove, handle.name)
+
+        with patch("calculator.ingest.get_gazetteer", return_value=gazetteer):
+            call_command("import_fuel_prices", file=handle.name, stdout=StringIO())
+            FuelPrice.objects.update(retail_price="1.0")
+            call_command("import_fuel_prices", file=handle.name, bulk=True, stdout=StringIO())
+
+        station = FuelPrice.objects.get(opis_truckstop_id=7)
+        self.assertEqual((station.latitude, station.longitude), (36.531, -95.206))
+        self.assertEqual(station.retail_price, Decimal("3.007333"))
+
+    @patch("calculator.management.commands.warm_route_cache.lane_response_body")
+    def test_warm_route_cache_resumes_from_checkpoint(self, mock_body):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as handle:
+            handle.write('start_address,finish_address\n"Dallas, TX","Austin, TX"\n"Tulsa, OK","Austin, TX"\n')
+        self.addCleanup(os.remove, handle.name)
+        checkpoint = handle.name + ".checkpoint"
+
+        def flaky(start, finish):
+            if start == "Tulsa, OK" and mock_body.call_count <= 2:
+                raise requests.exceptions.ConnectionError("upstream down")
+
+        mock_body.side_effect = flaky
+        call_command("warm_route_cache", handle.name, workers=1, stdout=StringIO(), stderr=StringIO())
+        self.assertTrue(os.path.exists(checkpoint))
+
+        call_command("warm_route_cache", handle.name, stdout=StringIO())
+
+        # Only the failed lane is warmed again, and the finished run removes its checkpoint.
+        self.assertEqual(mock_body.call_count, 3)
+        self.assertEqual(mock_body.call_args[0], ("Tulsa, OK", "Austin, TX"))
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_warm_route_cache_requires_a_shared_cache(self):
+        with override_settings(CACHES=LOCAL_CACHES), self.assertRaises(CommandError):
+            call_command("warm_route_cache", "lanes.csv", stdout=StringIO())
+
+    def test_build_station_index_signals_workers(self):
+        version = get_dataset_version()
+        with tempfile.TemporaryDirectory() as directory, override_settings(SNAPSHOT_EXPORT_DIR=directory):
+            call_command("build_station_index", stdout=StringIO())
+            self.assertEqual(os.listdir(directory), [f"stations-{get_station_snapshot().version}.snap"])
+        self.assertNotEqual(get_dataset_version(), version)
+
+
+class CheckpointedImportTests(CalculatorTestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as handle:
+            handle.write("OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n")
+            for station_id in range(1, 7):
+                handle.write(f"{station_id},Stop {station_id},Main St,Tulsa,OK,1,3.{station_id}\n")
+        self.file_path = handle.name
+        self.addCleanup(os.remove, handle.name)
+
+    @patch("calculator.ingest.get_lat_lng")
+    def test_import_resumes_after_upstream_failure(self, mock_get_lat_lng):
+        calls = []
+
+        def flaky_geocoder(city, state):
+            calls.append(city)
+            if len(calls) == 4:
+                raise requests.exceptions.ConnectionError("upstream down")
+            return 36.15, -95.99
+
+        mock_get_lat_lng.side_effect = flaky_geocoder
+        load_fuel_data(file_path=self.file_path, batch_size=2)
+
+        # The first three rows survive the crash and the checkpoint points at row 3.
+        self.assertEqual(FuelPrice.objects.count(), 3)
+        self.assertEqual(ImportCheckpoint.objects.get().offset, 3)
+
+        mock_get_lat_lng.side_effect = None
+        mock_get_lat_lng.return_value = (36.15, -95.99)
+        mock_get_lat_lng.reset_mock()
+        load_fuel_data(file_path=self.file_path, batch_size=2)
+
+        self.assertEqual(mock_get_lat_lng.call_count, 3)
+        self.assertEqual(FuelPrice.objects.count(), 6)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+        self.assertEqual(PriceTile.objects.get(precision=5).count, 6)
+
+    @patch("calculator.ingest.get_lat_lng")
+    def test_unexpected_geocoding_error_skips_only_its_row(self, mock_get_lat_lng):
+        mock_get_lat_lng.side_effect = [(36.15, -95.99), ValueError("bad response")] + [(36.15, -95.99)] * 4
+        load_fuel_data(file_path=self.file_path, batch_size=6)
+
+        self.assertEqual(mock_get_lat_lng.call_count, 6)
+        self.assertEqual(FuelPrice.objects.count(), 5)
+
+
+class CandidateRankingTests(CalculatorTestCase):
+    def setUp(self):
+        stations = [
+            # (id, lat, lng, price): the cheapest station sits 20 miles away.
+            (30, 35.00, -101.00, "3.500000"),
+            (31, 35.29, -101.00, "1.500000"),
+            (32, 36.50, -101.00, "0.500000"),
+        ]
+        for station_id, lat, lng, price in stations:
+            FuelPrice.objects.create(
+                opis_truckstop_id=station_id, truckstop_name=f"Stop {station_id}", address="",
+                city="Amarillo", state="TX", rack_id=1, retail_price=price, latitude=lat, longitude=lng,
+            )
+
+    def test_price_outweighs_short_detour(self):
+        ranked = rank_candidates(get_station_snapshot(), 35.0, -101.0, gallons=50, k=3)
+
+        # The 0.50 station is outside the search radius and never scored.
+        self.assertEqual([candidate["index"] for candidate in ranked], [1, 0])
+        self.assertEqual(ranked[0]["extra_cost_micros"], 0)
+        self.assertAlmostEqual(ranked[0]["detour_miles"], 40.0, delta=0.1)
+
+    def test_detour_cost_is_tunable(self):
+        ranked = rank_candidates(
+            get_station_snapshot(), 35.0, -101.0, gallons=50, detour_cost_per_mile_micros=5000000,
+        )
+        self.assertEqual(ranked[0]["index"], 0)
+
+
+class MultiWaypointRouteTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def leg_route(start, finish, alternatives=False):
+        return {"routes": [{
+            "legs": [{"start_address": start, "steps": []}],
+            "overview_polyline": {"points": encode_polyline([(35.0, -100.0), (35.5, -100.5)])},
+        }]}
+
+    @patch("calculator.routing.get_route")
+    def test_legs_are_fetched_and_cached_independently(self, mock_get_route):
+        mock_get_route.side_effect = self.leg_route
+
+        route = get_cached_trip_route(["Dallas, TX", "Waco, TX", "Austin, TX"])
+        self.assertEqual(
+            [leg["start_address"] for leg in route["routes"][0]["legs"]], ["Dallas, TX", "Waco, TX"]
+        )
+        self.assertEqual(len(decode_polyline(route["routes"][0]["overview_polyline"]["points"])), 4)
+
+        # Moving the final stop only fetches the leg that changed.
+        get_cached_trip_route(["Dallas, TX", "Waco, TX", "Houston, TX"])
+        self.assertEqual(mock_get_route.call_count, 3)
+
+    @patch("calculator.planning.calculate_leg_fuel_stops", wraps=calculate_leg_fuel_stops)
+    @patch("calculator.routing.get_route")
+    def test_only_legs_after_a_changed_waypoint_are_replanned(self, mock_get_route, mock_plan_leg):
+        def leg_route(start, finish, alternatives=False):
+            route = self.leg_route(start, finish)
+            # Legs to different destinations differ in length.
+            route["routes"][0]["legs"][0]["steps"] = [
+                {"distance": {"value": 1000 * len(finish)}, "end_location": {"lat": 35.5, "lng": -100.5}},
+            ]
+            return route
+
+        mock_get_route.side_effect = leg_route
+
+        plan_fuel_stops("Dallas, TX", "Austin, TX", waypoints=["Waco, TX"])
+        self.assertEqual(mock_plan_leg.call_count, 2)
+
+        # The first leg starts from the same fuel state, so its plan is reused.
+        plan_fuel_stops("Dallas, TX", "Houston, TX", waypoints=["Waco, TX"])
+        self.assertEqual(mock_plan_leg.call_count, 3)
+
+    def test_fuel_state_carries_across_legs(self):
+        FuelPrice.objects.create(
+            opis_truckstop_id=40, truckstop_name="Stop", address="", city="Waco", state="TX",
+            rack_id=1, retail_price="3.0", latitude=31.5, longitude=-97.1,
+        )
+        step = {"distance": {"value": 300 * 1609.34}, "end_location": {"lat": 31.5, "lng": -97.1}}
+        route = {"routes": [{"legs": [{"steps": [step]}, {"steps": [step]}]}]}
+
+        stops, _ = calculate_fuel_stops(route)
+
+        self.assertEqual(len(stops), 1)
+
+
+class RouteAlternativesTests(CalculatorTestCase):
+    def setUp(self):
+        FuelPrice.objects.create(
+            opis_truckstop_id=50, truckstop_name="Shared", address="", city="Waco", state="TX",
+            rack_id=1, retail_price="3.0", latitude=31.5, longitude=-97.1,
+        )
+        FuelPrice.objects.create(
+            opis_truckstop_id=51, truckstop_name="Detour", address="", city="Tyler", state="TX",
+            rack_id=1, retail_price="4.0", latitude=32.3, longitude=-95.3,
+        )
+
+    @staticmethod
+    def route(lat, lng, miles):
+        step = {"distance": {"value": miles * 1609.34}, "end_location": {"lat": lat, "lng": lng}}
+        return {"summary": f"via {lat}", "legs": [{"steps": [step]}]}
+
+    def test_alternatives_ranked_by_total_cost(self):
+        route = {"routes": [self.route(32.3, -95.3, 520), self.route(31.5, -97.1, 560)]}
+
+        results = compare_routes(route, per_mile_cost=1)
+
+        self.assertEqual([result["route_index"] for result in results], [1, 0])
+        self.assertEqual(results[0]["fuel_cost_micros"], 150000000)
+        self.assertEqual(results[0]["total_cost_micros"], 150000000 + 560000000)
+
+    def test_shared_refuelling_points_are_ranked_once(self):
+        route = {"routes": [self.route(31.5, -97.1, 520), self.route(31.5, -97.1, 530)]}
+
+        with patch("calculator.utils.rank_candidates", wraps=rank_candidates) as mock_rank:
+            compare_routes(route)
+
+        self.assertEqual(mock_rank.call_count, 1)
+
+    def test_slow_shared_ranking_still_runs_once(self):
+        route = {"routes": [self.route(31.5, -97.1, miles) for miles in (520, 530, 540)]}
+
+        def slow_rank(*args, **kwargs):
+            time.sleep(0.01)
+            return rank_candidates(*args, **kwargs)
+
+        with patch("calculator.utils.rank_candidates", side_effect=slow_rank) as mock_rank:
+            compare_routes(route)
+
+        self.assertEqual(mock_rank.call_count, 1)
+
+    def test_refuelling_point_reached_along_different_roads_is_ranked_per_route(self):
+        # On the road from the west this station is 18 miles back on the
+        # route; arriving from the north it is an 18-mile detour.
+        FuelPrice.objects.create(
+            opis_truckstop_id=52, truckstop_name="Behind", address="", city="Waco", state="TX",
+            rack_id=1, retail_price="2.0", latitude=31.5, longitude=-97.4,
+        )
+
+        def route(start_lat, start_lng):
+            step = {
+                "distance": {"value": 520 * 1609.34},
+                "start_location": {"lat": start_lat, "lng": start_lng},
+                "end_location": {"lat": 31.5, "lng": -97.1},
+            }
+            return {"legs": [{"steps": [step]}]}
+
+        route = {"routes": [route(31.5, -98.1), route(32.5, -97.1)]}
+        results = {result["route_index"]: result for result in compare_routes(route)}
+
+        for route_index in (0, 1):
+            stops, _ = calculate_fuel_stops(route, route_index=route_index)
+            self.assertEqual(results[route_index]["stops"], stops)
+        self.assertEqual(
+            [results[route_index]["stops"][0]["truckstop_name"] for route_index in (0, 1)], ["Behind", "Shared"],
+        )
+
+
+class AdmissionControlTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+        self.route = {"routes": [{"legs": [], "overview_polyline": {"points": ""}}]}
+
+    def test_token_bucket_rejects_when_empty(self):
+        bucket = TokenBucket(rate=0.001, capacity=2)
+
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0))
+
+    def test_exhausted_upstream_budget_returns_503(self):
+        with patch("calculator.ratelimit.get_bucket", return_value=TokenBucket(rate=0.001, capacity=0)):
+            response = self.client.post(
+                reverse("route_fuel_stops"),
+                data={"start_address": "Dallas, TX", "finish_address": "Austin, TX"},
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+    @patch("calculator.routing.get_route")
+    def test_cached_responses_bypass_client_throttle(self, mock_get_route):
+        mock_get_route.return_value = self.route
+        url = reverse("route_fuel_stops")
+        dallas = {"start_address": "Dallas, TX", "finish_address": "Austin, TX"}
+        houston = {"start_address": "Houston, TX", "finish_address": "Austin, TX"}
+
+        with patch.object(APIKeyRateThrottle, "THROTTLE_RATES", {"route_fuel_stops": "1/min"}), \
+                override_settings(API_KEYS={"fleet", "depot"}):
+            first = self.client.post(url, data=dallas, content_type="application/json", HTTP_X_API_KEY="fleet")
+            throttled = self.client.post(url, data=houston, content_type="application/json", HTTP_X_API_KEY="fleet")
+            cached = self.client.post(url, data=dallas, content_type="application/json", HTTP_X_API_KEY="fleet")
+            other_key = self.client.post(url, data=houston, content_type="application/json", HTTP_X_API_KEY="depot")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(other_key.status_code, 200)
+
+    @patch("calculator.routing.get_route")
+    def test_unknown_api_keys_share_the_ip_budget(self, mock_get_route):
+        mock_get_route.return_value = self.route
+        url = reverse("route_fuel_stops")
+        lanes = [{"start_address": f"Town {number}, TX", "finish_address": "Austin, TX"} for number in range(2)]
+
+        with patch.object(APIKeyRateThrottle, "THROTTLE_RATES", {"route_fuel_stops": "1/min"}):
+            responses = [
+                self.client.post(url, data=lane, content_type="application/json", HTTP_X_API_KEY=f"made-up-{number}")
+                for number, lane in enumerate(lanes)
+            ]
+
+        self.assertEqual([response.status_code for response in responses], [200, 429])
+
+    def test_upstream_budget_is_divided_between_processes(self):
+        limits = {"directions": (10.0, 20)}
+        with override_settings(UPSTREAM_RATE_LIMITS=limits, UPSTREAM_RATE_PROCESSES=4), \
+                patch.dict("calculator.ratelimit._buckets", clear=True):
+            bucket = get_bucket("directions")
+
+        self.assertEqual((bucket.rate, bucket.capacity), (2.5, 5))
+
+
+class UpstreamResilienceTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_breaker_opens_after_repeated_failures(self):
+        breaker = CircuitBreaker("directions", failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                with breaker.guard(requests.exceptions.RequestException):
+                    raise requests.exceptions.ConnectionError()
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_half_open_trial_closes_breaker(self):
+        breaker = CircuitBreaker("directions", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        with breaker.guard():
+            pass
+
+        self.assertFalse(breaker.is_open)
+
+    def test_uncounted_error_in_trial_allows_another_trial(self):
+        breaker = CircuitBreaker("directions", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        with self.assertRaises(DeadlineExceeded):
+            with breaker.guard(requests.exceptions.RequestException):
+                raise DeadlineExceeded()
+        with breaker.guard(requests.exceptions.RequestException):
+            pass
+
+        self.assertFalse(breaker.is_open)
+
+    def test_deadline_caps_upstream_timeout(self):
+        with request_deadline(0.5):
+            self.assertLessEqual(upstream_timeout(), 0.5)
+        with request_deadline(-1):
+            with self.assertRaises(DeadlineExceeded):
+                upstream_timeout()
+
+    @patch("calculator.routing.get_route")
+    def test_last_known_route_served_when_upstream_fails(self, mock_get_route):
+        key = route_cache_key("Dallas, TX", "Austin, TX")
+        cache.set(key, {"route": {"version": "ancient"}, "fetched_at": time.time() - 10 ** 8})
+        mock_get_route.side_effect = CircuitOpenError("directions", 30)
+
+        with self.assertLogs("calculator.routing", "WARNING"):
+            self.assertEqual(get_cached_route("Dallas, TX", "Austin, TX"), {"version": "ancient"})
+
+        cache.clear()
+        with self.assertRaises(CircuitOpenError):
+            get_cached_route("Dallas, TX", "Austin, TX")
+
+    @patch("calculator.routing.get_route")
+    def test_upstream_timeout_maps_to_504(self, mock_get_route):
+        mock_get_route.side_effect = requests.exceptions.ReadTimeout("slow")
+
+        response = self.client.post(
+            reverse("route_fuel_stops"),
+            data={"start_address": "Dallas, TX", "finish_address": "Austin, TX"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 504)
+
+
+class PlanJobTests(CalculatorTestCase):
+    lanes = [
+        {"start_address": "Dallas, TX", "finish_address": "Austin, TX"},
+        {"start_address": "Tulsa, OK", "finish_address": "Wichita, KS"},
+    ]
+
+    def test_invalid_lane_is_rejected(self):
+        response = self.client.post(
+            reverse("plan_jobs"), data={"lanes": [{"start_address": "Dallas, TX"}]}, content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_lane_count_is_capped(self):
+        with override_settings(MAX_PLAN_JOB_LANES=1):
+            response = self.client.post(reverse("plan_jobs"), data={"lanes": self.lanes}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PlanJob.objects.exists())
+
+    def test_submissions_are_throttled(self):
+        cache.clear()
+        with patch.object(PlanJobRateThrottle, "THROTTLE_RATES", {"plan_jobs": "1/min"}):
+            responses = [
+                self.client.post(reverse("plan_jobs"), data={"lanes": self.lanes}, content_type="application/json")
+                for _ in range(2)
+            ]
+
+        self.assertEqual([response.status_code for response in responses], [202, 429])
+
+    @patch("calculator.jobs.route_response_body")
+    def test_job_lifecycle(self, mock_body):
+        def fake_body(arguments):
+            if arguments["start_address"] == "Tulsa, OK":
+                raise ValueError("No route found.")
+            return PrerenderedJSON(b'{"total_cost":150.0}')
+
+        mock_body.side_effect = fake_body
+        submitted = self.client.post(reverse("plan_jobs"), data={"lanes": self.lanes}, content_type="application/json")
+        self.assertEqual(submitted.status_code, 202)
+        job_id = submitted.json()["id"]
+
+        call_command("run_plan_worker", once=True, stdout=StringIO(), stderr=StringIO())
+
+        status = self.client.get(reverse("plan_job", args=[job_id])).json()
+        self.assertEqual((status["status"], status["completed"], status["total"]), ("done", 2, 2))
+
+        response = self.client.get(reverse("plan_job_results", args=[job_id]))
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[0], {"position": 0, "result": {"total_cost": 150.0}})
+        self.assertEqual(rows[1]["error"], "No route found.")
+
+    @patch("calculator.jobs.route_response_body")
+    def test_restarted_job_only_plans_missing_lanes(self, mock_body):
+        mock_body.return_value = PrerenderedJSON(b"{}")
+        job = submit_plan_job(self.lanes)
+        PlanJobResult.objects.create(job=job, position=0, result={})
+        PlanJob.objects.filter(pk=job.pk).update(completed=1)
+
+        run_plan_job(claim_next_job("test"))
+
+        self.assertEqual(mock_body.call_count, 1)
+        self.assertEqual(PlanJob.objects.get(pk=job.pk).completed, 2)
+
+    @patch("calculator.jobs.get_station_snapshot")
+    @patch("calculator.jobs.route_response_body")
+    def test_lane_stored_by_another_worker_is_skipped(self, mock_body, mock_snapshot):
+        mock_body.return_value = PrerenderedJSON(b"{}")
+        job = submit_plan_job(self.lanes)
+        # The job's previous worker was not dead after all: it stores a lane
+        # once this one has listed the missing ones.
+        mock_snapshot.side_effect = lambda: PlanJobResult.objects.create(job=job, position=0, result={"by": "other"})
+
+        job = run_plan_job(claim_next_job("test"))
+
+        self.assertEqual((job.status, job.completed), (PlanJob.DONE, 1))
+        self.assertEqual(PlanJobResult.objects.get(job=job, position=0).result, {"by": "other"})
+
+    @patch("calculator.jobs._beat")
+    @patch("calculator.jobs.route_response_body")
+    def test_heartbeat_runs_while_a_lane_is_planned(self, mock_body, mock_beat):
+        beaten = threading.Event()
+        mock_beat.side_effect = lambda job: beaten.set()
+
+        def slow_body(arguments):
+            beaten.wait(5)
+            return PrerenderedJSON(b"{}")
+
+        mock_body.side_effect = slow_body
+        submit_plan_job(self.lanes[:1])
+        with patch("calculator.jobs.HEARTBEAT_INTERVAL", timedelta(milliseconds=10)):
+            run_plan_job(claim_next_job("test"))
+
+        self.assertTrue(beaten.is_set())
+
+
+class StartupCostTests(CalculatorTestCase):
+    def test_web_worker_imports_skip_ingestion_dependencies(self):
+        script = (
+            "import sys, django; django.setup(); from django.conf import settings; "
+            "__import__(settings.ROOT_URLCONF); print('pandas' in sys.modules, 'numpy' in sys.modules)"
+        )
+        # The child process reads DJANGO_SETTINGS_MODULE from the environment, as this one did.
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+
+        self.assertEqual(result.stdout.strip(), "False False", result.stderr)
+
+    def test_ingestion_helpers_still_importable_from_utils(self):
+        from calculator import ingest, utils
+
+        self.assertIs(utils.load_fuel_data, ingest.load_fuel_data)
+
+
+class StationListAPITests(CalculatorTestCase):
+    def setUp(self):
+        stations = [
+            # (id, lat, lng, state, price)
+            (40, 35.2, -101.8, "TX", "3.100000"),
+            (41, 32.7, -96.8, "TX", "2.900000"),
+            (42, 35.4, -97.5, "OK", "2.900000"),
+            (43, 39.7, -105.0, "CO", "3.500000"),
+        ]
+        for station_id, lat, lng, state, price in stations:
+            FuelPrice.objects.create(
+                opis_truckstop_id=station_id, truckstop_name=f"Stop {station_id}", address="",
+                city="City", state=state, rack_id=1, retail_price=price, latitude=lat, longitude=lng,
+            )
+        FuelPrice.objects.create(
+            opis_truckstop_id=44, truckstop_name="Not geocoded", address="", city="City",
+            state="TX", rack_id=1, retail_price="1.000000",
+        )
+        self.url = reverse("stations")
+
+    def names(self, response):
+        return [station["truckstop_name"] for station in response.json()["results"]]
+
+    def test_keyset_pages_follow_price_then_id(self):
+        response = self.client.get(self.url, {"limit": 2})
+        self.assertEqual(self.names(response), ["Stop 41", "Stop 42"])
+
+        response = self.client.get(response.json()["next"])
+        self.assertEqual(self.names(response), ["Stop 40", "Stop 43"])
+        self.assertIsNone(response.json()["next"])
+
+    def test_filters(self):
+        response = self.client.get(self.url, {"bbox": "-103,32,-96,36", "state": "tx", "max_price": "3.00"})
+
+        self.assertEqual(self.names(response), ["Stop 41"])
+        self.assertEqual(response.json()["results"][0]["retail_price"], 2.9)
+
+    def test_invalid_query(self):
+        for params in ({"bbox": "1,2,3"}, {"limit": 0}, {"cursor": "%%%"}, {"min_price": "cheap"}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+    def test_bbox_must_be_finite_and_is_clamped_to_the_globe(self):
+        for bbox in ("nan,32,-96,36", "-103,32,inf,36"):
+            self.assertEqual(self.client.get(self.url, {"bbox": bbox}).status_code, 400, bbox)
+
+        response = self.client.get(self.url, {"bbox": "-1e300,-1e300,1e300,1e300"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 4)
+
+    def test_revalidation_until_prices_change(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        FuelPrice.objects.filter(opis_truckstop_id=40).get().delete()
+        reload_station_snapshot()  # scheduled once the delete commits
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 3)
+
+
+class PriceTileTests(CalculatorTestCase):
+    def setUp(self):
+        stations = [
+            # (id, lat, lng, price): two stations share the Oklahoma City cell.
+            (50, 35.47, -97.52, "3.000000"),
+            (51, 35.46, -97.51, "2.000000"),
+            (52, 32.78, -96.80, "3.500000"),
+        ]
+        for station_id, lat, lng, price in stations:
+            FuelPrice.objects.create(
+                opis_truckstop_id=station_id, truckstop_name=f"Stop {station_id}", address="",
+                city="City", state="OK", rack_id=1, retail_price=price, latitude=lat, longitude=lng,
+            )
+        self.cell = encode_geohash(35.47, -97.52, 3)
+
+    def test_aggregates_follow_price_changes(self):
+        tile = PriceTile.objects.get(geohash=self.cell)
+        self.assertEqual((tile.count, tile.min_price_micros, tile.total_price_micros), (2, 2000000, 5000000))
+
+        FuelPrice.objects.filter(opis_truckstop_id=51).get().delete()
+        tile = PriceTile.objects.get(geohash=self.cell)
+        self.assertEqual((tile.count, tile.min_price_micros), (1, 3000000))
+
+    def test_json_and_binary_tiles(self):
+        url = reverse("price_tile", args=[3, self.cell[:1]])
+        response = self.client.get(url)
+        cell = next(cell for cell in response.json()["cells"] if cell["geohash"] == self.cell)
+        self.assertEqual((cell["count"], cell["min_price"], cell["avg_price"]), (2, 2.0, 2.5))
+        self.assertIn("max-age=86400", response["Cache-Control"])
+
+        body = self.client.get(url, {"format": "bin"}).content
+        precision, count = struct.unpack_from("<BI", body)
+        records = [struct.unpack_from("<3sIII", body, 5 + i * 15) for i in range(count)]
+        self.assertEqual(precision, 3)
+        self.assertIn((self.cell.encode(), 2, 2000000, 2500000), records)
+
+    def test_revalidation_and_validation(self):
+        url = reverse("price_tiles", args=[2])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(url, {"format": "bin"})["ETag"], etag)
+
+        self.assertEqual(self.client.get(reverse("price_tiles", args=[9])).status_code, 400)
+        self.assertEqual(self.client.get(reverse("price_tile", args=[3, "9va"])).status_code, 400)
+
+
+class UpstreamReplayTests(CalculatorTestCase):
+    url = "https://maps.googleapis.com/maps/api/directions/json"
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.route = {"routes": [{"summary": "I-35", "legs": []}]}
+
+    def settings(self, mode, **overrides):
+        return override_settings(UPSTREAM_REPLAY_MODE=mode, UPSTREAM_REPLAY_DIR=self.directory, **overrides)
+
+    def record_route(self):
+        live = requests.models.Response()
+        live.status_code = 200
+        live._content = json.dumps(self.route).encode()
+        live.headers["Content-Type"] = "application/json"
+        live.elapsed = timedelta(seconds=0.2)
+        with self.settings("record"), patch("requests.get", return_value=live):
+            get_route("Dallas, TX", "Austin, TX")
+
+    def test_recorded_routes_replay_offline(self):
+        self.record_route()
+        (fixture,) = os.listdir(self.directory)
+        with open(os.path.join(self.directory, fixture)) as handle:
+            self.assertNotIn(GOOGLE_MAPS_API_KEY, handle.read())
+
+        with self.settings("replay"), patch("requests.get") as live_get:
+            self.assertEqual(get_route("Dallas, TX", "Austin, TX"), self.route)
+        live_get.assert_not_called()
+
+    def test_injected_latency_and_timeouts(self):
+        self.record_route()
+        params = {"origin": "Dallas, TX", "destination": "Austin, TX"}
+
+        with self.settings("replay", UPSTREAM_REPLAY_LATENCY="0.05"):
+            started = time.monotonic()
+            upstream_get(self.url, params, timeout=1)
+            self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+            with self.assertRaises(requests.exceptions.Timeout):
+                upstream_get(self.url, params, timeout=0.01)
+
+        with self.settings("replay", UPSTREAM_REPLAY_LATENCY="recorded"):
+            self.assertEqual(upstream_get(self.url, params).elapsed, timedelta(seconds=0.2))
+
+    def test_injected_failures_and_missing_fixtures(self):
+        self.record_route()
+        params = {"origin": "Dallas, TX", "destination": "Austin, TX"}
+
+        with self.settings("replay", UPSTREAM_REPLAY_FAILURE_RATE=1.0):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                upstream_get(self.url, params)
+        with self.settings("replay"):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                upstream_get(self.url, {"origin": "Tulsa, OK", "destination": "Austin, TX"})
+
+    def test_unknown_mode_is_rejected(self):
+        with self.settings("replya"), patch("requests.get") as live_get:
+            with self.assertRaises(ImproperlyConfigured):
+                upstream_get(self.url, {"origin": "Dallas, TX", "destination": "Austin, TX"})
+        live_get.assert_not_called()
+
+
+class LoadTestHarnessTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fake_directions_server_feeds_the_planner(self):
+        FuelPrice.objects.create(
+            opis_truckstop_id=60, truckstop_name="Stop 60", address="", city="City", state="TX",
+            rack_id=1, retail_price="3.000000", latitude=38.0, longitude=-97.0,
+        )
+        with FakeDirectionsServer() as upstream, override_settings(DIRECTIONS_API_URL=upstream.url):
+            route = get_route("Load Origin 1", "Load Destination 1", alternatives=True)
+            self.assertEqual(upstream.calls, 1)
+
+        self.assertEqual([r["summary"] for r in route["routes"]], ["Direct", "Scenic"])
+        stops, _ = calculate_fuel_stops(route, max_range=100)
+        self.assertTrue(stops)
+
+    def test_summary_percentiles_and_ratios(self):
+        results = [
+            (i / 100, 200 if i < 99 else 500, Counter(db_queries=1, response_cache_hits=int(i >= 20)))
+            for i in range(1, 101)
+        ]
+        for latency, status, metrics in results:
+            metrics["response_cache_misses"] = 1 - metrics["response_cache_hits"]
+
+        report = summarize(results, elapsed=2.0)
+
+        self.assertEqual((report["throughput"], report["errors"]), (50.0, 2))
+        self.assertEqual((report["latency_p50"], report["latency_p99"]), (0.5, 0.99))
+        self.assertEqual(report["response_cache_hit_ratio"], 0.81)
+        self.assertIsNone(report["route_cache_hit_ratio"])
+
+    @override_settings(REQUEST_METRICS=True)
+    @patch("calculator.planning.get_cached_trip_route")
+    def test_request_metrics_header(self, mock_route):
+        mock_route.return_value = {"routes": [{"legs": [], "overview_polyline": {"points": ""}}]}
+        data = {"start_address": "Dallas, TX", "finish_address": "Austin, TX"}
+
+        headers = [
+            parse_metrics(self.client.post(reverse("route_fuel_stops"), data, content_type="application/json")[
+                "X-Request-Metrics"
+            ])
+            for _ in range(2)
+        ]
+
+        self.assertEqual(headers[0]["response_cache_misses"], 1)
+        self.assertEqual(headers[1]["response_cache_hits"], 1)
+
+
+class RouteProjectionTests(CalculatorTestCase):
+    def setUp(self):
+        # East-west route along 35N, refuelling at -99.0 before it continues to -98.0.
+        self.projection = RouteProjection([(35.0, -101.0), (35.0, -100.0), (35.0, -99.0), (35.0, -98.0)])
+        stations = [
+            # (id, lat, lng, price)
+            (70, 35.00, -99.30, "3.000000"),  # on the route, 17 miles back
+            (71, 35.25, -99.00, "2.900000"),  # 17 miles off the route
+            (72, 35.00, -98.80, "1.000000"),  # on the route, past the refuelling point
+        ]
+        for station_id, lat, lng, price in stations:
+            FuelPrice.objects.create(
+                opis_truckstop_id=station_id, truckstop_name=f"Stop {station_id}", address="",
+                city="City", state="OK", rack_id=1, retail_price=price, latitude=lat, longitude=lng,
+            )
+
+    def test_offsets_and_distances(self):
+        lats, lngs = [35.1, 35.0, 34.0], [-100.5, -98.0, -99.0]
+        offsets, distances = self.projection.project(lats, lngs)
+
+        self.assertAlmostEqual(offsets[0], self.projection.length / 6, delta=0.5)
+        self.assertAlmostEqual(distances[0], 6.9, delta=0.1)
+        self.assertAlmostEqual(offsets[1], self.projection.length)
+        self.assertAlmostEqual(distances[2], 69.05, delta=0.1)
+
+        if projection.load_numpy() is not None:
+            segments = range(3)
+            python = self.projection._project_python(lats, lngs, segments)
+            vectorized = self.projection._project_vectorized(lats, lngs, segments)
+            for expected, actual in zip(sum(python, []), sum(vectorized, [])):
+                self.assertAlmostEqual(expected, actual)
+
+    def test_detour_measured_from_route(self):
+        snapshot = get_station_snapshot()
+
+        radial = rank_candidates(snapshot, 35.0, -99.0, gallons=50, k=3)
+        self.assertEqual(snapshot.station(radial[0]["index"])["truckstop_name"], "Stop 72")
+
+        ranked = rank_candidates(snapshot, 35.0, -99.0, gallons=50, k=3, projection=self.projection)
+        self.assertEqual(
+            [snapshot.station(candidate["index"])["truckstop_name"] for candidate in ranked], ["Stop 70", "Stop 71"],
+        )
+        self.assertAlmostEqual(ranked[0]["detour_miles"], 0)
+        self.assertAlmostEqual(ranked[0]["backtrack_miles"], 17.0, delta=0.2)
+        self.assertAlmostEqual(ranked[1]["detour_miles"], 34.5, delta=0.2)
+
+    def test_from_route_follows_step_polylines(self):
+        # One step whose road bends 0.5 degrees north of its chord.
+        step = {
+            "distance": {"value": 120000},
+            "start_location": {"lat": 35.0, "lng": -101.0},
+            "end_location": {"lat": 35.0, "lng": -100.0},
+            "polyline": {"points": encode_polyline([(35.0, -101.0), (35.5, -100.5), (35.0, -100.0)])},
+        }
+        projection = RouteProjection.from_route({"routes": [{"legs": [{"steps": [step]}]}]})
+
+        self.assertEqual(len(projection.latitudes), 3)
+        _, distances = projection.project([35.5], [-100.5])
+        self.assertAlmostEqual(distances[0], 0)
+
+    def test_vectorized_projection_in_chunks(self):
+        if projection.load_numpy() is None:
+            self.skipTest("numpy is not installed")
+        lats, lngs = [35.1, 35.0, 34.0], [-100.5, -98.0, -99.0]
+        expected = self.projection.project(lats, lngs)
+        with patch("calculator.projection.PROJECTION_CHUNK_CELLS", 3):
+            self.assertEqual(self.projection.project(lats, lngs), expected)
+
+
+class SnapshotReloadTests(CalculatorTestCase):
+    def setUp(self):
+        FuelPrice.objects.create(
+            opis_truckstop_id=80, truckstop_name="Stop 80", address="", city="City", state="TX",
+            rack_id=1, retail_price="3.000000", latitude=35.0, longitude=-101.0,
+        )
+
+    def change_prices_elsewhere(self):
+        # Another process: a bulk update that only bumps the version row.
+        FuelPrice.objects.update(retail_price="2.500000")
+        DatasetVersion.objects.filter(name=FUEL_PRICES_DATASET).update(version=F("version") + 1)
+
+    def test_reload_swaps_in_new_dataset(self):
+        snapshot = get_station_snapshot()
+        self.assertFalse(reload_station_snapshot())
+
+        self.change_prices_elsewhere()
+        self.assertIs(get_station_snapshot(), snapshot)  # still served until rebuilt
+        self.assertTrue(reload_station_snapshot())
+
+        reloaded = get_station_snapshot()
+        self.assertIsNot(reloaded, snapshot)
+        self.assertEqual(list(reloaded.price_micros), [2500000])
+        self.assertEqual(list(snapshot.price_micros), [3000000])
+
+    def test_price_change_schedules_reload_and_keeps_serving(self):
+        snapshot = get_station_snapshot()
+        with self.captureOnCommitCallbacks() as callbacks:
+            FuelPrice.objects.update(retail_price="2.500000")
+            snapshot_module.bump_dataset_version()
+
+        self.assertEqual(callbacks, [snapshot_module.schedule_snapshot_reload])
+        self.assertIs(get_station_snapshot(), snapshot)
+        self.assertTrue(reload_station_snapshot())
+        self.assertEqual(list(get_station_snapshot().price_micros), [2500000])
+
+    @override_settings(SNAPSHOT_POLL_INTERVAL=0.01)
+    def test_poll_schedules_background_reload(self):
+        get_station_snapshot()
+        with patch.object(snapshot_module, "_next_poll", 0), \
+                patch.object(snapshot_module, "_reload_pending", threading.Event()), \
+                patch.object(snapshot_module, "_reload_executor") as executor:
+            get_station_snapshot()
+            get_station_snapshot()
+        executor.submit.assert_called_once()
+
+    def test_listener_closes_broken_connection_before_reconnecting(self):
+        class StopListening(BaseException):
+            pass
+
+        broken = MagicMock()
+        broken.cursor.side_effect = RuntimeError("connection lost")
+        with patch.object(snapshot_module.connection, "get_connection_params", return_value={}), \
+                patch.object(snapshot_module.connection, "get_new_connection", side_effect=[broken, StopListening]), \
+                patch.object(snapshot_module.time, "sleep"), \
+                self.assertLogs("calculator.snapshot", "ERROR"), self.assertRaises(StopListening):
+            snapshot_module._listen()
+
+        broken.close.assert_called_once()
+
+    def test_reload_failure_is_logged(self):
+        with patch.object(snapshot_module, "reload_station_snapshot", side_effect=RuntimeError("database gone")), \
+                self.assertLogs("calculator.snapshot", "ERROR") as logs:
+            # On its own thread, as in production: it closes that thread's connection.
+            thread = threading.Thread(target=snapshot_module._reload_in_background)
+            thread.start()
+            thread.join()
+
+        self.assertIn("database gone", "\n".join(logs.output))
+
+
+class StationPriceTests(CalculatorTestCase):
+    def setUp(self):
+        self.stations = []
+        for station_id, lng, price in [(90, -101.0, "3.000000"), (91, -101.05, "3.100000")]:
+            self.stations.append(FuelPrice.objects.create(
+                opis_truckstop_id=station_id, truckstop_name=f"Stop {station_id}", address="", city="City",
+                state="TX", rack_id=1, retail_price=price, latitude=35.0, longitude=lng,
+            ))
+        StationPrice.objects.create(station=self.stations[1], program="fleetone", price="2.700000")
+        StationPrice.objects.create(station=self.stations[0], product=StationPrice.DEF, price="4.000000")
+
+    def test_retail_price_is_mirrored(self):
+        self.assertEqual(
+            StationPrice.objects.get(station=self.stations[0], product=StationPrice.DIESEL, program="").price,
+            Decimal("3.000000"),
+        )
+        self.stations[0].retail_price = Decimal("2.950000")
+        self.stations[0].save()
+        self.assertEqual(
+            StationPrice.objects.get(station=self.stations[0], product=StationPrice.DIESEL, program="").price,
+            Decimal("2.950000"),
+        )
+
+    def test_program_prices_fall_back_to_retail(self):
+        snapshot = get_station_snapshot()
+        order = [snapshot.station(index)["truckstop_name"] for index in range(len(snapshot))]
+        diesel = dict(zip(order, snapshot.prices_for()))
+        fleet = dict(zip(order, snapshot.prices_for(StationPrice.DIESEL, "fleetone")))
+        unknown = dict(zip(order, snapshot.prices_for(StationPrice.DIESEL, "other")))
+        exhaust_fluid = dict(zip(order, snapshot.prices_for(StationPrice.DEF)))
+
+        self.assertEqual(diesel, {"Stop 90": 3000000, "Stop 91": 3100000})
+        self.assertEqual(fleet, {"Stop 90": 3000000, "Stop 91": 2700000})
+        self.assertEqual(unknown, diesel)
+        self.assertEqual(exhaust_fluid, {"Stop 90": 4000000, "Stop 91": snapshot_module.NO_PRICE})
+        with self.assertRaises(ValueError):
+            snapshot.prices_for(StationPrice.GASOLINE)
+
+    def test_program_discount_changes_the_stop(self):
+        route = {"routes": [{"legs": [{"steps": [
+            {"distance": {"value": 804672}, "start_location": {"lat": 35.0, "lng": -103.0},
+             "end_location": {"lat": 35.0, "lng": -101.0}},
+        ]}]}]}
+
+        stops, _ = calculate_fuel_stops(route, max_range=500, mpg=10)
+        self.assertEqual(stops[0]["truckstop_name"], "Stop 90")
+
+        stops, cost_micros = calculate_fuel_stops(route, max_range=500, mpg=10, program="fleetone")
+        self.assertEqual(stops[0]["truckstop_name"], "Stop 91")
+        self.assertEqual(stops[0]["retail_price_micros"], 2700000)
+        self.assertEqual(cost_micros, 2700000 * 50)
+
+    def test_parse_price_options(self):
+        self.assertEqual(parse_price_options({}), {})
+        self.assertEqual(parse_price_options({"product": "diesel", "program": ""}), {})
+        self.assertEqual(
+            parse_price_options({"product": "def", "program": " FleetOne "}), {"product": "def", "program": "fleetone"},
+        )
+        with self.assertRaises(ValueError):
+            parse_price_options({"product": "kerosene"})
+        with self.assertRaises(ValueError):
+            parse_price_options({"product": StationPrice.GASOLINE})
+
+        response = Client().post(
+            reverse("route_fuel_stops"),
+            {"start_address": "A", "finish_address": "B", "product": StationPrice.GASOLINE},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "No station has a price for gasoline."})
+
+        response = Client().post(
+            reverse("route_fuel_stops"),
+            {"start_address": "A", "finish_address": "B", "program": "x" * 50},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_station_prices(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as handle:
+            handle.write(
+                "OPIS Truckstop ID,Product,Program,Price\n"
+                "90,Diesel,,2.900000\n"
+                "90,Diesel,FleetOne,2.600000\n"
+                "91,Kerosene,,5.000000\n"
+                "99,Diesel,,1.000000\n"
+                "n/a,Diesel,,1.000000\n"
+                "91,Diesel,,cheap\n"
+                "91,Diesel,,NaN\n"
+            )
+        self.addCleanup(os.remove, handle.name)
+
+        version = get_station_snapshot().version
+        stdout = StringIO()
+        call_command("import_station_prices", handle.name, stdout=stdout)
+        reload_station_snapshot()  # scheduled once the import commits
+
+        self.assertIn("(5 rows skipped)", stdout.getvalue())
+        self.stations[0].refresh_from_db()
+        self.assertEqual(self.stations[0].retail_price, Decimal("2.900000"))
+        tile = PriceTile.objects.get(geohash=self.stations[0].geohash[:3])
+        self.assertEqual(tile.min_price_micros, 2900000)
+        self.assertEqual(
+            StationPrice.objects.get(station=self.stations[0], program="fleetone").price, Decimal("2.600000"),
+        )
+        self.assertNotEqual(get_station_snapshot().version, version)
+
+
+class QueryPlanTests(CalculatorTestCase):
+    """EXPLAIN every query of the hot paths against a synthetic dataset at scale."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        stations = []
+        for station_id in range(5000):
+            lat, lng = rng.uniform(30.0, 47.0), rng.uniform(-120.0, -75.0)
+            stations.append(FuelPrice(
+                opis_truckstop_id=station_id, truckstop_name=f"Stop {station_id}", address="", city="City",
+                state="TX", rack_id=1, retail_price=Decimal("3.000000") + Decimal(station_id % 100) / 100,
+                latitude=lat, longitude=lng, geohash=station_geohash(lat, lng),
+            ))
+        FuelPrice.objects.bulk_create(stations)
+        refresh_price_tiles()
+        PlanJob.objects.bulk_create([PlanJob(lanes=[], status=PlanJob.DONE) for _ in range(2000)])
+        PlanJob.objects.create(lanes=[])
+        analyze()
+
+    def assertIndexed(self, queries):
+        for query in queries:
+            if query.explained:
+                self.assertEqual(query.sequential_scans, [], query)
+                self.assertTrue(query.indexes, query)
+
+    @patch("calculator.routing.get_route", side_effect=lambda start, finish, *args, **kwargs: fake_directions(start, finish))
+    def test_cached_route_plan_query_budget(self, mock_get_route):
+        cache.clear()
+        get_station_snapshot()
+        client = Client()
+        for lane in range(3):
+            with capture_queries() as queries:
+                response = client.post(reverse("route_fuel_stops"), lane_request(lane), content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(queries), 2, queries)
+            self.assertIndexed(queries)
+        self.assertEqual(mock_get_route.call_count, 3)
+
+        # With the default cache backend a cached response costs no queries at all.
+        with capture_queries() as queries:
+            response = client.post(reverse("route_fuel_stops"), lane_request(0), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_snapshot_scans_only_the_stations(self):
+        with capture_queries() as queries:
+            StationSnapshot.from_queryset()
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(sum((query.sequential_scans for query in queries), []), ["calculator_fuelprice"])
+
+    def test_lookups_use_indexes(self):
+        lookups = [
+            lambda: price_tile(4, "9v"),
+            lambda: price_tile(3, "dz"),
+            claim_next_job,
+            get_dataset_version,
+            lambda: ImportCheckpoint.objects.filter(file_hash="0" * 64).first(),
+        ]
+        for lookup in lookups:
+            with capture_queries() as queries:
+                lookup()
+            self.assertIndexed(queries)
+
+
+def straight_route(lat, start_lng, end_lng, step_degrees=0.5, mph=60):
+    """Directions payload driving along a parallel in `step_degrees` steps."""
+    points = [start_lng + step_degrees * i for i in range(int(round((end_lng - start_lng) / step_degrees)) + 1)]
+    steps = []
+    for lng_a, lng_b in zip(points, points[1:]):
+        miles = (lng_b - lng_a) * 69.05 * 0.8192
+        steps.append({
+            "distance": {"value": int(miles * 1609.344)},
+            "duration": {"value": int(miles / mph * 3600)},
+            "start_location": {"lat": lat, "lng": lng_a},
+            "end_location": {"lat": lat, "lng": lng_b},
+        })
+    return {"status": "OK", "routes": [{"legs": [{"steps": steps}], "overview_polyline": {"points": ""}}]}
+
+
+class TripTrackingTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+        # A station every 0.25 degrees (~14 miles) along 35N, the ones on
+        # whole degrees cheaper.
+        for number in range(61):
+            lng = -105.0 + number * 0.25
+            FuelPrice.objects.create(
+                opis_truckstop_id=100 + number, truckstop_name=f"Stop {number}", address="", city="City",
+                state="NM", rack_id=1, retail_price="3.000000" if number % 4 else "2.500000",
+                latitude=35.01, longitude=lng,
+            )
+        patcher = patch("calculator.routing.get_route", return_value=straight_route(35.0, -105.0, -90.0))
+        self.mock_get_route = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_trip(self, **data):
+        response = Client().post(
+            reverse("trips"), {"start_address": "Albuquerque, NM", "finish_address": "Memphis, TN", **data},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def report(self, trip, lng, **fuel):
+        return Client().post(
+            reverse("trip_position", args=[trip]), {"latitude": 35.0, "longitude": lng, **fuel},
+            content_type="application/json",
+        )
+
+    def test_trip_is_planned_from_the_start(self):
+        body = self.start_trip()
+
+        # 850 miles on a 500-mile tank: one stop, at a cheaper station.
+        self.assertEqual(len(body["fuel_stops"]), 1)
+        self.assertEqual(Decimal(str(body["next_stop"]["retail_price"])), Decimal("2.5"))
+        self.assertLessEqual(body["next_stop"]["miles_ahead"], 500)
+        self.assertAlmostEqual(body["minutes_to_empty"], 500, delta=5)
+        self.assertTrue(body["reachable"])
+        self.assertEqual(Trip.objects.get(pk=body["trip"]).fuel_stops[0]["truckstop_name"], body["next_stop"]["truckstop_name"])
+
+    def test_position_updates_replan_ahead_without_the_route(self):
+        trip = self.start_trip()["trip"]
+
+        body = self.report(trip, -101.0, fuel_level=0.2).json()
+        self.assertAlmostEqual(body["offset_miles"], 4 * 56.56, delta=1)
+        self.assertLessEqual(body["next_stop"]["miles_ahead"], body["miles_to_empty"])
+        self.assertEqual(len(body["fuel_stops"]), 2)
+
+        body = self.report(trip, -93.0, fuel_gallons=40).json()
+        self.assertEqual(body["fuel_stops"], [])
+        self.assertIsNone(body["next_stop"])
+        self.assertAlmostEqual(body["remaining_miles"], 3 * 56.56, delta=1)
+        self.assertEqual(self.mock_get_route.call_count, 1)
+
+        stored = Client().get(reverse("trip", args=[trip])).json()
+        self.assertEqual((stored["longitude"], stored["fuel_gallons"], stored["fuel_stops"]), (-93.0, 40, []))
+
+    def test_unchanged_next_stop_keeps_the_rest_of_the_plan(self):
+        trip = self.start_trip(max_range=200, mpg=5)["trip"]
+        tracker = get_tracker(trip)
+        first = tracker.update(35.0, -104.0, 30)
+        plan = tracker.plan
+
+        second = tracker.update(35.0, -103.9, 29)
+        self.assertEqual(second["stops"][0]["truckstop_name"], first["stops"][0]["truckstop_name"])
+        self.assertIs(tracker.plan[1], plan[1])
+        self.assertLess(second["stops"][0]["gallons"], first["stops"][0]["gallons"] + 1)
+
+    def test_position_validation(self):
+        trip = self.start_trip()["trip"]
+        self.assertEqual(self.report(trip, -101.0).status_code, 400)
+        self.assertEqual(self.report(trip, -101.0, fuel_gallons=80).status_code, 400)
+        self.assertEqual(self.report(trip + 1, -101.0, fuel_level=0.5).status_code, 404)
+
+
+class ParallelPlanningTests(CalculatorTestCase):
+    def setUp(self):
+        cache.clear()
+        rng = random.Random(1)
+        for station_id in range(400):
+            FuelPrice.objects.create(
+                opis_truckstop_id=station_id, truckstop_name=f"Stop {station_id}", address="", city="City",
+                state="TX", rack_id=1, retail_price=f"{rng.uniform(2.5, 4):.6f}",
+                latitude=rng.uniform(30.0, 47.0), longitude=rng.uniform(-120.0, -75.0),
+            )
+        StationPrice.objects.create(station=FuelPrice.objects.first(), program="fleetone", price="1.000000")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_snapshot_file_maps_the_same_data(self):
+        snapshot = get_station_snapshot()
+        with override_settings(SNAPSHOT_EXPORT_DIR=self.directory):
+            path = export_station_snapshot(snapshot)
+            self.assertEqual(export_station_snapshot(snapshot), path)
+        mapped = StationSnapshot.from_file(path)
+
+        self.assertEqual(mapped.version, snapshot.version)
+        for column in ("ids", "latitudes", "longitudes", "price_micros"):
+            self.assertEqual(list(getattr(mapped, column)), list(getattr(snapshot, column)))
+        self.assertIsInstance(mapped.latitudes, memoryview)
+        self.assertEqual(list(mapped.prices_for(program="fleetone")), list(snapshot.prices_for(program="fleetone")))
+        self.assertEqual(mapped.station(3), snapshot.station(3))
+        self.assertEqual(list(mapped.within(40.0, -100.0, 200)), list(snapshot.within(40.0, -100.0, 200)))
+
+    def test_empty_snapshot_is_exported_as_given(self):
+        empty = StationSnapshot.from_queryset(FuelPrice.objects.none())
+        with override_settings(SNAPSHOT_EXPORT_DIR=self.directory):
+            mapped = StationSnapshot.from_file(export_station_snapshot(empty))
+
+        self.assertEqual((len(mapped), mapped.version), (0, empty.version))
+
+    def test_packed_route_plans_the_same(self):
+        route = fake_directions("Load Origin 1", "Load Destination 1")
+        self.assertEqual(
+            calculate_fuel_stops(unpack_route(pack_route(route)), max_range=200),
+            calculate_fuel_stops(route, max_range=200),
+        )
+
+    @patch("calculator.routing.get_route", side_effect=lambda start, finish, *args, **kwargs: fake_directions(start, finish))
+    def test_job_planned_in_processes(self, mock_get_route):
+        lanes = [dict(lane_request(lane), max_range=200) for lane in range(4)]
+        expected = [json.loads(bytes(route_response_body(parse_route_request(lane)))) for lane in lanes]
+        cache.clear()
+
+        with override_settings(SNAPSHOT_EXPORT_DIR=self.directory):
+            job = run_plan_job(submit_plan_job(lanes), workers=2, processes=2)
+
+        self.assertEqual(job.status, PlanJob.DONE)
+        self.assertEqual([result.result for result in job.results.all()], expected)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
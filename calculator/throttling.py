@@ -0,0 +1,26 @@
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class APIKeyRateThrottle(SimpleRateThrottle):
+    """
+    Per-client throttle for route planning, keyed on the X-API-Key header
+    when it is one of settings.API_KEYS and on the client IP otherwise, so
+    made-up keys cannot each claim a fresh budget.
+    """
+
+    scope = "route_fuel_stops"
+
+    def get_cache_key(self, request, view):
+        api_key = request.META.get("HTTP_X_API_KEY")
+        if api_key and api_key in getattr(settings, "API_KEYS", ()):
+            ident = f"key:{api_key}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class PlanJobRateThrottle(APIKeyRateThrottle):
+    """The same per-client throttle for submitting plan jobs."""
+
+    scope = "plan_jobs"
@@ -0,0 +1,131 @@
+import struct
+
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import Substr
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .geometry import GEOHASH_ALPHABET, encode_geohash
+from .models import FuelPrice, PriceTile
+from .pricing import to_micros
+
+# Geohash length stored on every station, and the aggregate levels kept in
+# PriceTile (2 ~ 1250 km cells for the national view down to 5 ~ 5 km).
+STATION_GEOHASH_PRECISION = 7
+TILE_PRECISIONS = (2, 3, 4, 5)
+
+# Binary tile layout: header (precision, cell count) then one record per
+# cell of geohash bytes, station count, min and average price in micros.
+TILE_HEADER = struct.Struct("<BI")
+
+
+def station_geohash(lat, lng):
+    if lat is None or lng is None:
+        return ""
+    return encode_geohash(lat, lng, STATION_GEOHASH_PRECISION)
+
+
+def refresh_price_tiles(geohashes=None):
+    """
+    Recompute the PriceTile aggregates of every cell containing one of the
+    station `geohashes`, or of all cells when it is None.
+
+    Only the touched cells are re-aggregated, so an import batch costs one
+    grouped query per precision.
+    """
+    if geohashes is not None:
+        geohashes = {geohash for geohash in geohashes if geohash}
+        if not geohashes:
+            return
+
+    tiles = []
+    cells = set()
+    for precision in TILE_PRECISIONS:
+        rows = FuelPrice.objects.exclude(geohash="").annotate(cell=Substr("geohash", 1, precision))
+        if geohashes is not None:
+            level = {geohash[:precision] for geohash in geohashes}
+            cells.update(level)
+            rows = rows.filter(cell__in=level)
+        aggregates = rows.values("cell").annotate(
+            count=Count("id"), min_price=Min("retail_price"), total_price=Sum("retail_price"),
+        )
+        for row in aggregates.order_by():
+            tiles.append(PriceTile(
+                geohash=row["cell"],
+                precision=precision,
+                count=row["count"],
+                min_price_micros=to_micros(row["min_price"]),
+                total_price_micros=to_micros(row["total_price"]),
+            ))
+
+    with transaction.atomic():
+        stale = PriceTile.objects.all()
+        if geohashes is not None:
+            stale = stale.filter(geohash__in=cells)
+        stale.delete()
+        PriceTile.objects.bulk_create(tiles)
+
+
+def parse_tile(precision, prefix=""):
+    """Validate a tile request. Raises ValueError with a client message."""
+    if precision not in TILE_PRECISIONS:
+        raise ValueError(f"precision must be one of: {', '.join(map(str, TILE_PRECISIONS))}.")
+    prefix = prefix.lower()
+    if len(prefix) >= precision or any(char not in GEOHASH_ALPHABET for char in prefix):
+        raise ValueError(f"tile must be a geohash shorter than {precision} characters.")
+    return precision, prefix
+
+
+def _next_geohash(prefix):
+    """Smallest geohash after every cell inside `prefix`, "" if there is none."""
+    while prefix and prefix[-1] == GEOHASH_ALPHABET[-1]:
+        prefix = prefix[:-1]
+    if not prefix:
+        return ""
+    return prefix[:-1] + GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(prefix[-1]) + 1]
+
+
+def price_tile(precision, prefix=""):
+    """
+    `(geohash, count, min_price_micros, avg_price_micros)` of the cells of
+    `precision` inside the geohash `prefix`.
+    """
+    rows = PriceTile.objects.filter(precision=precision)
+    if prefix:
+        # A range rather than startswith: LIKE 'prefix%' cannot use the
+        # (precision, geohash) index.
+        rows = rows.filter(geohash__gte=prefix)
+        upper = _next_geohash(prefix)
+        if upper:
+            rows = rows.filter(geohash__lt=upper)
+    return [
+        (geohash, count, min_price, (total + count // 2) // count)
+        for geohash, count, min_price, total in rows.order_by("geohash").values_list(
+            "geohash", "count", "min_price_micros", "total_price_micros",
+        )
+    ]
+
+
+def encode_price_tile(precision, cells):
+    """Pack `price_tile` cells into the little-endian binary tile format."""
+    record = struct.Struct(f"<{precision}sIII")
+    body = bytearray(TILE_HEADER.pack(precision, len(cells)))
+    for geohash, count, min_price, avg_price in cells:
+        body += record.pack(geohash.encode("ascii"), count, min_price, avg_price)
+    return bytes(body)
+
+
+@receiver(pre_save, sender=FuelPrice)
+def _set_station_geohash(sender, instance, **kwargs):
+    # Remember the old cell so a moved station is removed from it.
+    instance._previous_geohash = ""
+    if instance.pk is not None:
+        instance._previous_geohash = sender.objects.filter(pk=instance.pk).values_list("geohash", flat=True).first()
+    instance.geohash = station_geohash(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=FuelPrice)
+@receiver(post_delete, sender=FuelPrice)
+def _refresh_station_tiles(sender, instance, **kwargs):
+    refresh_price_tiles([instance.geohash, getattr(instance, "_previous_geohash", "")])
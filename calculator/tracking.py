@@ -0,0 +1,337 @@
+import bisect
+import threading
+from collections import OrderedDict
+
+from django.utils import timezone
+
+from .geometry import METERS_PER_MILE, decode_polyline, encode_polyline
+from .models import StationPrice, Trip
+from .prices import parse_price_options
+from .pricing import fuel_cost_micros, to_micros
+from .projection import RouteProjection
+from .ranking import DEFAULT_DETOUR_COST_PER_MILE_MICROS, DEFAULT_SEARCH_RADIUS_MILES
+from .responses import parse_plan_options, parse_waypoints
+from .routing import get_cached_trip_route
+from .snapshot import NO_PRICE, get_station_snapshot
+
+DEFAULT_MAX_RANGE = 500
+DEFAULT_MPG = 10
+
+# Stations farther off the route are never worth the detour.
+CORRIDOR_MILES = 20
+
+# A ping is first projected onto the route around the previous position:
+# this far behind it and this far ahead of it.
+PING_WINDOW_BEHIND_MILES = 5
+PING_WINDOW_AHEAD_MILES = 100
+# Farther off the window, the truck has left the expected stretch and the
+# whole route is searched.
+OFF_ROUTE_MILES = 2
+
+# Trip trackers kept in memory per process, least recently used dropped first.
+MAX_TRACKED_TRIPS = 10000
+
+_trackers = OrderedDict()
+_trackers_lock = threading.Lock()
+
+
+class TripTracker:
+    """
+    Fuel plan of a trip that follows the truck along its route.
+
+    The route projection and the stations of its corridor, with their
+    offsets along the route, are prepared once; each `update` projects the
+    reported position onto the route and replans only what lies ahead. The
+    plan after a stop depends on that stop alone, so when the next stop is
+    unchanged the rest of the previous plan is kept as it is.
+    """
+
+    def __init__(self, trip_id, projection, options, average_mph=None, offset=0.0):
+        self.trip_id = trip_id
+        self.projection = projection
+        self.average_mph = average_mph
+        self.offset = offset
+        self.max_range = options.get("max_range", DEFAULT_MAX_RANGE)
+        self.mpg = options.get("mpg", DEFAULT_MPG)
+        self.tank_gallons = self.max_range / self.mpg
+        detour_cost = options.get("detour_cost_per_mile")
+        self.detour_cost_micros = (
+            DEFAULT_DETOUR_COST_PER_MILE_MICROS if detour_cost is None else to_micros(detour_cost)
+        )
+        self.product = options.get("product", StationPrice.DIESEL)
+        self.program = options.get("program", StationPrice.RETAIL)
+        self.snapshot = None
+        self.plan = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_trip(cls, trip):
+        return cls(
+            trip.pk, RouteProjection(decode_polyline(trip.polyline)), trip.options,
+            average_mph=trip.average_mph, offset=trip.offset_miles,
+        )
+
+    def _load_corridor(self, snapshot):
+        """Stations within CORRIDOR_MILES of the route, in route order."""
+        projection = self.projection
+        prices = snapshot.prices_for(self.product, self.program)
+
+        # Sample the route every CORRIDOR_MILES along its length, however
+        # finely its polyline is subdivided; every point of the corridor lies
+        # within 1.5 CORRIDOR_MILES of a sample.
+        samples = [(projection.latitudes[-1], projection.longitudes[-1])]
+        next_sample = 0.0
+        for index in range(len(projection.offsets) - 1):
+            start, end = projection.offsets[index], projection.offsets[index + 1]
+            lat_a, lng_a = projection.latitudes[index], projection.longitudes[index]
+            lat_b, lng_b = projection.latitudes[index + 1], projection.longitudes[index + 1]
+            while next_sample <= end:
+                fraction = (next_sample - start) / (end - start) if end > start else 0.0
+                samples.append((lat_a + (lat_b - lat_a) * fraction, lng_a + (lng_b - lng_a) * fraction))
+                next_sample += CORRIDOR_MILES
+
+        indexes = set()
+        for lat, lng in samples:
+            indexes.update(
+                station for station, _ in snapshot.within(lat, lng, 1.5 * CORRIDOR_MILES)
+                if prices[station] != NO_PRICE
+            )
+
+        indexes = sorted(indexes)
+        offsets, distances = projection.project(
+            [snapshot.latitudes[index] for index in indexes], [snapshot.longitudes[index] for index in indexes],
+        )
+        corridor = sorted(
+            (offset, distance, index) for index, offset, distance in zip(indexes, offsets, distances)
+            if distance <= CORRIDOR_MILES
+        )
+        self.snapshot = snapshot
+        self.prices = prices
+        self.offsets = [offset for offset, _, _ in corridor]
+        self.distances = [distance for _, distance, _ in corridor]
+        self.indexes = [index for _, _, index in corridor]
+        self.plan = []
+
+    def locate(self, lat, lng):
+        """`(offset, off_route_miles)` of a position, searched near the previous one first."""
+        segments = self.projection.segments_between(
+            self.offset - PING_WINDOW_BEHIND_MILES, self.offset + PING_WINDOW_AHEAD_MILES,
+        )
+        offsets, distances = self.projection.project([lat], [lng], segments)
+        if distances[0] > OFF_ROUTE_MILES:
+            offsets, distances = self.projection.project([lat], [lng])
+        return offsets[0], distances[0]
+
+    def _next_stop(self, position, range_miles):
+        """
+        Best corridor station to refuel at from `position` with `range_miles`
+        of fuel left, as `(candidate, gallons, cost_micros)`. Stations within
+        DEFAULT_SEARCH_RADIUS_MILES of running dry are preferred, like the
+        full planner refuels around the point the tank runs out; earlier ones
+        are only considered when none of those can be reached. Returns None
+        when no station can be reached.
+        """
+        reach = position + range_miles
+        first = bisect.bisect_right(self.offsets, position)
+        last = bisect.bisect_right(self.offsets, reach)
+        preferred = max(first, bisect.bisect_left(self.offsets, reach - DEFAULT_SEARCH_RADIUS_MILES))
+
+        for candidates in (range(preferred, last), range(first, preferred)):
+            best = None
+            for candidate in candidates:
+                distance = self.distances[candidate]
+                miles_left = range_miles - (self.offsets[candidate] - position) - distance
+                if miles_left < 0:
+                    continue
+                gallons = self.tank_gallons - miles_left / self.mpg
+                cost_micros = fuel_cost_micros(self.prices[self.indexes[candidate]], gallons)
+                score = cost_micros + int(2 * distance * self.detour_cost_micros)
+                if best is None or score < best[0]:
+                    best = score, candidate, gallons, cost_micros
+            if best is not None:
+                return best[1:]
+        return None
+
+    def _plan_from(self, position, range_miles):
+        """Stops from `position` to the destination; False at the end if it cannot be reached."""
+        plan = []
+        while position + range_miles < self.projection.length:
+            stop = self._next_stop(position, range_miles)
+            if stop is None:
+                return plan, False
+            plan.append(stop)
+            candidate = stop[0]
+            position, range_miles = self.offsets[candidate], self.max_range - self.distances[candidate]
+        return plan, True
+
+    def update(self, lat, lng, fuel_gallons):
+        """
+        Replan from a reported position and fuel level. Returns a dict with
+        the position along the route, the distance and (when the route's
+        duration is known) time to an empty tank and the remaining stops.
+        """
+        with self._lock:
+            return self._update(lat, lng, fuel_gallons)
+
+    def _update(self, lat, lng, fuel_gallons):
+        snapshot = get_station_snapshot()
+        if snapshot is not self.snapshot:
+            self._load_corridor(snapshot)
+
+        offset, off_route = self.locate(lat, lng)
+        self.offset = offset
+        # Fuel spent getting back onto the route is not available ahead.
+        range_miles = max(0.0, fuel_gallons * self.mpg - off_route)
+
+        reachable = True
+        if offset + range_miles >= self.projection.length:
+            self.plan = []
+        else:
+            stop = self._next_stop(offset, range_miles)
+            if stop is None:
+                self.plan, reachable = [], False
+            elif self.plan and self.plan[0][0] == stop[0]:
+                self.plan = [stop] + self.plan[1:]
+            else:
+                rest, reachable = self._plan_from(
+                    self.offsets[stop[0]], self.max_range - self.distances[stop[0]],
+                )
+                self.plan = [stop] + rest
+
+        return {
+            "offset_miles": offset,
+            "off_route_miles": off_route,
+            "remaining_miles": max(0.0, self.projection.length - offset),
+            "miles_to_empty": range_miles,
+            "minutes_to_empty": range_miles / self.average_mph * 60 if self.average_mph else None,
+            "reachable": reachable,
+            "stops": [self._stop(candidate, gallons, cost_micros) for candidate, gallons, cost_micros in self.plan],
+        }
+
+    def _stop(self, candidate, gallons, cost_micros):
+        index = self.indexes[candidate]
+        station = self.snapshot.station(index)
+        return {
+            "truckstop_name": station["truckstop_name"],
+            "city": station["city"],
+            "state": station["state"],
+            "latitude": station["latitude"],
+            "longitude": station["longitude"],
+            "miles_ahead": self.offsets[candidate] - self.offset,
+            "detour_miles": 2 * self.distances[candidate],
+            "gallons": gallons,
+            "retail_price_micros": self.prices[index],
+            "cost_micros": cost_micros,
+        }
+
+
+def get_tracker(trip):
+    """The process's tracker of `trip` (a Trip or its primary key), loading it on first use."""
+    trip_id = getattr(trip, "pk", trip)
+    with _trackers_lock:
+        tracker = _trackers.get(trip_id)
+        if tracker is not None:
+            _trackers.move_to_end(trip_id)
+            return tracker
+
+    if not isinstance(trip, Trip):
+        trip = Trip.objects.get(pk=trip_id)
+    tracker = TripTracker.from_trip(trip)
+    with _trackers_lock:
+        tracker = _trackers.setdefault(trip_id, tracker)
+        while len(_trackers) > MAX_TRACKED_TRIPS:
+            _trackers.popitem(last=False)
+    return tracker
+
+
+def _average_mph(route):
+    seconds = meters = 0
+    for leg in route["routes"][0]["legs"]:
+        for step in leg["steps"]:
+            if "duration" not in step:
+                return None
+            seconds += step["duration"]["value"]
+            meters += step["distance"]["value"]
+    if not seconds:
+        return None
+    return meters / METERS_PER_MILE / (seconds / 3600)
+
+
+def parse_fuel(data, tank_gallons):
+    """
+    Fuel level of a request in gallons, given either as `fuel_gallons` or
+    as a `fuel_level` fraction of the tank; None if it has neither. Raises
+    ValueError.
+    """
+    try:
+        if data.get("fuel_gallons") not in (None, ""):
+            fuel_gallons = float(data["fuel_gallons"])
+        elif data.get("fuel_level") not in (None, ""):
+            fuel_gallons = float(data["fuel_level"]) * tank_gallons
+        else:
+            return None
+    except (TypeError, ValueError):
+        fuel_gallons = -1
+    if not 0 <= fuel_gallons <= tank_gallons:
+        raise ValueError(f"fuel must be between empty and a full tank of {tank_gallons:g} gallons.")
+    return fuel_gallons
+
+
+def parse_trip_request(data):
+    """
+    Validated `(addresses, options, fuel_gallons)` of a new trip: the
+    route's addresses, the planning options and the fuel at the start (None
+    for a full tank). Raises ValueError with a client message.
+    """
+    start_address = data.get("start_address")
+    finish_address = data.get("finish_address")
+    if not start_address or not finish_address:
+        raise ValueError("Start and finish addresses are required.")
+    options = {**parse_plan_options(data), **parse_price_options(data)}
+    tank_gallons = options.get("max_range", DEFAULT_MAX_RANGE) / options.get("mpg", DEFAULT_MPG)
+    return [start_address, *parse_waypoints(data), finish_address], options, parse_fuel(data, tank_gallons)
+
+
+def parse_position(data, tank_gallons):
+    """`(lat, lng, fuel_gallons)` of a position report. Raises ValueError."""
+    try:
+        lat, lng = float(data["latitude"]), float(data["longitude"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("latitude and longitude are required numbers.")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("latitude and longitude must be valid coordinates.")
+    fuel_gallons = parse_fuel(data, tank_gallons)
+    if fuel_gallons is None:
+        raise ValueError("fuel_gallons or fuel_level is required.")
+    return lat, lng, fuel_gallons
+
+
+def create_trip(addresses, options):
+    """
+    Fetch the route through `addresses` once and store it with the trip; the
+    position updates that follow never call the Directions API again.
+    """
+    route = get_cached_trip_route(addresses)
+    projection = RouteProjection.from_route(route)
+    if projection is None:
+        raise ValueError("The route between these addresses has no steps.")
+    return Trip.objects.create(
+        addresses=addresses,
+        options=options,
+        # The route's full geometry, as `from_route` projects it.
+        polyline=encode_polyline(zip(projection.latitudes, projection.longitudes)),
+        average_mph=_average_mph(route),
+    )
+
+
+def update_trip(trip, lat, lng, fuel_gallons):
+    """
+    Replan `trip` (a Trip or its primary key) from a position report and
+    store the result on it, in a single UPDATE once the trip is tracked.
+    """
+    update = get_tracker(trip).update(lat, lng, fuel_gallons)
+    Trip.objects.filter(pk=getattr(trip, "pk", trip)).update(
+        latitude=lat, longitude=lng, offset_miles=update["offset_miles"], fuel_gallons=fuel_gallons,
+        fuel_stops=update["stops"], updated_at=timezone.now(),
+    )
+    return update
@@ -1,6 +1,18 @@
 from django.urls import path
-from .views import RouteFuelStopsAPIView
+from .views import (
+    PlanJobDetailAPIView, PlanJobListAPIView, PlanJobResultsView, PriceTileAPIView, RouteFuelStopsAPIView,
+    StationListAPIView, TripDetailAPIView, TripListAPIView, TripPositionAPIView,
+)
 
 urlpatterns = [
     path("route-fuel-stops/", RouteFuelStopsAPIView.as_view(), name="route_fuel_stops"),
+    path("stations/", StationListAPIView.as_view(), name="stations"),
+    path("price-tiles/<int:precision>/", PriceTileAPIView.as_view(), name="price_tiles"),
+    path("price-tiles/<int:precision>/<str:tile>/", PriceTileAPIView.as_view(), name="price_tile"),
+    path("plan-jobs/", PlanJobListAPIView.as_view(), name="plan_jobs"),
+    path("plan-jobs/<int:pk>/", PlanJobDetailAPIView.as_view(), name="plan_job"),
+    path("plan-jobs/<int:pk>/results/", PlanJobResultsView.as_view(), name="plan_job_results"),
+    path("trips/", TripListAPIView.as_view(), name="trips"),
+    path("trips/<int:pk>/", TripDetailAPIView.as_view(), name="trip"),
+    path("trips/<int:pk>/position/", TripPositionAPIView.as_view(), name="trip_position"),
 ]
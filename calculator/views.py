@@ -1,20 +1,264 @@
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .utils import get_route, calculate_fuel_stops
+from .jobs import submit_plan_job
+from .models import PlanJob, Trip
+from .ratelimit import UpstreamQuotaExceeded
+from .renderers import BinaryRenderer, FastJSONRenderer
+from .resilience import CircuitOpenError, DeadlineExceeded, request_deadline, request_exception
+from .responses import (
+    alternatives_response_key, lane_response_key, parse_route_request, response_cache_key, route_response_body,
+)
+from .serializers import (
+    PlanJobSerializer, serialize_price_tile, serialize_stations, serialize_trip, serialize_trip_update,
+)
+from .snapshot import get_dataset_version, get_station_snapshot
+from .stations import parse_station_query, station_page
+from .throttling import APIKeyRateThrottle, PlanJobRateThrottle
+from .tiles import encode_price_tile, parse_tile, price_tile
+from .tracking import create_trip, get_tracker, parse_position, parse_trip_request, update_trip
+
+DEFAULT_REQUEST_DEADLINE = 10
+DEFAULT_PRICE_TILE_MAX_AGE = 24 * 60 * 60
+
 
 class RouteFuelStopsAPIView(APIView):
-    def post(self, request):
-        start_address = request.data.get("start_address")
-        finish_address = request.data.get("finish_address")
+    renderer_classes = [FastJSONRenderer]
+    throttle_classes = [APIKeyRateThrottle]
+
+    def response_key(self, request):
+        """Response cache key of the request, or None if it is invalid."""
+        try:
+            arguments = parse_route_request(request.data)
+        except ValueError:
+            return None
+        if arguments.pop("alternatives", False):
+            return alternatives_response_key(**arguments)
+        return lane_response_key(**arguments)
+
+    def check_throttles(self, request):
+        # Requests answered from the response cache never reach the upstream
+        # APIs, so they bypass the rate limits entirely.
+        key = self.response_key(request)
+        if key is not None and cache.get(response_cache_key(key)) is not None:
+            return
+        super().check_throttles(request)
 
-        if not start_address or not finish_address:
-            return Response({"error": "Start and finish addresses are required."}, status=status.HTTP_400_BAD_REQUEST)
+    def post(self, request):
+        try:
+            arguments = parse_route_request(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            route = get_route(start_address, finish_address)
-            fuel_stops, total_cost = calculate_fuel_stops(route)
-            print(fuel_stops)
-            return Response({"fuel_stops": fuel_stops, "total_cost": total_cost}, status=status.HTTP_200_OK)
+            with request_deadline(getattr(settings, "REQUEST_DEADLINE", DEFAULT_REQUEST_DEADLINE)):
+                body = route_response_body(arguments)
+            return Response(body, status=status.HTTP_200_OK)
+        except (UpstreamQuotaExceeded, CircuitOpenError) as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except (DeadlineExceeded, request_exception("Timeout")) as e:
+            return Response({"error": str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        except request_exception() as e:
+            return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class PlanJobListAPIView(APIView):
+    throttle_classes = [PlanJobRateThrottle]
+
+    def post(self, request):
+        lanes = request.data.get("lanes")
+        if not isinstance(lanes, list) or not lanes:
+            return Response({"error": "lanes must be a non-empty list of route requests."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            job = submit_plan_job(lanes)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = PlanJobSerializer(job).data
+        data["url"] = request.build_absolute_uri(reverse("plan_job", args=[job.pk]))
+        data["results_url"] = request.build_absolute_uri(reverse("plan_job_results", args=[job.pk]))
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+class PlanJobDetailAPIView(APIView):
+    def get(self, request, pk):
+        job = get_object_or_404(PlanJob, pk=pk)
+        return Response(PlanJobSerializer(job).data)
+
+
+class PlanJobResultsView(APIView):
+    def get(self, request, pk):
+        """Stream the stored lane results as newline-delimited JSON."""
+        job = get_object_or_404(PlanJob, pk=pk)
+
+        def lines():
+            for position, result, error in job.results.values_list("position", "result", "error").iterator():
+                row = {"position": position, "result": result}
+                if error:
+                    row["error"] = error
+                yield json.dumps(row) + "\n"
+
+        response = StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+        response["X-Job-Status"] = job.status
+        return response
+
+
+def _stations_etag(request):
+    return get_station_snapshot().version
+
+
+def _stations_last_modified(request):
+    return get_station_snapshot().last_modified
+
+
+class StationListAPIView(APIView):
+    renderer_classes = [FastJSONRenderer]
+
+    @method_decorator(condition(etag_func=_stations_etag, last_modified_func=_stations_last_modified))
+    def get(self, request):
+        """
+        Geocoded stations from the in-memory snapshot, cheapest first, with
+        keyset pagination. Pages are revalidated against the snapshot
+        version, so unchanged data is answered with 304 Not Modified.
+        """
+        try:
+            query = parse_station_query(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        snapshot = get_station_snapshot()
+        indexes, cursor = station_page(snapshot, **query)
+        next_url = None
+        if cursor is not None:
+            params = request.query_params.copy()
+            params["cursor"] = cursor
+            next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+        response = Response({"results": serialize_stations(snapshot, indexes), "next": next_url})
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+def _price_tile_etag(request, precision, tile=""):
+    dataset = get_dataset_version()
+    if dataset is None:
+        return None
+    # Each representation of a tile needs its own entity tag.
+    return f"{dataset[0]}-{request.accepted_renderer.format}"
+
+
+def _price_tile_last_modified(request, precision, tile=""):
+    dataset = get_dataset_version()
+    return dataset[1] if dataset else None
+
+
+class PriceTileAPIView(APIView):
+    renderer_classes = [FastJSONRenderer, BinaryRenderer]
+
+    @method_decorator(condition(etag_func=_price_tile_etag, last_modified_func=_price_tile_last_modified))
+    def get(self, request, precision, tile=""):
+        """
+        Precomputed price aggregates of the geohash cells of `precision`
+        inside `tile`, as JSON or (format=bin) packed binary records.
+        """
+        try:
+            precision, prefix = parse_tile(precision, tile)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cells = price_tile(precision, prefix)
+        if request.accepted_renderer.format == BinaryRenderer.format:
+            body = encode_price_tile(precision, cells)
+        else:
+            body = serialize_price_tile(precision, prefix, cells)
+
+        response = Response(body)
+        patch_cache_control(
+            response, public=True, max_age=getattr(settings, "PRICE_TILE_MAX_AGE", DEFAULT_PRICE_TILE_MAX_AGE),
+        )
+        patch_vary_headers(response, ["Accept"])
+        return response
+
+
+class TripListAPIView(APIView):
+    renderer_classes = [FastJSONRenderer]
+    throttle_classes = [APIKeyRateThrottle]
+
+    def post(self, request):
+        """
+        Start tracking a trip: fetch its route once and return the plan from
+        the start with the given fuel (a full tank by default).
+        """
+        try:
+            addresses, options, fuel_gallons = parse_trip_request(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with request_deadline(getattr(settings, "REQUEST_DEADLINE", DEFAULT_REQUEST_DEADLINE)):
+                trip = create_trip(addresses, options)
+            tracker = get_tracker(trip)
+            projection = tracker.projection
+            update = update_trip(
+                trip, projection.latitudes[0], projection.longitudes[0],
+                tracker.tank_gallons if fuel_gallons is None else fuel_gallons,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (UpstreamQuotaExceeded, CircuitOpenError) as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except (DeadlineExceeded, request_exception("Timeout")) as e:
+            return Response({"error": str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        except request_exception() as e:
+            return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+
+        body = serialize_trip_update(trip.pk, update)
+        body["url"] = request.build_absolute_uri(reverse("trip", args=[trip.pk]))
+        body["position_url"] = request.build_absolute_uri(reverse("trip_position", args=[trip.pk]))
+        return Response(body, status=status.HTTP_201_CREATED)
+
+
+class TripDetailAPIView(APIView):
+    renderer_classes = [FastJSONRenderer]
+
+    def get(self, request, pk):
+        return Response(serialize_trip(get_object_or_404(Trip, pk=pk)))
+
+
+class TripPositionAPIView(APIView):
+    renderer_classes = [FastJSONRenderer]
+
+    def post(self, request, pk):
+        """
+        Report the truck's position and fuel level; returns the next stop and
+        the rest of the plan from there. The route is not fetched again.
+        """
+        try:
+            tracker = get_tracker(pk)
+        except Trip.DoesNotExist:
+            return Response({"error": "Trip not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            lat, lng, fuel_gallons = parse_position(request.data, tracker.tank_gallons)
+            update = update_trip(pk, lat, lng, fuel_gallons)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serialize_trip_update(pk, update))
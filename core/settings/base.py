@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'calculator.middleware.CompressionMiddleware',
+    'calculator.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -143,3 +145,145 @@ STATICFILES_DIRS = (
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Cache
+# Routes, plans, responses and client throttle counters are shared by every
+# worker process through this cache, so it must not be process-local. The
+# default is a directory on local disk, which serves every process of a
+# single host without touching the database; set CACHE_BACKEND/CACHE_LOCATION
+# to a memcached server when several hosts serve the API. (The outbound
+# Google budget is not cached: see UPSTREAM_RATE_PROCESSES below.)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR.parent, '.cache', 'calculator')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+        },
+    }
+}
+
+
+# Logging
+# Background failures (snapshot reloads, route refreshes, upstream fallbacks)
+# are logged by the calculator loggers to the console.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'calculator': {
+            'handlers': ['console'],
+            'level': os.getenv('CALCULATOR_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+
+# Route caching
+# Directions results are served fresh for ROUTE_CACHE_TTL seconds, then served
+# stale for up to ROUTE_CACHE_STALE_TTL seconds while a background refresh runs.
+
+ROUTE_CACHE_TTL = int(os.getenv('ROUTE_CACHE_TTL', 6 * 60 * 60))
+ROUTE_CACHE_STALE_TTL = int(os.getenv('ROUTE_CACHE_STALE_TTL', 7 * 24 * 60 * 60))
+ROUTE_REFRESH_WORKERS = int(os.getenv('ROUTE_REFRESH_WORKERS', 4))
+
+# Identical concurrent plan requests share one computation. Set
+# ROUTE_COALESCE_LOCK to "file" or "advisory" to coalesce across processes;
+# a request waits for that lock at most until its deadline (LOCK_TIMEOUT
+# seconds outside a request) and then plans on its own.
+PLAN_SHARE_TTL = int(os.getenv('PLAN_SHARE_TTL', 30))
+ROUTE_COALESCE_LOCK = os.getenv('ROUTE_COALESCE_LOCK') or None
+LOCK_TIMEOUT = float(os.getenv('LOCK_TIMEOUT', 30))
+
+# Plans of the legs of multi-stop trips, keyed by the leg's route, the fuel
+# state it starts with and the station snapshot, are kept for LEG_PLAN_TTL
+# seconds so changing one waypoint only replans the legs it affects.
+LEG_PLAN_TTL = int(os.getenv('LEG_PLAN_TTL', 6 * 60 * 60))
+
+# Workers check the fuel price dataset version every SNAPSHOT_POLL_INTERVAL
+# seconds (0 disables polling) and rebuild their station snapshot in the
+# background when it changed. With SNAPSHOT_NOTIFY on PostgreSQL they also
+# LISTEN for changes and reload immediately.
+SNAPSHOT_POLL_INTERVAL = float(os.getenv('SNAPSHOT_POLL_INTERVAL', 5))
+SNAPSHOT_NOTIFY = os.getenv('SNAPSHOT_NOTIFY', '').lower() in ('1', 'true', 'yes')
+
+# Plan jobs plan in PLANNING_PROCESSES processes (0 plans in threads). They
+# map the station snapshot from a file written to SNAPSHOT_EXPORT_DIR
+# (default: a directory in the system temp dir).
+PLANNING_PROCESSES = int(os.getenv('PLANNING_PROCESSES', 0))
+SNAPSHOT_EXPORT_DIR = os.getenv('SNAPSHOT_EXPORT_DIR') or None
+
+# Lanes accepted in one plan job (more are rejected with a 400).
+MAX_PLAN_JOB_LANES = int(os.getenv('MAX_PLAN_JOB_LANES', 1000))
+
+# Encoded route-fuel-stops responses are reused for this many seconds.
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+
+# Clients may cache price tiles for this many seconds before revalidating.
+PRICE_TILE_MAX_AGE = int(os.getenv('PRICE_TILE_MAX_AGE', 24 * 60 * 60))
+
+# Offline geocoding for imports. GAZETTEER_CITIES_PATH is a GeoNames cities
+# file; GAZETTEER_EXITS_PATH a CSV of highway,exit,state,latitude,longitude.
+GAZETTEER_CITIES_PATH = os.getenv('GAZETTEER_CITIES_PATH')
+GAZETTEER_EXITS_PATH = os.getenv('GAZETTEER_EXITS_PATH')
+
+# OPIS fuel price export imported by `manage.py import_fuel_prices`.
+FUEL_PRICES_CSV = os.getenv(
+    'FUEL_PRICES_CSV', os.path.join(BASE_DIR.parent, 'auto_entry', 'fuel-prices-for-be-assessment.csv')
+)
+
+# Admission control. Clients presenting one of the comma-separated API_KEYS
+# in X-API-Key are throttled per key, everyone else per IP. Outbound Google
+# calls take tokens from a per-process bucket of (requests/second, burst);
+# both are divided by UPSTREAM_RATE_PROCESSES (the number of worker processes,
+# WEB_CONCURRENCY by default) so the whole deployment stays within the
+# configured budget. Directions calls queue for at most
+# UPSTREAM_QUEUE_TIMEOUT seconds.
+API_KEYS = {key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip()}
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_RATES': {
+        'route_fuel_stops': os.getenv('ROUTE_FUEL_STOPS_RATE', '60/min'),
+        'plan_jobs': os.getenv('PLAN_JOBS_RATE', '10/min'),
+    },
+}
+
+UPSTREAM_RATE_LIMITS = {
+    'directions': (float(os.getenv('DIRECTIONS_RATE', 10)), int(os.getenv('DIRECTIONS_BURST', 20))),
+    'geocoding': (float(os.getenv('GEOCODING_RATE', 10)), int(os.getenv('GEOCODING_BURST', 20))),
+}
+UPSTREAM_RATE_PROCESSES = int(os.getenv('UPSTREAM_RATE_PROCESSES', os.getenv('WEB_CONCURRENCY', 1)))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', 2))
+
+# Resilience of outbound Google calls. Each call times out after
+# UPSTREAM_TIMEOUT seconds or whatever remains of the REQUEST_DEADLINE; after
+# CIRCUIT_BREAKER_FAILURES consecutive failures calls fail fast for
+# CIRCUIT_BREAKER_RESET seconds and the last cached route is served instead.
+DIRECTIONS_API_URL = os.getenv('DIRECTIONS_API_URL', 'https://maps.googleapis.com/maps/api/directions/json')
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', 5))
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 10))
+CIRCUIT_BREAKER_FAILURES = int(os.getenv('CIRCUIT_BREAKER_FAILURES', 5))
+CIRCUIT_BREAKER_RESET = float(os.getenv('CIRCUIT_BREAKER_RESET', 30))
+ROUTE_FALLBACK_TTL = int(os.getenv('ROUTE_FALLBACK_TTL', 30 * 24 * 60 * 60))
+
+# Record/replay of the Google APIs for offline tests and benchmarks. In
+# "record" mode live responses are saved to UPSTREAM_REPLAY_DIR; in "replay"
+# mode they are served from there after UPSTREAM_REPLAY_LATENCY seconds (or
+# "recorded" for the original timing), failing UPSTREAM_REPLAY_FAILURE_RATE
+# of the calls.
+UPSTREAM_REPLAY_MODE = os.getenv('UPSTREAM_REPLAY_MODE', 'off')
+UPSTREAM_REPLAY_DIR = os.getenv(
+    'UPSTREAM_REPLAY_DIR', os.path.join(BASE_DIR.parent, 'calculator', 'fixtures', 'upstream')
+)
+UPSTREAM_REPLAY_LATENCY = os.getenv('UPSTREAM_REPLAY_LATENCY', '')
+UPSTREAM_REPLAY_FAILURE_RATE = float(os.getenv('UPSTREAM_REPLAY_FAILURE_RATE', 0))
+UPSTREAM_REPLAY_SEED = os.getenv('UPSTREAM_REPLAY_SEED')
+
+# Report per-request DB query and cache counters in an X-Request-Metrics
+# response header (used by `manage.py load_test`).
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', '').lower() in ('1', 'true', 'yes')